@@ -0,0 +1,72 @@
+import argparse
+import sys
+
+from benchmarks import (
+    burst,
+    command_drain,
+    command_latency,
+    compare,
+    connect_storm,
+    load,
+    reconnect_storm,
+    reorder,
+    serialization,
+    soak,
+    status_latency,
+    sweep,
+)
+
+
+_SCENARIOS = {
+    "load": (load, "Drive a simulated fleet with increasing status rates until the server saturates."),
+    "status_latency": (status_latency, "Measure latency of statuses from the module gateway to the HTTP API."),
+    "command_latency": (
+        command_latency,
+        "Measure latency of commands from the HTTP API to the module gateway with increasing load.",
+    ),
+    "command_drain": (
+        command_drain,
+        "Queue a large backlog of commands for disconnected cars and measure how fast it drains after they connect.",
+    ),
+    "burst": (burst, "Publish pre-serialized statuses back-to-back and measure the server's per-status cost."),
+    "connect_storm": (
+        connect_storm,
+        "Connect a fleet of cars at once and measure the time until all of them are connected.",
+    ),
+    "reconnect_storm": (
+        reconnect_storm,
+        "Restart the broker under a connected fleet and measure the reconnect of the cars and the command flush.",
+    ),
+    "reorder": (
+        reorder,
+        "Stream statuses with injected reordering, duplicates and gaps and measure the server's reorder buffer.",
+    ),
+    "serialization": (
+        serialization,
+        "Compare serialization of statuses and command responses by protobuf and from cached templates.",
+    ),
+    "soak": (
+        soak,
+        "Cycle a fleet through connects, traffic and disconnects for hours and check the resource and latency trends.",
+    ),
+    "sweep": (
+        sweep,
+        "Run a load scenario against variants of the module rate limits and timeouts of the External Server.",
+    ),
+    "compare": (compare, "Compare performance of a baseline and a candidate External Server image."),
+}
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+    for name, (module, description) in _SCENARIOS.items():
+        subparser = subparsers.add_parser(name, help=description, description=description)
+        module.add_arguments(subparser)
+        subparser.set_defaults(run=module.run)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    sys.exit(args.run(args))
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import time
+
+from tests._utils.resources import ResourceSampler
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    car_names,
+    fleet_devices,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway, fleet_gateways
+from benchmarks.report import Metric, print_table, write_json
+
+
+_POLL = 0.01
+_EXTERNAL_SERVER = "external-server"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=10, help="Number of simulated cars.")
+    parser.add_argument("--devices", type=int, default=2, help="Number of devices per car.")
+    parser.add_argument("--statuses", type=int, default=5000, help="Number of statuses sent by each car.")
+    parser.add_argument("--payload-size", type=int, default=64, help="Approximate size of status data in bytes.")
+    parser.add_argument(
+        "--timeout", type=float, default=60.0, help="Time to wait for the status responses to all the statuses."
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--publishers", type=int, default=4, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "burst", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        gateways = fleet_gateways(comm_layer, COMPANY, car_names(args.cars), fleet_devices(args.devices))
+        result = asyncio.run(_run(gateways, sampler, args))
+    return result | resource_series(sampler)
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [
+        Metric("accepted statuses/s", result["accepted_status_rate"], higher_is_better=True),
+        Metric("External Server CPU per status (us)", result["server_cpu_per_status_us"]),
+    ]
+
+
+async def _run(gateways: list[SimulatedGateway], sampler: ResourceSampler | None, args: argparse.Namespace) -> dict:
+    for gateway in gateways:
+        gateway.attach()
+    try:
+        await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways))
+        payload = {"data": "x" * args.payload_size}
+        build_started = time.perf_counter()
+        batches = [g.status_batch(args.statuses, payload) for g in gateways]
+        build_time = time.perf_counter() - build_started
+
+        accepted_before = sum(g.statuses_accepted for g in gateways)
+        cpu_before = _server_cpu_seconds(sampler)
+        started = time.monotonic()
+        for gateway, batch in zip(gateways, batches):
+            gateway.send_batch(batch)
+        published = time.monotonic()
+        expected = sum(len(b) for b in batches)
+        while (accepted := sum(g.statuses_accepted for g in gateways) - accepted_before) < expected:
+            if time.monotonic() - started > args.timeout:
+                print(f"Only {accepted} of {expected} statuses accepted within {args.timeout} s.")
+                break
+            await asyncio.sleep(_POLL)
+        duration = time.monotonic() - started
+        if sampler is not None:
+            # let the sampler catch up with the end of the burst
+            await asyncio.sleep(sampler.interval)
+        cpu_after = _server_cpu_seconds(sampler)
+    finally:
+        for gateway in gateways:
+            gateway.detach()
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {
+        "cars": args.cars,
+        "devices_per_car": args.devices,
+        "statuses_sent": expected,
+        "statuses_accepted": accepted,
+        "bytes_sent": sum(b.size for b in batches),
+        "build_time_per_status_us": build_time / expected * 1e6,
+        "publish_time_s": published - started,
+        "duration_s": duration,
+        "accepted_status_rate": accepted / duration,
+        "server_time_per_status_us": duration / accepted * 1e6 if accepted else None,
+        "server_cpu_per_status_us": cpu / accepted * 1e6 if cpu is not None and accepted else None,
+    }
+
+
+def _server_cpu_seconds(sampler: ResourceSampler | None) -> float | None:
+    return None if sampler is None else sampler.latest(_EXTERNAL_SERVER, "cpu_seconds")
+
+
+def _print(result: dict) -> None:
+    print_table(
+        (
+            "statuses",
+            "accepted",
+            "build us/st",
+            "publish s",
+            "duration s",
+            "accepted st/s",
+            "server us/st",
+            "CPU us/st",
+        ),
+        [
+            (
+                result["statuses_sent"],
+                result["statuses_accepted"],
+                result["build_time_per_status_us"],
+                result["publish_time_s"],
+                result["duration_s"],
+                result["accepted_status_rate"],
+                result["server_time_per_status_us"],
+                result["server_cpu_per_status_us"],
+            )
+        ],
+    )
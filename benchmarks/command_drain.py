@@ -0,0 +1,298 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import statistics
+import threading
+import time
+
+from paho.mqtt.client import MQTTMessage as _MQTTMessage
+
+from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.external_client import ExternalClientMock
+from tests._utils.messages import _ExternalServerMsg, api_command
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    api_client,
+    car_names,
+    fleet_device_ids,
+    fleet_devices,
+    load_config,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway
+from benchmarks.report import Metric, print_table, write_json
+
+
+_API_WORKERS = 8
+_POLL = 0.05
+_RATE_LIMIT_KEYS = (
+    "max_requests_threshold_count",
+    "max_requests_threshold_period_ms",
+    "delay_after_threshold_reached_ms",
+    "retry_requests_delay_ms",
+)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=1, help="Number of simulated cars.")
+    parser.add_argument(
+        "--commands", type=int, default=10_000, help="Number of commands queued for every car."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Number of commands posted to the HTTP API by a single request.",
+    )
+    parser.add_argument(
+        "--burst-gap",
+        type=float,
+        default=0.05,
+        help="Pause between commands (in seconds) separating the bursts of the drain.",
+    )
+    parser.add_argument(
+        "--drain-timeout", type=float, default=300.0, help="Time to wait for the drain to finish."
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--publishers", type=int, default=2, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "command_drain", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    devices = fleet_devices(1)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        clients = [ExternalClientMock(comm_layer, COMPANY, car) for car in car_names(args.cars)]
+        gateways = [SimulatedGateway(client, devices) for client in clients]
+        load_time = _queue_commands(api_client(), [g.car for g in gateways], args)
+        probe = DrainProbe(clients)
+        try:
+            result = asyncio.run(_run(gateways, probe, args))
+        finally:
+            probe.close()
+    module_config = load_config(config_name)["common_modules"][str(devices[0].module)]["config"]
+    return (
+        {
+            "cars": args.cars,
+            "commands_per_car": args.commands,
+            "load_time_s": load_time,
+            "rate_limits": {key: _number(module_config.get(key)) for key in _RATE_LIMIT_KEYS},
+        }
+        | result
+        | _against_rate_limits(result, module_config)
+        | resource_series(sampler)
+    )
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [
+        Metric("time to drain (s)", result["time_to_drain_s"]),
+        Metric("drain rate (commands/s)", result["drain_rate"], higher_is_better=True),
+    ]
+
+
+class DrainProbe:
+    """Record every command received by the cars together with its message counter and sequence number.
+
+    The commands are recorded from the communication layer's thread, including the commands
+    of the connect sequence. Commands without a sequence number in their data are ignored.
+    """
+
+    def __init__(self, clients: list[ExternalClientMock]) -> None:
+        self._lock = threading.Lock()
+        self._received: dict[str, list[tuple[float, int, int]]] = {client.car: [] for client in clients}
+        self._unique: set[tuple[str, int]] = set()
+        self._listeners = [(client, functools.partial(self._on_message, client.car)) for client in clients]
+        for client, listener in self._listeners:
+            client.add_listener(listener)
+
+    @property
+    def received(self) -> int:
+        """Number of distinct commands received, not counting the duplicates."""
+        return len(self._unique)
+
+    def arrivals(self) -> dict[str, list[tuple[float, int, int]]]:
+        """Return the arrival time, message counter and sequence number of the commands of every car."""
+        with self._lock:
+            return {car: list(r) for car, r in self._received.items()}
+
+    def close(self) -> None:
+        for client, listener in self._listeners:
+            client.remove_listener(listener)
+
+    def _on_message(self, car: str, message: _MQTTMessage) -> None:
+        received_at = time.monotonic()
+        msg = _ExternalServerMsg.FromString(message.payload)
+        if not msg.HasField("command"):
+            return
+        try:
+            seq = json.loads(msg.command.deviceCommand.commandData).get("seq")
+        except (ValueError, AttributeError):
+            return
+        if seq is None:
+            return
+        with self._lock:
+            self._received[car].append((received_at, msg.command.messageCounter, seq))
+            self._unique.add((car, seq))
+
+
+def _queue_commands(api: ApiClientMock, cars: list[str], args: argparse.Namespace) -> float:
+    """Post the commands of all the cars in batches while the cars are disconnected.
+
+    Return the time taken.
+    """
+    device_id = fleet_device_ids(1)[0]
+    commands = [api_command(device_id, {"seq": seq}) for seq in range(args.commands)]
+    batches = [commands[i : i + args.batch_size] for i in range(0, args.commands, args.batch_size)]
+    print(f"Queueing {args.commands} commands for each of {len(cars)} cars.")
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(_API_WORKERS) as executor:
+        # the batches of a car are posted in order, the cars in parallel
+        futures = [executor.submit(_post_batches, api, car, batches) for car in cars]
+        for future in futures:
+            future.result()
+    return time.monotonic() - started
+
+
+def _post_batches(api: ApiClientMock, car: str, batches: list[list]) -> None:
+    for batch in batches:
+        api.post_commands(COMPANY, car, *batch)
+
+
+async def _run(gateways: list[SimulatedGateway], probe: DrainProbe, args: argparse.Namespace) -> dict:
+    expected = len(gateways) * args.commands
+    for gateway in gateways:
+        gateway.attach()
+    try:
+        started = time.monotonic()
+        await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways))
+        connected = time.monotonic()
+        while probe.received < expected and time.monotonic() - started < args.drain_timeout:
+            await asyncio.sleep(_POLL)
+        if probe.received < expected:
+            print(f"Only {probe.received} of {expected} commands received within {args.drain_timeout} s.")
+    finally:
+        for gateway in gateways:
+            gateway.detach()
+    return _drain_result(probe.arrivals(), started, connected, args)
+
+
+def _drain_result(
+    arrivals: dict[str, list[tuple[float, int, int]]],
+    started: float,
+    connected: float,
+    args: argparse.Namespace,
+) -> dict:
+    times = sorted(t for received in arrivals.values() for t, _, _ in received)
+    unique = sum(len({seq for _, _, seq in received}) for received in arrivals.values())
+    expected = len(arrivals) * args.commands
+    drained = unique >= expected
+    bursts = _bursts(times, args.burst_gap)
+    # timed from the first command, not from the connect (the first cars may get commands before
+    # the connect sequences of the others finish)
+    drain_time = times[-1] - times[0] if drained and times else None
+    return {
+        "connect_time_s": connected - started,
+        "first_command_s": times[0] - started if times else None,
+        "time_to_drain_s": drain_time,
+        "commands_received": len(times),
+        "commands_lost": expected - unique,
+        "commands_duplicated": len(times) - unique,
+        # message counters decreasing between consecutive commands of a car
+        "counter_inversions": sum(_inversions([c for _, c, _ in r]) for r in arrivals.values()),
+        # commands received before a command posted earlier to the same car
+        "sequence_inversions": sum(_inversions([s for _, _, s in r]) for r in arrivals.values()),
+        "drain_rate": unique / drain_time if drain_time else None,
+        "bursts": len(bursts),
+        "commands_per_burst": statistics.mean(bursts) if bursts else None,
+    }
+
+
+def _against_rate_limits(result: dict, module_config: dict) -> dict:
+    """Compare the observed bursts with the request rate allowed by the rate limits of the module.
+
+    Every burst of commands is assumed to come from a single request of the module to the HTTP API.
+    """
+    count = _number(module_config.get("max_requests_threshold_count"))
+    period_ms = _number(module_config.get("max_requests_threshold_period_ms"))
+    drain_time = result["time_to_drain_s"]
+    return {
+        "allowed_request_rate": count / (period_ms / 1e3) if count and period_ms else None,
+        "burst_rate": result["bursts"] / drain_time if drain_time else None,
+    }
+
+
+def _bursts(times: list[float], gap: float) -> list[int]:
+    """Return the sizes of the groups of arrival times separated by pauses longer than the `gap`."""
+    sizes: list[int] = []
+    previous = None
+    for t in times:
+        if previous is None or t - previous > gap:
+            sizes.append(0)
+        sizes[-1] += 1
+        previous = t
+    return sizes
+
+
+def _inversions(values: list[int]) -> int:
+    return sum(1 for a, b in zip(values, values[1:]) if b < a)
+
+
+def _number(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _print(result: dict) -> None:
+    print_table(
+        (
+            "cars",
+            "commands",
+            "received",
+            "lost",
+            "counter inv.",
+            "drain s",
+            "cmd/s",
+            "bursts",
+            "cmd/burst",
+            "bursts/s",
+            "allowed req/s",
+        ),
+        [
+            (
+                result["cars"],
+                result["cars"] * result["commands_per_car"],
+                result["commands_received"],
+                result["commands_lost"],
+                result["counter_inversions"],
+                result["time_to_drain_s"],
+                result["drain_rate"],
+                result["bursts"],
+                result["commands_per_burst"],
+                result["burst_rate"],
+                result["allowed_request_rate"],
+            )
+        ],
+    )
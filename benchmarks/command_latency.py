@@ -0,0 +1,246 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import statistics
+import threading
+import time
+
+from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.messages import DeviceId, _ExternalServerMsg, api_command
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    api_client,
+    car_names,
+    fleet_devices,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway, fleet_gateways
+from benchmarks.histogram import LatencyHistogram
+from benchmarks.load import drive_commands
+from benchmarks.report import Metric, print_table, write_json
+
+
+_API_WORKERS = 16
+_IN_FLIGHT_SAMPLING_PERIOD = 0.1
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--cars",
+        type=_int_list,
+        default=[1, 10, 50],
+        help="Comma-separated numbers of connected cars of the steps.",
+    )
+    parser.add_argument("--devices", type=int, default=1, help="Number of devices per car.")
+    parser.add_argument(
+        "--rates",
+        type=_float_list,
+        default=[10.0, 50.0, 100.0],
+        help="Comma-separated total command rates (commands/s) run for every number of cars.",
+    )
+    parser.add_argument("--step-duration", type=float, default=10.0, help="Duration of each step in seconds.")
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=10.0,
+        help="Time to wait for the commands of a step to arrive before counting them as lost.",
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--publishers", type=int, default=2, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result["steps"])
+    if args.output:
+        write_json(args.output, "command_latency", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    cars = max(args.cars)
+    config_name = write_fleet_config(cars)
+    sampler = resource_sampler(args.resource_interval)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        gateways = fleet_gateways(comm_layer, COMPANY, car_names(cars), fleet_devices(args.devices))
+        api = api_client()
+        steps = asyncio.run(_run(gateways, api, CommandLatencyProbe(api, COMPANY), args))
+    return {"devices_per_car": args.devices, "steps": steps} | resource_series(sampler)
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    metrics = []
+    for s in result["steps"]:
+        step = f"{s['cars']} cars {s['command_rate']:g} cmd/s"
+        metrics += [Metric(f"{step} {p}", s["latency"]["summary"][p]) for p in ("p50", "p99")]
+        metrics += [
+            Metric(f"{step} delivered cmd/s", s["delivered_rate"], higher_is_better=True),
+            Metric(f"{step} lost", s["commands_lost"]),
+        ]
+    return metrics
+
+
+class CommandLatencyProbe:
+    """Measure the latency of commands on their way from the HTTP API to the module gateway.
+
+    Every command posted through the probe carries a sequence number in its data and the time of
+    posting is kept until the command is received by the gateway (the gateway acknowledges it with
+    a command response). The message counters of the received commands are checked to increase
+    for every car.
+    """
+
+    def __init__(self, api: ApiClientMock, company: str) -> None:
+        self._api = api
+        self._company = company
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._in_flight: dict[int, float] = {}
+        self._last_counters: dict[str, int] = {}
+        self._in_flight_samples: list[int] = []
+        self.latency = LatencyHistogram()
+        self.posted = 0
+        self.received = 0
+        self.unordered = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def attach(self, gateway: SimulatedGateway) -> None:
+        """Record commands received by the gateway after its connect sequence."""
+        gateway.on_command = lambda msg, received_at, car=gateway.car: self._on_command(car, msg, received_at)
+
+    def post(self, car: str, device_id: DeviceId) -> None:
+        """Post a command stamped with a sequence number to the API. Called from the executor threads."""
+        seq = next(self._seq)
+        with self._lock:
+            self._in_flight[seq] = time.monotonic()
+            self.posted += 1
+        self._api.post_commands(self._company, car, api_command(device_id, {"seq": seq}))
+
+    def reset(self) -> None:
+        """Start a new measurement. Commands still in flight are counted as lost."""
+        with self._lock:
+            self._in_flight.clear()
+            self._in_flight_samples.clear()
+            self._last_counters.clear()
+            self.latency = LatencyHistogram()
+            self.posted = self.received = self.unordered = 0
+
+    def sample_in_flight(self) -> None:
+        self._in_flight_samples.append(self.in_flight)
+
+    def step_result(self) -> dict:
+        samples = self._in_flight_samples or [0]
+        return {
+            "commands_posted": self.posted,
+            "commands_received": self.received,
+            "commands_lost": self.in_flight,
+            "commands_unordered": self.unordered,
+            "in_flight_mean": statistics.mean(samples),
+            "in_flight_max": max(samples),
+            "latency": self.latency.to_dict(),
+        }
+
+    def _on_command(self, car: str, msg: _ExternalServerMsg, received_at: float) -> None:
+        counter = msg.command.messageCounter
+        if counter <= self._last_counters.get(car, -1):
+            self.unordered += 1
+        self._last_counters[car] = max(counter, self._last_counters.get(car, -1))
+        seq = json.loads(msg.command.deviceCommand.commandData).get("seq")
+        with self._lock:
+            posted_at = self._in_flight.pop(seq, None)
+        if posted_at is not None:
+            self.received += 1
+            self.latency.record(received_at - posted_at)
+
+
+async def _run(
+    gateways: list[SimulatedGateway], api: ApiClientMock, probe: CommandLatencyProbe, args: argparse.Namespace
+) -> list[dict]:
+    for gateway in gateways:
+        gateway.attach()
+        probe.attach(gateway)
+    steps: list[dict] = []
+    connected = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(_API_WORKERS) as executor:
+            for cars in sorted(args.cars):
+                await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways[connected:cars]))
+                connected = cars
+                for rate in args.rates:
+                    step = await _run_step(gateways[:cars], api, probe, executor, rate, args)
+                    steps.append({"cars": cars, "command_rate": rate} | step)
+                    print(f"{cars} cars, {rate:.0f} commands/s: p99 {step['latency']['summary']['p99']} ms")
+    finally:
+        for gateway in gateways:
+            gateway.detach()
+    return steps
+
+
+async def _run_step(
+    gateways: list[SimulatedGateway],
+    api: ApiClientMock,
+    probe: CommandLatencyProbe,
+    executor: concurrent.futures.Executor,
+    rate: float,
+    args: argparse.Namespace,
+) -> dict:
+    probe.reset()
+    started = time.monotonic()
+    deadline = started + args.step_duration
+    sampler = asyncio.create_task(_sample_in_flight(probe))
+    try:
+        await drive_commands(gateways, api, executor, rate, deadline, post=probe.post)
+        drain_deadline = time.monotonic() + args.drain_timeout
+        while probe.in_flight and time.monotonic() < drain_deadline:
+            await asyncio.sleep(_IN_FLIGHT_SAMPLING_PERIOD)
+    finally:
+        sampler.cancel()
+    # commands received per second of the step including the drain
+    return probe.step_result() | {"delivered_rate": probe.received / (time.monotonic() - started)}
+
+
+async def _sample_in_flight(probe: CommandLatencyProbe) -> None:
+    while True:
+        probe.sample_in_flight()
+        await asyncio.sleep(_IN_FLIGHT_SAMPLING_PERIOD)
+
+
+def _print(steps: list[dict]) -> None:
+    print_table(
+        ("cars", "cmd/s", "posted", "received", "lost", "in flight max", "p50", "p90", "p99", "p99.9"),
+        [
+            (
+                s["cars"],
+                s["command_rate"],
+                s["commands_posted"],
+                s["commands_received"],
+                s["commands_lost"],
+                s["in_flight_max"],
+                *(s["latency"]["summary"][p] for p in ("p50", "p90", "p99", "p99.9")),
+            )
+            for s in steps
+        ],
+    )
+    print("Latencies in milliseconds.")
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _float_list(value: str) -> list[float]:
+    return [float(v) for v in value.split(",") if v]
@@ -0,0 +1,226 @@
+from __future__ import annotations
+import argparse
+import itertools
+import math
+import random
+import shlex
+import statistics
+from types import ModuleType
+
+from tests._utils.docker import env
+
+from benchmarks import (
+    burst,
+    command_drain,
+    command_latency,
+    connect_storm,
+    load,
+    reconnect_storm,
+    reorder,
+    status_latency,
+)
+from benchmarks.fleet import use_external_server_image
+from benchmarks.report import Metric, print_table, write_json
+
+
+_SCENARIOS: dict[str, ModuleType] = {
+    "load": load,
+    "burst": burst,
+    "status_latency": status_latency,
+    "command_latency": command_latency,
+    "connect_storm": connect_storm,
+    "reconnect_storm": reconnect_storm,
+    "command_drain": command_drain,
+    "reorder": reorder,
+}
+_MAX_EXACT_PERMUTATIONS = 20_000
+_SAMPLED_PERMUTATIONS = 20_000
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--baseline", required=True, help="Baseline External Server image.")
+    parser.add_argument("--candidate", required=True, help="Candidate External Server image.")
+    parser.add_argument(
+        "--scenarios",
+        type=_scenario_list,
+        default=["status_latency", "command_latency"],
+        help=f"Comma-separated scenarios to compare, any of {', '.join(_SCENARIOS)}.",
+    )
+    parser.add_argument(
+        "--scenario-args",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("SCENARIO", "ARGS"),
+        help="Options passed to the scenario, e.g. --scenario-args status_latency '--rate 200'.",
+    )
+    parser.add_argument(
+        "--repetitions", type=int, default=5, help="Measured runs of each scenario per image."
+    )
+    parser.add_argument("--warm-up", type=int, default=1, help="Discarded runs of each scenario per image.")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level of the difference.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.05,
+        help="Minimum relative change of a metric reported as a regression or an improvement.",
+    )
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    scenario_args = {name: _scenario_namespace(name, args.scenario_args) for name in args.scenarios}
+    images = {"baseline": args.baseline, "candidate": args.candidate}
+    original_image = env.get("EXTERNAL_SERVER_IMAGE")
+    samples: dict[str, dict[tuple[str, str], list[float]]] = {label: {} for label in images}
+    higher_is_better: dict[tuple[str, str], bool] = {}
+    try:
+        for name in args.scenarios:
+            module = _SCENARIOS[name]
+            # the images take turns run by run, so that drift of the host affects both alike
+            for i in range(args.warm_up):
+                for label, image in images.items():
+                    print(f"[{label}] {name}: warm-up run {i + 1}/{args.warm_up}")
+                    use_external_server_image(image)
+                    module.measure(scenario_args[name])
+            for i in range(args.repetitions):
+                for label, image in images.items():
+                    print(f"[{label}] {name}: run {i + 1}/{args.repetitions}")
+                    use_external_server_image(image)
+                    result = module.measure(scenario_args[name])
+                    for metric in module.metrics(result) + resource_metrics(result):
+                        if metric.value is None:
+                            continue
+                        samples[label].setdefault((name, metric.name), []).append(metric.value)
+                        higher_is_better[(name, metric.name)] = metric.higher_is_better
+    finally:
+        if original_image is not None:
+            use_external_server_image(original_image)
+    comparisons = [
+        compare_samples(
+            Metric(metric, None, higher_is_better[(name, metric)]),
+            samples["baseline"].get((name, metric), []),
+            samples["candidate"].get((name, metric), []),
+            args.alpha,
+            args.threshold,
+        )
+        | {"scenario": name}
+        for name, metric in higher_is_better
+    ]
+    _print(comparisons)
+    if args.output:
+        write_json(
+            args.output,
+            "compare",
+            {
+                "images": images,
+                "repetitions": args.repetitions,
+                "warm_up": args.warm_up,
+                "alpha": args.alpha,
+                "threshold": args.threshold,
+                "comparisons": comparisons,
+            },
+        )
+    return 1 if any(c["verdict"] == "regression" for c in comparisons) else 0
+
+
+def resource_metrics(result: dict) -> list[Metric]:
+    """Return the peak memory and the CPU time of the External Server if its resources were sampled."""
+    summary = result.get("resources", {}).get("summary", {}).get("external-server")
+    if summary is None:
+        return []
+    return [
+        Metric("External Server peak RSS", summary["peak_rss_bytes"]),
+        Metric("External Server CPU seconds", summary["cpu_seconds"]),
+    ]
+
+
+def compare_samples(
+    metric: Metric, baseline: list[float], candidate: list[float], alpha: float, threshold: float
+) -> dict:
+    """Compare the samples of the metric measured on the baseline and on the candidate.
+
+    The difference of the means is significant if the p-value of the two-sided permutation test
+    is below `alpha`. A significant change of at least `threshold` relative to the baseline mean
+    is reported as a regression or an improvement.
+    """
+    result: dict = {"metric": metric.name, "baseline": baseline, "candidate": candidate}
+    if len(baseline) < 2 or len(candidate) < 2:
+        return result | {"change": None, "p_value": None, "verdict": "insufficient data"}
+    baseline_mean, candidate_mean = statistics.mean(baseline), statistics.mean(candidate)
+    change = (candidate_mean - baseline_mean) / baseline_mean if baseline_mean else None
+    p_value = permutation_p_value(baseline, candidate)
+    verdict = "no change"
+    if p_value < alpha and (change is None or abs(change) >= threshold):
+        worse = candidate_mean < baseline_mean if metric.higher_is_better else candidate_mean > baseline_mean
+        verdict = "regression" if worse else "improvement"
+    return result | {"change": change, "p_value": p_value, "verdict": verdict}
+
+
+def permutation_p_value(a: list[float], b: list[float]) -> float:
+    """Return p-value of the two-sided permutation test of the difference of the means of `a` and `b`.
+
+    All the splits of the pooled samples are enumerated if there are few of them, otherwise they are
+    sampled randomly (with a fixed seed). With 5 samples on each side, the lowest attainable p-value
+    is about 0.008.
+    """
+    pooled = a + b
+    observed = abs(statistics.mean(a) - statistics.mean(b))
+    total = sum(pooled)
+    n = len(a)
+
+    def difference(indices: tuple[int, ...]) -> float:
+        part = sum(pooled[i] for i in indices)
+        return abs(part / n - (total - part) / (len(pooled) - n))
+
+    tolerance = 1e-12 * max(abs(v) for v in pooled) if any(pooled) else 0.0
+    if math.comb(len(pooled), n) <= _MAX_EXACT_PERMUTATIONS:
+        splits = list(itertools.combinations(range(len(pooled)), n))
+    else:
+        rng = random.Random(0)
+        splits = [tuple(rng.sample(range(len(pooled)), n)) for _ in range(_SAMPLED_PERMUTATIONS)]
+    extreme = sum(1 for split in splits if difference(split) >= observed - tolerance)
+    return extreme / len(splits)
+
+
+def _scenario_namespace(name: str, scenario_args: list[list[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=name)
+    _SCENARIOS[name].add_arguments(parser)
+    options = [
+        option for scenario, value in scenario_args if scenario == name for option in shlex.split(value)
+    ]
+    namespace = parser.parse_args(options)
+    namespace.output = None
+    return namespace
+
+
+def _print(comparisons: list[dict]) -> None:
+    print_table(
+        ("scenario", "metric", "baseline", "candidate", "change %", "p-value", "verdict"),
+        [
+            (
+                c["scenario"],
+                c["metric"],
+                _mean_and_stdev(c["baseline"]),
+                _mean_and_stdev(c["candidate"]),
+                None if c["change"] is None else c["change"] * 100,
+                None if c["p_value"] is None else f"{c['p_value']:.3f}",
+                c["verdict"],
+            )
+            for c in comparisons
+        ],
+    )
+
+
+def _mean_and_stdev(values: list[float]) -> str | None:
+    if len(values) < 2:
+        return None
+    return f"{statistics.mean(values):.2f} ± {statistics.stdev(values):.2f}"
+
+
+def _scenario_list(value: str) -> list[str]:
+    names = [v for v in value.split(",") if v]
+    for name in names:
+        if name not in _SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'.")
+    return names
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import argparse
+
+from tests._utils.connect_sequence import ConnectSequenceDriver, connect_all
+from tests._utils.external_client import ExternalClientMock
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    car_names,
+    fleet_devices,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.histogram import LatencyHistogram
+from benchmarks.report import Metric, print_table, write_json
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=100, help="Number of cars connecting at once.")
+    parser.add_argument("--devices", type=int, default=2, help="Number of devices per car.")
+    parser.add_argument(
+        "--connect-timeout", type=float, default=60.0, help="Time to wait for all the cars to connect."
+    )
+    parser.add_argument("--publishers", type=int, default=4, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "connect_storm", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    devices = fleet_devices(args.devices)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        drivers = [
+            ConnectSequenceDriver(ExternalClientMock(comm_layer, COMPANY, car), devices)
+            for car in car_names(args.cars)
+        ]
+        try:
+            all_connected = connect_all(drivers, args.connect_timeout)
+        except TimeoutError as e:
+            print(e)
+            all_connected = None
+    sequences = LatencyHistogram()
+    sequences.record_all(d.duration for d in drivers if d.duration is not None)
+    connected = sum(d.is_connected for d in drivers)
+    return {
+        "cars": args.cars,
+        "devices_per_car": args.devices,
+        "connected": connected,
+        "time_to_all_connected_s": all_connected,
+        "connect_rate": connected / all_connected if all_connected else None,
+        "connect_sequence": sequences.to_dict(),
+    } | resource_series(sampler)
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    sequence = result["connect_sequence"]["summary"]
+    return [
+        Metric("time to all connected (s)", result["time_to_all_connected_s"]),
+        Metric("connect sequence p99 (ms)", sequence["p99"]),
+    ]
+
+
+def _print(result: dict) -> None:
+    sequence = result["connect_sequence"]["summary"]
+    print_table(
+        ("cars", "connected", "all connected s", "cars/s", "p50 ms", "p99 ms", "max ms"),
+        [
+            (
+                result["cars"],
+                result["connected"],
+                result["time_to_all_connected_s"],
+                result["connect_rate"],
+                sequence["p50"],
+                sequence["p99"],
+                sequence["max"],
+            )
+        ],
+    )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import copy
+import json
+import os
+from typing import Iterator
+
+from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.async_api_client_mock import AsyncApiClientMock
+from tests._utils.docker import docker_compose_down, docker_compose_up, env
+from tests._utils.environment import API_HOST, RESOURCE_SAMPLING_INTERVAL
+from tests._utils.external_client import CommunicationLayer, communication_layer
+from tests._utils.messages import Device, DeviceId, device_id, device_obj
+from tests._utils.resources import ResourceSampler
+
+
+CONFIG_DIR = "config/external-server"
+GENERATED_CONFIG_DIR = "generated"
+COMPANY = "company_x"
+API_KEY = "TestAPIKey"
+# transparent module accepting devices of any role and name
+_LOAD_DEVICE_MODULE = 3
+_LOAD_DEVICE_TYPE = 1
+# config the fleet configs are generated from, see `use_config_template`
+_config_template = "config.json"
+
+
+def load_config(config_name: str = "config.json") -> dict:
+    """Return External Server config stored under the `config_name` in the config directory."""
+    with open(os.path.join(CONFIG_DIR, config_name)) as f:
+        return json.load(f)
+
+
+def write_config(config: dict, name: str) -> str:
+    """Store the External Server config and return its name relative to the config directory."""
+    config_name = f"{GENERATED_CONFIG_DIR}/{name}.json"
+    path = os.path.join(CONFIG_DIR, config_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+    return config_name
+
+
+def use_config_template(config_name: str) -> None:
+    """Generate the fleet configs of the scenarios from the `config_name` config from now on."""
+    global _config_template
+    _config_template = config_name
+
+
+def car_names(cars: int) -> list[str]:
+    return [f"car_{i:04d}" for i in range(cars)]
+
+
+def fleet_config(cars: int, template: str | None = None, **overrides) -> dict:
+    """Return copy of the `template` External Server config with `cars` cars and top-level `overrides`.
+
+    Without the `template`, the config set by `use_config_template` is used.
+    """
+    config = copy.deepcopy(load_config(template or _config_template))
+    config["company_name"] = COMPANY
+    config["cars"] = {name: {"specific_modules": {}} for name in car_names(cars)}
+    config.update(overrides)
+    return config
+
+
+def write_fleet_config(cars: int, name: str = "fleet", template: str | None = None, **overrides) -> str:
+    """Generate the fleet config and return its name relative to the config directory."""
+    return write_config(fleet_config(cars, template, **overrides), name)
+
+
+def fleet_devices(devices: int) -> list[Device]:
+    """Return `devices` distinct devices supported by the External Server modules."""
+    return [
+        device_obj(_LOAD_DEVICE_MODULE, _LOAD_DEVICE_TYPE, f"load_device_{i}", f"Load_Device_{i}")
+        for i in range(devices)
+    ]
+
+
+def fleet_device_ids(devices: int) -> list[DeviceId]:
+    return [
+        device_id(_LOAD_DEVICE_MODULE, _LOAD_DEVICE_TYPE, f"load_device_{i}", f"Load_Device_{i}")
+        for i in range(devices)
+    ]
+
+
+def api_client() -> ApiClientMock:
+    return ApiClientMock(API_HOST, API_KEY)
+
+
+def async_api_client(max_connections: int = 10) -> AsyncApiClientMock:
+    """Return asyncio HTTP API client sharing at most `max_connections` connections among all the cars."""
+    return AsyncApiClientMock(API_HOST, API_KEY, max_connections=max_connections)
+
+
+def add_resource_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--resource-interval",
+        type=float,
+        default=RESOURCE_SAMPLING_INTERVAL,
+        help="Interval of sampling resource usage of the containers in seconds, 0 disables the sampling.",
+    )
+
+
+def resource_sampler(interval: float) -> ResourceSampler | None:
+    """Return sampler of resource usage of the stack's containers or `None` if the `interval` is not positive."""
+    return ResourceSampler(env, interval=interval) if interval > 0 else None
+
+
+def resource_series(sampler: ResourceSampler | None) -> dict:
+    """Return the sampled resource usage to be added to a scenario result."""
+    return {"resources": sampler.series()} if sampler is not None else {}
+
+
+@contextlib.contextmanager
+def running_stack(
+    config_name: str, publishers: int = 1, sampler: ResourceSampler | None = None
+) -> Iterator[CommunicationLayer]:
+    """Start the test broker and the docker compose stack with the External Server config `config_name`.
+
+    Yield the communication layer connected to the broker. The broker is stopped on exit, the stack
+    is left running for the next scenario and brought down when the process ends. If `sampler` is given,
+    it samples the resource usage while the stack runs.
+    """
+    comm_layer = communication_layer(publishers=publishers)
+    comm_layer.start()
+    try:
+        docker_compose_up(config_name)
+        if sampler is not None:
+            sampler.start()
+        yield comm_layer
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        comm_layer.stop()
+
+
+def use_external_server_image(image: str) -> None:
+    """Run the External Server from the `image` from now on. The running stack is brought down."""
+    docker_compose_down()
+    env["EXTERNAL_SERVER_IMAGE"] = image
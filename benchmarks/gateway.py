@@ -0,0 +1,204 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Callable
+
+from paho.mqtt.client import MQTTMessage as _MQTTMessage
+
+from tests._utils.connect_sequence import ConnectSequenceDriver
+from tests._utils.external_client import CommunicationLayer, ExternalClientMock
+from tests._utils.messages import (
+    CmdResponseType,
+    Device,
+    StatusBatch,
+    StatusTemplate,
+    _ExternalServerMsg,
+    command_response_bytes,
+    status_template,
+)
+
+
+_CONNECTING_PAYLOAD = {"state": "connecting"}
+
+
+class SimulatedGateway:
+    """Module gateway of a single car driven by an asyncio event loop.
+
+    The gateway reacts to the messages sent by the External Server - every command is immediately
+    acknowledged by a command response and every status response is counted as an accepted status.
+    Messages are received on the communication layer's thread and handed over to the event loop.
+    The connect sequence is run by a `ConnectSequenceDriver`.
+    """
+
+    def __init__(
+        self, client: ExternalClientMock, devices: list[Device], session_id: str = "id"
+    ) -> None:
+        self._client = client
+        self._devices = devices
+        self._session_id = session_id
+        self._counter = 0
+        # the gateway's devices are kept alive by `self._devices`, so their ids identify them
+        self._templates: dict[tuple[int, str], StatusTemplate] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._connected = asyncio.Event()
+        self.on_command: Callable[[_ExternalServerMsg, float], None] | None = None
+        self.on_status_response: Callable[[_ExternalServerMsg, float], None] | None = None
+        self.statuses_sent = 0
+        self.statuses_accepted = 0
+        self.commands_received = 0
+
+    @property
+    def car(self) -> str:
+        return self._client.car
+
+    @property
+    def company(self) -> str:
+        return self._client.company
+
+    @property
+    def devices(self) -> list[Device]:
+        return self._devices
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected.is_set()
+
+    def attach(self) -> None:
+        """Start receiving the External Server messages on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._client.add_listener(self._on_mqtt_message)
+
+    def detach(self) -> None:
+        self._client.remove_listener(self._on_mqtt_message)
+        self._loop = None
+
+    async def connect(
+        self,
+        timeout: float = 10.0,
+        session_id: str | None = None,
+        retry_connect: bool = False,
+        unanswered_connect_timeout: float = 1.0,
+    ) -> float:
+        """Run the connect sequence for all the devices and return its duration in seconds.
+
+        With `retry_connect`, the connect message refused or not answered within `unanswered_connect_timeout`
+        seconds is posted again (see `ConnectSequenceDriver`). Raise `TimeoutError` if the External Server
+        does not finish the sequence within `timeout` seconds.
+        """
+        if session_id is not None and session_id != self._session_id:
+            self._session_id = session_id
+            self._templates.clear()
+        self._connected.clear()
+        loop = asyncio.get_running_loop()
+        finished = asyncio.Event()
+        driver = ConnectSequenceDriver(
+            self._client,
+            self._devices,
+            self._session_id,
+            _CONNECTING_PAYLOAD,
+            retry_connect=retry_connect,
+            unanswered_connect_timeout=unanswered_connect_timeout,
+        )
+        # handed over in the order of the messages, so no command after the sequence is missed
+        driver.on_finished = lambda d: loop.call_soon_threadsafe(self._on_connect_sequence_end, d, finished)
+        driver.start()
+        try:
+            await asyncio.wait_for(finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            driver.stop()
+            raise TimeoutError(f"Connect sequence of car '{self.car}' not finished in {timeout} s.")
+        # raises `RuntimeError` if the server refused the connect message
+        return driver.wait(0.0)
+
+    def disconnect(self) -> None:
+        """Send DISCONNECT status of every device, ending the session."""
+        for device in self._devices:
+            self.send_status(device, {"state": "disconnect"}, state="DISCONNECT")
+        self._connected.clear()
+
+    def send_status(self, device: Device, payload: bytes | dict, state: str = "RUNNING") -> int:
+        """Publish status of the device without waiting and return its message counter."""
+        counter = self.reserve_counters(1)
+        self.send_status_at(device, counter, payload, state)
+        return counter
+
+    def reserve_counters(self, count: int) -> int:
+        """Reserve `count` consecutive message counters and return the first of them.
+
+        The statuses with the reserved counters are sent by `send_status_at` in any order.
+        """
+        first = self._counter
+        self._counter += count
+        return first
+
+    def send_status_at(self, device: Device, counter: int, payload: bytes | dict, state: str = "RUNNING") -> None:
+        """Publish status of the device with the message `counter` reserved by `reserve_counters`.
+
+        The statuses may be sent out of order or repeatedly, e.g. to simulate a lossy link.
+        """
+        self._client.post_serialized((self._template(device, state).serialize(counter, payload),))
+        self.statuses_sent += 1
+
+    def status_batch(self, count: int, payload: bytes | dict, state: str = "RUNNING") -> StatusBatch:
+        """Build `count` serialized statuses of the gateway's devices and reserve their message counters.
+
+        The batches must be sent by `send_batch` in the order they were built.
+        """
+        batch = StatusBatch(
+            self._session_id, self._devices, count, payload, state, first_counter=self._counter  # type: ignore
+        )
+        self._counter = batch.next_counter
+        return batch
+
+    def send_batch(self, batch: StatusBatch) -> None:
+        """Publish all the statuses of the batch back-to-back."""
+        self._client.post_serialized(batch.messages)
+        self.statuses_sent += len(batch)
+
+    def _template(self, device: Device, state: str) -> StatusTemplate:
+        key = (id(device), state)
+        template = self._templates.get(key)
+        if template is None:
+            template = status_template(self._session_id, state, device)  # type: ignore
+            if any(device is d for d in self._devices):
+                self._templates[key] = template
+        return template
+
+    def _on_connect_sequence_end(self, driver: ConnectSequenceDriver, finished: asyncio.Event) -> None:
+        if driver.is_connected:
+            self._counter = driver.next_counter
+            self.statuses_sent += len(self._devices)
+            self._connected.set()
+        finished.set()
+
+    def _on_mqtt_message(self, message: _MQTTMessage) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._handle, message.payload, time.monotonic())
+        except RuntimeError:  # the event loop is already closed
+            pass
+
+    def _handle(self, payload: bytes, received_at: float) -> None:
+        msg = _ExternalServerMsg.FromString(payload)
+        if msg.HasField("statusResponse"):
+            self.statuses_accepted += 1
+            if self.on_status_response is not None:
+                self.on_status_response(msg, received_at)
+        elif msg.HasField("command"):
+            self.commands_received += 1
+            # the commands of the connect sequence are acknowledged by the driver
+            if not self._connected.is_set():
+                return
+            self._client.post_serialized(
+                (command_response_bytes(self._session_id, CmdResponseType.OK, msg.command.messageCounter),)
+            )
+            if self.on_command is not None:
+                self.on_command(msg, received_at)
+
+
+def fleet_gateways(
+    comm_layer: CommunicationLayer, company: str, cars: list[str], devices: list[Device]
+) -> list[SimulatedGateway]:
+    return [SimulatedGateway(ExternalClientMock(comm_layer, company, car), devices) for car in cars]
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import math
+from typing import Iterable
+
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """Histogram of latencies with a bounded relative error, in the manner of HdrHistogram.
+
+    Values are stored in microseconds in log-linear buckets - every power of two is split into
+    linear sub-buckets, so the value reported for any percentile differs from the recorded one
+    by less than `10**-significant_digits` relative to it. Memory does not grow with the number
+    of recorded values.
+    """
+
+    def __init__(self, significant_digits: int = 3) -> None:
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("Number of significant digits must be between 1 and 5.")
+        self._precision_bits = math.ceil(math.log2(10**significant_digits)) + 1
+        self._counts: dict[int, int] = {}
+        self._count = 0
+        self._total = 0
+        self._min: int | None = None
+        self._max: int | None = None
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def record(self, seconds: float) -> None:
+        """Record the latency given in seconds. Negative values are recorded as zero."""
+        value = max(round(seconds * 1e6), 0)
+        bucket = self._bucket(value)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self._count += 1
+        self._total += value
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = value if self._max is None else max(self._max, value)
+
+    def record_all(self, seconds: Iterable[float]) -> None:
+        for value in seconds:
+            self.record(value)
+
+    def merge(self, other: LatencyHistogram) -> None:
+        """Add all the values recorded by the `other` histogram."""
+        for bucket, count in other._counts.items():
+            b = self._bucket(bucket)
+            self._counts[b] = self._counts.get(b, 0) + count
+        self._count += other._count
+        self._total += other._total
+        if other._min is not None:
+            self._min = other._min if self._min is None else min(self._min, other._min)
+        if other._max is not None:
+            self._max = other._max if self._max is None else max(self._max, other._max)
+
+    def percentile(self, percentile: float) -> float:
+        """Return the latency (in seconds) not exceeded by the given percentage of the recorded values."""
+        return self._value_at(percentile) / 1e6
+
+    def summary(self, percentiles: Iterable[float] = PERCENTILES) -> dict[str, float | int | None]:
+        """Return count, min, mean, max and the percentiles of the recorded latencies in milliseconds."""
+        if not self._count:
+            return {"count": 0, "min": None, "mean": None, "max": None} | {
+                f"p{p:g}": None for p in percentiles
+            }
+        return {
+            "count": self._count,
+            "min": self._min / 1e3,  # type: ignore
+            "mean": round(self._total / self._count) / 1e3,
+            "max": self._max / 1e3,  # type: ignore
+        } | {f"p{p:g}": self._value_at(p) / 1e3 for p in percentiles}
+
+    def to_dict(self) -> dict:
+        """Return the summary together with the bucket counts (keyed by the lowest bucket value in microseconds)."""
+        return {
+            "unit": "ms",
+            "summary": self.summary(),
+            "buckets_us": {str(b): self._counts[b] for b in sorted(self._counts)},
+        }
+
+    def _value_at(self, percentile: float) -> int:
+        if not self._count:
+            raise ValueError("No values recorded.")
+        rank = max(math.ceil(percentile / 100.0 * self._count), 1)
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return min(self._highest(bucket), self._max)  # type: ignore
+        return self._max  # type: ignore
+
+    def _bucket(self, value: int) -> int:
+        shift = max(value.bit_length() - self._precision_bits, 0)
+        return (value >> shift) << shift
+
+    def _highest(self, bucket: int) -> int:
+        shift = max(bucket.bit_length() - self._precision_bits, 0)
+        return bucket + (1 << shift) - 1
@@ -0,0 +1,268 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import concurrent.futures
+import dataclasses
+import functools
+import itertools
+import statistics
+import time
+from typing import Any, Callable
+
+from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.messages import Device, DeviceId, api_command
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    api_client,
+    car_names,
+    fleet_device_ids,
+    fleet_devices,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway, fleet_gateways
+from benchmarks.report import Metric, print_table, write_json
+
+
+_TICK = 0.01
+_API_WORKERS = 8
+
+
+@dataclasses.dataclass
+class LoadStep:
+    status_rate: float
+    command_rate: float
+    duration: float
+    statuses_sent: int
+    statuses_accepted: int
+    commands_posted: int
+    commands_received: int
+
+    @property
+    def accepted_status_rate(self) -> float:
+        return self.statuses_accepted / self.duration
+
+    @property
+    def received_command_rate(self) -> float:
+        return self.commands_received / self.duration
+
+    def is_saturated(self, tolerance: float) -> bool:
+        """Return `True` if the server accepted noticeably fewer statuses than offered."""
+        return self.accepted_status_rate < self.status_rate * (1.0 - tolerance)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=10, help="Number of simulated cars.")
+    parser.add_argument("--devices", type=int, default=1, help="Number of devices per car.")
+    parser.add_argument(
+        "--rates",
+        type=_float_list,
+        default=[100.0, 200.0, 400.0, 800.0],
+        help="Comma-separated total status rates (statuses/s) of the load steps.",
+    )
+    parser.add_argument("--command-rate", type=float, default=0.0, help="Total command rate (commands/s).")
+    parser.add_argument("--step-duration", type=float, default=10.0, help="Duration of each step in seconds.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.05,
+        help="Relative shortfall of accepted statuses marking the server as saturated.",
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--publishers", type=int, default=4, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "load", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        gateways = fleet_gateways(comm_layer, COMPANY, car_names(args.cars), fleet_devices(args.devices))
+        connect_times, steps = asyncio.run(_run(gateways, api_client(), args))
+    return _result(connect_times, steps, args) | resource_series(sampler)
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [
+        Metric("sustained status rate", result["sustained_status_rate"], higher_is_better=True),
+        Metric("max connect time", result["connect_time_s"]["max"]),
+    ]
+
+
+async def _run(
+    gateways: list[SimulatedGateway], api: ApiClientMock, args: argparse.Namespace
+) -> tuple[list[float], list[LoadStep]]:
+    for gateway in gateways:
+        gateway.attach()
+    try:
+        connect_times = await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways))
+        steps: list[LoadStep] = []
+        with concurrent.futures.ThreadPoolExecutor(_API_WORKERS) as executor:
+            for rate in args.rates:
+                step = await run_step(gateways, api, executor, rate, args.command_rate, args.step_duration)
+                steps.append(step)
+                print(
+                    f"Offered {rate:.0f} statuses/s, accepted {step.accepted_status_rate:.1f} statuses/s."
+                )
+                if step.is_saturated(args.tolerance):
+                    break
+        return list(connect_times), steps
+    finally:
+        for gateway in gateways:
+            gateway.detach()
+
+
+async def run_step(
+    gateways: list[SimulatedGateway],
+    api: ApiClientMock,
+    executor: concurrent.futures.Executor,
+    status_rate: float,
+    command_rate: float,
+    duration: float,
+) -> LoadStep:
+    """Drive the fleet with the given status and command rates for `duration` seconds."""
+    sent = sum(g.statuses_sent for g in gateways)
+    accepted = sum(g.statuses_accepted for g in gateways)
+    received = sum(g.commands_received for g in gateways)
+    deadline = time.monotonic() + duration
+    _, commands_posted = await asyncio.gather(
+        drive_statuses(gateways, status_rate, deadline),
+        drive_commands(gateways, api, executor, command_rate, deadline),
+    )
+    return LoadStep(
+        status_rate=status_rate,
+        command_rate=command_rate,
+        duration=duration,
+        statuses_sent=sum(g.statuses_sent for g in gateways) - sent,
+        statuses_accepted=sum(g.statuses_accepted for g in gateways) - accepted,
+        commands_posted=commands_posted,
+        commands_received=sum(g.commands_received for g in gateways) - received,
+    )
+
+
+async def drive_statuses(
+    gateways: list[SimulatedGateway],
+    rate: float,
+    deadline: float,
+    send: Callable[[SimulatedGateway, Device], Any] | None = None,
+) -> int:
+    """Publish statuses of all the fleet devices round-robin at the total `rate` until the `deadline`.
+
+    Each status is published by calling `send(gateway, device)`; by default, a fixed payload is sent.
+    """
+    if rate <= 0:
+        await asyncio.sleep(max(deadline - time.monotonic(), 0.0))
+        return 0
+    targets = itertools.cycle([(g, d) for g in gateways for d in g.devices])
+    send = send or _send_load_status
+    started, emitted = time.monotonic(), 0
+    while (now := time.monotonic()) < deadline:
+        due = int((now - started) * rate) - emitted
+        for _ in range(due):
+            send(*next(targets))
+        emitted += max(due, 0)
+        await asyncio.sleep(_TICK)
+    return emitted
+
+
+async def drive_commands(
+    gateways: list[SimulatedGateway],
+    api: ApiClientMock,
+    executor: concurrent.futures.Executor,
+    rate: float,
+    deadline: float,
+    post: Callable[[str, DeviceId], Any] | None = None,
+) -> int:
+    """Post commands for all the fleet devices round-robin through the API at the total `rate`.
+
+    Each command is posted by calling `post(car, device_id)` in the `executor`; by default, a fixed
+    payload is posted.
+    """
+    if rate <= 0:
+        return 0
+    loop = asyncio.get_running_loop()
+    device_ids = fleet_device_ids(len(gateways[0].devices))
+    targets = itertools.cycle([(g.car, d) for g in gateways for d in device_ids])
+    post = post or functools.partial(_post_load_command, api)
+    started, emitted = time.monotonic(), 0
+    pending: set[asyncio.Future] = set()
+    while (now := time.monotonic()) < deadline:
+        due = int((now - started) * rate) - emitted
+        for _ in range(due):
+            pending.add(loop.run_in_executor(executor, post, *next(targets)))
+            emitted += 1
+        pending = {f for f in pending if not f.done()}
+        await asyncio.sleep(_TICK)
+    if pending:
+        await asyncio.wait(pending)
+    return emitted
+
+
+def _send_load_status(gateway: SimulatedGateway, device: Device) -> None:
+    gateway.send_status(device, {"content": "load"})
+
+
+def _post_load_command(api: ApiClientMock, car: str, device_id: DeviceId) -> None:
+    api.post_commands(COMPANY, car, api_command(device_id, {"content": "load"}))
+
+
+def _result(connect_times: list[float], steps: list[LoadStep], args: argparse.Namespace) -> dict:
+    tolerance = args.tolerance
+    sustained = [s.accepted_status_rate for s in steps if not s.is_saturated(tolerance)]
+    saturated = [s.status_rate for s in steps if s.is_saturated(tolerance)]
+    return {
+        "cars": args.cars,
+        "devices_per_car": args.devices,
+        "connect_time_s": {
+            "mean": statistics.mean(connect_times),
+            "max": max(connect_times),
+        },
+        "sustained_status_rate": max(sustained) if sustained else None,
+        "saturation_status_rate": saturated[0] if saturated else None,
+        "steps": [
+            dict(
+                dataclasses.asdict(s),
+                accepted_status_rate=s.accepted_status_rate,
+                received_command_rate=s.received_command_rate,
+            )
+            for s in steps
+        ],
+    }
+
+
+def _print(result: dict) -> None:
+    print_table(
+        ("offered st/s", "accepted st/s", "sent", "accepted", "cmd posted", "cmd received"),
+        [
+            (
+                s["status_rate"],
+                s["accepted_status_rate"],
+                s["statuses_sent"],
+                s["statuses_accepted"],
+                s["commands_posted"],
+                s["commands_received"],
+            )
+            for s in result["steps"]
+        ],
+    )
+    print(f"Sustained throughput: {result['sustained_status_rate']} statuses/s")
+    print(f"Saturation point: {result['saturation_status_rate']} statuses/s")
+
+
+def _float_list(value: str) -> list[float]:
+    return [float(v) for v in value.split(",") if v]
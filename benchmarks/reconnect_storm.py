@@ -0,0 +1,311 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import functools
+import json
+import random
+import threading
+import time
+
+from paho.mqtt.client import MQTTMessage as _MQTTMessage
+
+from tests._utils.broker import MQTTBrokerTest
+from tests._utils.external_client import CommunicationLayer, ExternalClientMock
+from tests._utils.messages import _ExternalServerMsg, api_command
+from tests._utils.resources import SERVICES, ResourceSampler
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    async_api_client,
+    car_names,
+    fleet_device_ids,
+    fleet_devices,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway
+from benchmarks.histogram import LatencyHistogram
+from benchmarks.report import Metric, print_table, write_json
+
+
+_RECONNECT_SESSION_ID = "reconnect"
+_API_CONNECTIONS = 20
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=100, help="Number of simulated cars.")
+    parser.add_argument("--devices", type=int, default=2, help="Number of devices per car.")
+    parser.add_argument("--outage", type=float, default=5.0, help="Time the broker is down in seconds.")
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=1.0,
+        help="Maximum random delay of the reconnect of every car after the broker restarts, in seconds.",
+    )
+    parser.add_argument(
+        "--commands", type=int, default=2, help="Number of commands posted for every car during the outage."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random reconnect delays.")
+    parser.add_argument(
+        "--connect-timeout", type=float, default=60.0, help="Time to wait for every car to reconnect."
+    )
+    parser.add_argument(
+        "--unanswered-connect-timeout",
+        type=float,
+        default=5.0,
+        help="Time after which a car posts its unanswered connect message again, in seconds.",
+    )
+    parser.add_argument(
+        "--flush-timeout",
+        type=float,
+        default=60.0,
+        help="Time to wait for the queued commands after all the cars reconnect.",
+    )
+    parser.add_argument("--publishers", type=int, default=4, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "reconnect_storm", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    devices = fleet_devices(args.devices)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        clients = [ExternalClientMock(comm_layer, COMPANY, car) for car in car_names(args.cars)]
+        gateways = [SimulatedGateway(client, devices) for client in clients]
+        probe = QueuedCommandProbe(clients, args.commands)
+        try:
+            result = asyncio.run(_run(comm_layer, gateways, probe, sampler, args))
+        finally:
+            probe.close()
+    return result | resource_series(sampler)
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [
+        Metric("time to all reconnected (s)", result["time_to_all_reconnected_s"]),
+        Metric("time to flush queued commands (s)", result["time_to_flush_s"]),
+        Metric("External Server peak CPU (%)", result["storm"]["external-server"]["peak_cpu_percent"]),
+    ]
+
+
+class QueuedCommandProbe:
+    """Record the arrival of the commands queued during the outage.
+
+    Every queued command carries a sequence number in its data, the first arrival of every car's
+    sequence number is recorded. The commands are recorded from the communication layer's thread,
+    including the commands of the connect sequence.
+    """
+
+    def __init__(self, clients: list[ExternalClientMock], commands: int) -> None:
+        self._expected = len(clients) * commands
+        self._lock = threading.Lock()
+        self._flushed = threading.Event()
+        self._arrivals: dict[tuple[str, int], float] = {}
+        self._listeners = [(client, functools.partial(self._on_message, client.car)) for client in clients]
+        self.duplicates = 0
+        if not self._expected:
+            self._flushed.set()
+        for client, listener in self._listeners:
+            client.add_listener(listener)
+
+    @property
+    def expected(self) -> int:
+        return self._expected
+
+    @property
+    def received(self) -> int:
+        return len(self._arrivals)
+
+    @property
+    def last_arrival(self) -> float | None:
+        with self._lock:
+            return max(self._arrivals.values(), default=None)
+
+    def wait(self, timeout: float) -> bool:
+        """Wait until all the queued commands arrive. Return `False` on timeout."""
+        return self._flushed.wait(timeout)
+
+    def close(self) -> None:
+        for client, listener in self._listeners:
+            client.remove_listener(listener)
+
+    def _on_message(self, car: str, message: _MQTTMessage) -> None:
+        received_at = time.monotonic()
+        msg = _ExternalServerMsg.FromString(message.payload)
+        if not msg.HasField("command"):
+            return
+        try:
+            data = json.loads(msg.command.deviceCommand.commandData)
+        except ValueError:
+            return
+        if not isinstance(data, dict) or "seq" not in data:
+            return
+        with self._lock:
+            key = (car, data["seq"])
+            if key in self._arrivals:
+                self.duplicates += 1
+                return
+            self._arrivals[key] = received_at
+            if len(self._arrivals) >= self._expected:
+                self._flushed.set()
+
+
+async def _run(
+    comm_layer: CommunicationLayer,
+    gateways: list[SimulatedGateway],
+    probe: QueuedCommandProbe,
+    sampler: ResourceSampler | None,
+    args: argparse.Namespace,
+) -> dict:
+    for gateway in gateways:
+        gateway.attach()
+    try:
+        await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways))
+        print(f"{len(gateways)} cars connected, stopping the broker for {args.outage} s.")
+        comm_layer.stop()
+        outage_started = time.monotonic()
+        await _queue_commands(gateways, args)
+        await asyncio.sleep(max(args.outage - (time.monotonic() - outage_started), 0.0))
+
+        comm_layer.start()
+        restarted = time.monotonic()
+        resubscribed = asyncio.create_task(
+            asyncio.to_thread(_wait_for_server_subscription, restarted, args.connect_timeout)
+        )
+        rng = random.Random(args.seed)
+        reconnects = await asyncio.gather(
+            *(_reconnect(g, rng.uniform(0.0, args.jitter), args) for g in gateways)
+        )
+        all_reconnected = max(reconnects) if all(t is not None for t in reconnects) else None  # type: ignore
+        flushed = await asyncio.to_thread(probe.wait, args.flush_timeout)
+        storm_ended = time.monotonic()
+        resubscribed_at = await resubscribed
+        if sampler is not None:
+            # let the sampler catch up with the end of the storm
+            await asyncio.sleep(sampler.interval)
+    finally:
+        for gateway in gateways:
+            gateway.detach()
+
+    reconnect_times = LatencyHistogram()
+    reconnect_times.record_all(t - restarted for t in reconnects if t is not None)
+    last_arrival = probe.last_arrival
+    return {
+        "cars": len(gateways),
+        "devices_per_car": args.devices,
+        "outage_s": args.outage,
+        "jitter_s": args.jitter,
+        "server_resubscribed_s": resubscribed_at - restarted if resubscribed_at is not None else None,
+        "reconnected": sum(t is not None for t in reconnects),
+        "time_to_all_reconnected_s": all_reconnected - restarted if all_reconnected is not None else None,
+        "reconnect": reconnect_times.to_dict(),
+        "commands_queued": probe.expected,
+        "commands_flushed": probe.received,
+        "commands_lost": probe.expected - probe.received,
+        "commands_duplicated": probe.duplicates,
+        "time_to_flush_s": last_arrival - restarted if flushed and last_arrival is not None else None,
+        "storm": _storm_peaks(sampler, restarted, storm_ended),
+    }
+
+
+async def _queue_commands(gateways: list[SimulatedGateway], args: argparse.Namespace) -> None:
+    """Post the commands of every car through the HTTP API while the car is disconnected."""
+    if args.commands <= 0:
+        return
+    device_id = fleet_device_ids(args.devices)[0]
+    commands = [api_command(device_id, {"seq": seq}) for seq in range(args.commands)]
+    async with async_api_client(max_connections=_API_CONNECTIONS) as api:
+        await asyncio.gather(*(api.post_commands(COMPANY, g.car, *commands) for g in gateways))
+
+
+async def _reconnect(gateway: SimulatedGateway, delay: float, args: argparse.Namespace) -> float | None:
+    """Reconnect the car after the `delay`.
+
+    Return the `time.monotonic()` time of finishing or `None` on failure.
+    """
+    await asyncio.sleep(delay)
+    try:
+        await gateway.connect(
+            args.connect_timeout,
+            session_id=_RECONNECT_SESSION_ID,
+            retry_connect=True,
+            unanswered_connect_timeout=args.unanswered_connect_timeout,
+        )
+    except (TimeoutError, RuntimeError) as e:
+        print(e)
+        return None
+    return time.monotonic()
+
+
+def _wait_for_server_subscription(since: float, timeout: float) -> float | None:
+    """Return the time the External Server subscribed to the broker restarted at `since`, `None` on timeout."""
+    brokers = MQTTBrokerTest.running_brokers()
+    if not brokers:
+        return None
+    try:
+        brokers[-1].wait_for_subscription(f"{COMPANY}/+/module_gateway", since=since, timeout=timeout)
+    except TimeoutError:
+        return None
+    return time.monotonic()
+
+
+def _storm_peaks(sampler: ResourceSampler | None, since: float, until: float) -> dict[str, dict]:
+    """Return the peak CPU utilization and memory of every service between the `since` and `until` times."""
+    return {
+        service: {
+            "peak_cpu_percent": sampler.peak(service, "cpu_percent", since, until) if sampler else None,
+            "peak_rss_bytes": sampler.peak(service, "rss_bytes", since, until) if sampler else None,
+        }
+        for service in SERVICES
+    }
+
+
+def _print(result: dict) -> None:
+    reconnect = result["reconnect"]["summary"]
+    server = result["storm"]["external-server"]
+    rss = server["peak_rss_bytes"]
+    print_table(
+        (
+            "cars",
+            "reconnected",
+            "resubscribed s",
+            "all reconnected s",
+            "p50 ms",
+            "p99 ms",
+            "queued",
+            "flushed",
+            "flush s",
+            "ES peak CPU %",
+            "ES peak MiB",
+        ),
+        [
+            (
+                result["cars"],
+                result["reconnected"],
+                result["server_resubscribed_s"],
+                result["time_to_all_reconnected_s"],
+                reconnect["p50"],
+                reconnect["p99"],
+                result["commands_queued"],
+                result["commands_flushed"],
+                result["time_to_flush_s"],
+                server["peak_cpu_percent"],
+                rss / 2**20 if rss is not None else None,
+            )
+        ],
+    )
+    print("Times measured from the restart of the broker.")
@@ -0,0 +1,416 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from tests._utils.api_client_mock import ApiClientMock, ApiException
+from tests._utils.messages import Message
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    api_client,
+    car_names,
+    fleet_devices,
+    load_config,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway, fleet_gateways
+from benchmarks.histogram import LatencyHistogram
+from benchmarks.report import Metric, print_table, write_json
+
+
+# pause after a failed request, so that failing requests do not spin
+_ERROR_PAUSE = 1.0
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=10, help="Number of simulated cars.")
+    parser.add_argument("--devices", type=int, default=1, help="Number of devices per car.")
+    parser.add_argument("--rate", type=float, default=500.0, help="Total status rate of the fleet (statuses/s).")
+    parser.add_argument("--duration", type=float, default=20.0, help="Duration of the status stream in seconds.")
+    parser.add_argument(
+        "--window", type=int, default=8, help="Number of consecutive statuses of a car that may be reordered."
+    )
+    parser.add_argument(
+        "--reorder", type=float, default=0.5, help="Probability of shuffling the statuses of a window."
+    )
+    parser.add_argument(
+        "--duplicates", type=float, default=0.05, help="Probability of a status being delivered twice."
+    )
+    parser.add_argument(
+        "--gaps", type=float, default=0.02, help="Probability of a status of a window being held back."
+    )
+    parser.add_argument(
+        "--gap-delay",
+        type=float,
+        default=0.5,
+        help="Time a held back status is delayed by in seconds, below the server's 'timeout' to be recoverable.",
+    )
+    parser.add_argument(
+        "--depths",
+        type=_int_list,
+        default=[50, 100, 200, 400, 800, 1600],
+        help="Comma-separated numbers of statuses sent behind a missing one, probed until the session drops.",
+    )
+    parser.add_argument(
+        "--depth-rate", type=float, default=200.0, help="Rate of the statuses sent behind a missing one."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the injected reordering, duplicates and gaps.")
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=10.0,
+        help="Time to wait for the statuses to appear on the API before counting them as lost.",
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--publishers", type=int, default=2, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "reorder", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    timeout = load_config(config_name)["timeout"]
+    if args.gap_delay >= timeout:
+        print(f"The gap delay {args.gap_delay} s is not below the server's timeout {timeout} s.")
+    sampler = resource_sampler(args.resource_interval)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        gateways = fleet_gateways(comm_layer, COMPANY, car_names(args.cars), fleet_devices(args.devices))
+        probe = ReorderProbe(api_client(), COMPANY, [g.car for g in gateways])
+        stream, depths = asyncio.run(_run(gateways, probe, args))
+    tolerated = [step["depth"] for step in depths if step["survived"]]
+    return (
+        {
+            "cars": args.cars,
+            "devices_per_car": args.devices,
+            "status_rate": args.rate,
+            "window": args.window,
+            "reorder": args.reorder,
+            "duplicates": args.duplicates,
+            "gaps": args.gaps,
+            "gap_delay_s": args.gap_delay,
+            "server_timeout_s": timeout,
+        }
+        | stream
+        | {
+            "depths": depths,
+            "max_tolerated_depth": max(tolerated, default=None),
+            # statuses sent behind a missing one at the depth rate until the server's timeout
+            "timeout_depth": int(timeout * args.depth_rate),
+        }
+        | resource_series(sampler)
+    )
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [
+        Metric("goodput (statuses/s)", result["goodput"], higher_is_better=True),
+        Metric("statuses lost", result["statuses_lost"]),
+        Metric("held status p99 (ms)", result["held_latency"]["summary"]["p99"]),
+        Metric("release p99 (ms)", result["release_latency"]["summary"]["p99"]),
+        Metric("max tolerated depth", result["max_tolerated_depth"], higher_is_better=True),
+    ]
+
+
+class ReorderProbe:
+    """Record the sending of statuses by their message counters and their appearance on the HTTP API.
+
+    Every status carries its message counter in the payload, so repeated deliveries of a status
+    are recognized. The probe streams the API statuses of each car (see `ApiClientMock.stream_statuses`)
+    in a separate thread and records the first appearance of every status, statuses appearing
+    repeatedly or with a lower counter than the previous one of the car are counted.
+    """
+
+    def __init__(self, api: ApiClientMock, company: str, cars: list[str]) -> None:
+        self._api = api
+        self._company = company
+        self._cars = cars
+        self._sent: dict[tuple[str, int], float] = {}
+        self._delivered: dict[tuple[str, int], float] = {}
+        self._last_delivered: dict[str, int] = {}
+        self._delivered_changed = threading.Condition()
+        self._stopped = threading.Event()
+        self.messages_sent = 0
+        self.api_duplicates = 0
+        self.api_out_of_order = 0
+
+    def start(self) -> None:
+        """Start long-polling statuses of all the cars newer than the current time."""
+        since = int(time.time() * 1000)
+        self._stopped.clear()
+        for car in self._cars:
+            threading.Thread(target=self._poll, args=(car, since), daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop polling. Requests in progress are abandoned to their daemon threads."""
+        self._stopped.set()
+
+    def send(self, gateway: SimulatedGateway, counter: int) -> None:
+        """Send the status with the message `counter` reserved by the gateway, recording its first sending."""
+        self._sent.setdefault((gateway.car, counter), time.monotonic())
+        self.messages_sent += 1
+        device = gateway.devices[counter % len(gateway.devices)]
+        gateway.send_status_at(device, counter, {"seq": counter})
+
+    def sent_at(self, car: str, counter: int) -> float | None:
+        return self._sent.get((car, counter))
+
+    def delivered_at(self, car: str, counter: int) -> float | None:
+        with self._delivered_changed:
+            return self._delivered.get((car, counter))
+
+    def wait_for_delivery(self, car: str, counters: range, timeout: float) -> bool:
+        """Wait until the statuses of the car appear on the API. Return `False` on timeout."""
+        with self._delivered_changed:
+            return self._delivered_changed.wait_for(
+                lambda: all((car, c) in self._delivered for c in counters), timeout
+            )
+
+    def _poll(self, car: str, since: int) -> None:
+        while not self._stopped.is_set():
+            try:
+                for statuses in self._api.stream_statuses(self._company, car, since=since):
+                    if self._stopped.is_set():
+                        return
+                    self._record(car, statuses, time.monotonic())
+                    since = max([since, *(message.timestamp for message in statuses)])
+            except ApiException as e:
+                print(f"Polling statuses of car '{car}' failed: {e}")
+                time.sleep(_ERROR_PAUSE)
+
+    def _record(self, car: str, statuses: list[Message], received_at: float) -> None:
+        with self._delivered_changed:
+            for message in statuses:
+                counter = message.payload.data.to_dict().get("seq")
+                if counter is None:
+                    continue
+                if (car, counter) in self._delivered:
+                    self.api_duplicates += 1
+                    continue
+                if counter < self._last_delivered.get(car, -1):
+                    self.api_out_of_order += 1
+                self._last_delivered[car] = max(counter, self._last_delivered.get(car, -1))
+                self._delivered[(car, counter)] = received_at
+            self._delivered_changed.notify_all()
+
+
+def impaired_schedule(
+    count: int,
+    interval: float,
+    window: int,
+    reorder: float,
+    duplicates: float,
+    gaps: float,
+    gap_delay: float,
+    rng: random.Random,
+) -> list[tuple[float, int]]:
+    """Return the time offsets and indices of the statuses of a stream sent every `interval` seconds.
+
+    The stream of `count` statuses is split into windows of `window` statuses. The statuses of a window
+    are shuffled with the probability `reorder`, every status is sent once more later within its window
+    with the probability `duplicates` and one status of a window (with its duplicates) is held back
+    for `gap_delay` seconds with the probability `gaps`.
+    """
+    schedule: list[tuple[float, int]] = []
+    for first in range(0, count, window):
+        indices = list(range(first, min(first + window, count)))
+        slots = [i * interval for i in indices]
+        if rng.random() < reorder:
+            rng.shuffle(indices)
+        sends = list(zip(slots, indices))
+        window_end = slots[-1] + interval
+        sends += [(rng.uniform(slot, window_end), i) for slot, i in sends if rng.random() < duplicates]
+        if rng.random() < gaps:
+            held = rng.choice(indices)
+            sends = [(t + gap_delay, i) if i == held else (t, i) for t, i in sends]
+        schedule += sends
+    return sorted(schedule)
+
+
+async def _run(
+    gateways: list[SimulatedGateway], probe: ReorderProbe, args: argparse.Namespace
+) -> tuple[dict, list[dict]]:
+    for gateway in gateways:
+        gateway.attach()
+    try:
+        await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways))
+        probe.start()
+        stream = await _run_stream(gateways, probe, args)
+        depths = await _probe_depths(gateways[0], probe, args)
+    finally:
+        probe.stop()
+        for gateway in gateways:
+            gateway.detach()
+    return stream, depths
+
+
+async def _run_stream(gateways: list[SimulatedGateway], probe: ReorderProbe, args: argparse.Namespace) -> dict:
+    """Send the impaired status streams of all the cars and return the delivery of the statuses."""
+    rng = random.Random(args.seed)
+    count = int(args.rate * args.duration / len(gateways))
+    interval = len(gateways) / args.rate
+    schedules = [
+        impaired_schedule(count, interval, args.window, args.reorder, args.duplicates, args.gaps, args.gap_delay, rng)
+        for _ in gateways
+    ]
+    streams = {}
+    for gateway in gateways:
+        first = gateway.reserve_counters(count)
+        streams[gateway.car] = range(first, first + count)
+    started = time.monotonic()
+    await asyncio.gather(
+        *(_send(g, probe, s, streams[g.car].start, started) for g, s in zip(gateways, schedules))
+    )
+    delivered = await asyncio.to_thread(_wait_for_streams, probe, streams, args.drain_timeout)
+    if not delivered:
+        print(f"Not all statuses appeared on the API within {args.drain_timeout} s.")
+    return _stream_result(probe, streams, started)
+
+
+async def _send(
+    gateway: SimulatedGateway, probe: ReorderProbe, schedule: list[tuple[float, int]], first: int, started: float
+) -> None:
+    for offset, index in schedule:
+        delay = started + offset - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        probe.send(gateway, first + index)
+
+
+def _wait_for_streams(probe: ReorderProbe, streams: dict[str, range], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    return all(probe.wait_for_delivery(car, c, max(deadline - time.monotonic(), 0.0)) for car, c in streams.items())
+
+
+def _stream_result(probe: ReorderProbe, streams: dict[str, range], started: float) -> dict:
+    """Return the latency of the statuses, the depth of the reorder buffer and the goodput of the streams.
+
+    A status is held in the server's reorder buffer if a status with a lower counter is sent after it.
+    It is released when the last of the lower counters is sent.
+    """
+    in_order = LatencyHistogram()
+    held = LatencyHistogram()
+    release = LatencyHistogram()
+    max_depth = 0
+    delivered = []
+    for car, counters in streams.items():
+        sent = {c: probe.sent_at(car, c) for c in counters}
+        released_at = started
+        for c in counters:
+            at = probe.delivered_at(car, c)
+            if at is not None:
+                delivered.append(at)
+                if released_at > sent[c]:  # type: ignore
+                    held.record(at - sent[c])  # type: ignore
+                    release.record(at - released_at)
+                else:
+                    in_order.record(at - sent[c])  # type: ignore
+            released_at = max(released_at, sent[c])  # type: ignore
+        max_depth = max(max_depth, _max_buffer_depth(sent))  # type: ignore
+    sent_statuses = sum(len(c) for c in streams.values())
+    duration = max(delivered) - started if delivered else None
+    return {
+        "statuses_sent": sent_statuses,
+        "messages_sent": probe.messages_sent,
+        "statuses_delivered": len(delivered),
+        "statuses_lost": sent_statuses - len(delivered),
+        "api_duplicates": probe.api_duplicates,
+        "api_out_of_order": probe.api_out_of_order,
+        "max_buffer_depth": max_depth,
+        "goodput": len(delivered) / duration if duration else None,
+        "in_order_latency": in_order.to_dict(),
+        "held_latency": held.to_dict(),
+        "release_latency": release.to_dict(),
+    }
+
+
+def _max_buffer_depth(sent: dict[int, float]) -> int:
+    """Return the maximum number of statuses sent but waiting for a status with a lower counter."""
+    waiting: set[int] = set()
+    expected = min(sent)
+    depth = 0
+    for _, counter in sorted((t, c) for c, t in sent.items()):
+        waiting.add(counter)
+        while expected in waiting:
+            waiting.remove(expected)
+            expected += 1
+        depth = max(depth, len(waiting))
+    return depth
+
+
+async def _probe_depths(gateway: SimulatedGateway, probe: ReorderProbe, args: argparse.Namespace) -> list[dict]:
+    """Send increasing numbers of statuses behind a missing one until the server drops the session.
+
+    The session is considered dropped if the statuses do not appear on the API after the missing
+    status is sent.
+    """
+    steps = []
+    for depth in sorted(args.depths):
+        first = gateway.reserve_counters(depth + 1)
+        schedule = [(i / args.depth_rate, i) for i in range(1, depth + 1)]
+        started = time.monotonic()
+        await _send(gateway, probe, schedule, first, started)
+        gap_closed = time.monotonic()
+        probe.send(gateway, first)
+        counters = range(first, first + depth + 1)
+        survived = await asyncio.to_thread(probe.wait_for_delivery, gateway.car, counters, args.drain_timeout)
+        delivered = [probe.delivered_at(gateway.car, c) for c in counters]
+        steps.append(
+            {
+                "depth": depth,
+                "gap_open_s": gap_closed - started,
+                "survived": survived,
+                "flush_s": max(delivered) - gap_closed if survived else None,  # type: ignore
+            }
+        )
+        print(f"{depth} statuses behind a missing one for {gap_closed - started:.2f} s: survived {survived}")
+        if not survived:
+            break
+    return steps
+
+
+def _print(result: dict) -> None:
+    print(
+        f"Sent {result['statuses_sent']} statuses in {result['messages_sent']} messages, "
+        f"{result['statuses_delivered']} appeared on the API, {result['statuses_lost']} lost, "
+        f"{result['api_duplicates']} duplicated and {result['api_out_of_order']} out of order."
+    )
+    print(f"Max reorder buffer depth {result['max_buffer_depth']}, goodput {result['goodput']} statuses/s.")
+    columns = ("statuses", "count", "p50", "p90", "p99", "p99.9", "max")
+    print_table(
+        columns,
+        [
+            (name, *(result[key]["summary"][c] for c in columns[1:]))
+            for name, key in (
+                ("in order", "in_order_latency"),
+                ("held", "held_latency"),
+                ("from release", "release_latency"),
+            )
+        ],
+    )
+    print("Latencies to the HTTP API in milliseconds.")
+    print_table(
+        ("depth", "gap open s", "survived", "flush s"),
+        [(s["depth"], s["gap_open_s"], s["survived"], s["flush_s"]) for s in result["depths"]],
+    )
+    print(f"Server timeout {result['server_timeout_s']} s, {result['timeout_depth']} statuses at the depth rate.")
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
@@ -0,0 +1,53 @@
+import dataclasses
+import json
+import os
+import time
+from typing import Any, Sequence
+
+from tests._utils.docker import env
+
+
+@dataclasses.dataclass(frozen=True)
+class Metric:
+    """Single value measured by a scenario. Values are lower-is-better, unless stated otherwise."""
+
+    name: str
+    value: float | None
+    higher_is_better: bool = False
+
+
+def image_versions() -> dict[str, str]:
+    """Return the Docker images of the tested services."""
+    return {
+        name: env[name] for name in ("EXTERNAL_SERVER_IMAGE", "FLEET_PROTOCOL_HTTP_API_IMAGE") if name in env
+    }
+
+
+def write_json(path: str, scenario: str, result: dict[str, Any]) -> None:
+    """Write the scenario result together with the tested images and the time of the run."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = {
+        "scenario": scenario,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "images": image_versions(),
+        "result": result,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Results written to '{path}'.")
+
+
+def print_table(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> None:
+    cells = [[_format(v) for v in row] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(v.rjust(w) for v, w in zip(row, widths)))
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return "-" if value is None else str(value)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+import argparse
+import json
+import timeit
+from typing import Callable
+
+from tests._utils.messages import (
+    CmdResponseType,
+    command_response,
+    command_response_bytes,
+    device_obj,
+    status,
+    status_bytes,
+    status_template,
+)
+
+from benchmarks.report import Metric, print_table, write_json
+
+
+_SESSION_ID = "serialization-session"
+_COUNTER = 123_456
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--number", type=int, default=20000, help="Messages serialized in each timing run.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs of each method (the fastest is kept).")
+    parser.add_argument("--payload-size", type=int, default=64, help="Approximate size of status data in bytes.")
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "serialization", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Time serialization of messages by protobuf and from the cached templates.
+
+    No docker compose stack is needed. Every templated message is first checked to be equal
+    to the message serialized by protobuf.
+    """
+    device = device_obj(module_id=1, device_type=1, role="benchmark", name="Benchmark device", priority=0)
+    payload = {"data": "x" * args.payload_size}
+    payload_bytes = json.dumps(payload).encode()
+    template = status_template(_SESSION_ID, "RUNNING", device)
+    cases: dict[str, tuple[Callable[[], bytes], Callable[[], bytes]]] = {
+        "status (bytes payload)": (
+            lambda: status(_SESSION_ID, "RUNNING", device, _COUNTER, payload_bytes).SerializeToString(),
+            lambda: template.serialize(_COUNTER, payload_bytes),
+        ),
+        "status (dict payload)": (
+            lambda: status(_SESSION_ID, "RUNNING", device, _COUNTER, payload).SerializeToString(),
+            lambda: template.serialize(_COUNTER, payload),
+        ),
+        "status, cache lookup (bytes payload)": (
+            lambda: status(_SESSION_ID, "RUNNING", device, _COUNTER, payload_bytes).SerializeToString(),
+            lambda: status_bytes(_SESSION_ID, "RUNNING", device, _COUNTER, payload_bytes),
+        ),
+        "command response": (
+            lambda: command_response(_SESSION_ID, CmdResponseType.OK, _COUNTER).SerializeToString(),  # type: ignore
+            lambda: command_response_bytes(_SESSION_ID, CmdResponseType.OK, _COUNTER),  # type: ignore
+        ),
+    }
+    results = []
+    for name, (protobuf, templated) in cases.items():
+        if protobuf() != templated():
+            raise AssertionError(f"Templated {name} differs from the protobuf serialization.")
+        protobuf_ns = _time_per_call(protobuf, args.number, args.repeat)
+        templated_ns = _time_per_call(templated, args.number, args.repeat)
+        results.append(
+            {
+                "message": name,
+                "protobuf_ns": protobuf_ns,
+                "template_ns": templated_ns,
+                "speedup": protobuf_ns / templated_ns,
+            }
+        )
+    return {"payload_size": args.payload_size, "messages": results}
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [Metric(f"{r['message']} template (ns)", r["template_ns"]) for r in result["messages"]]
+
+
+def _time_per_call(function: Callable[[], bytes], number: int, repeat: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e9
+
+
+def _print(result: dict) -> None:
+    print_table(
+        ("message", "protobuf ns", "template ns", "speedup"),
+        [(r["message"], r["protobuf_ns"], r["template_ns"], r["speedup"]) for r in result["messages"]],
+    )
@@ -0,0 +1,270 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import concurrent.futures
+import statistics
+import time
+from typing import Callable
+
+from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.environment import RESOURCE_SAMPLING_INTERVAL
+from tests._utils.resources import ResourceSampler
+
+from benchmarks.command_latency import CommandLatencyProbe
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    api_client,
+    car_names,
+    fleet_devices,
+    resource_sampler,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway, fleet_gateways
+from benchmarks.load import drive_commands, drive_statuses
+from benchmarks.report import print_table, write_json
+from benchmarks.status_latency import StatusLatencyProbe
+
+
+_API_WORKERS = 8
+_DEFAULT_RESOURCE_INTERVAL = 5.0
+_SECONDS_PER_HOUR = 3600.0
+_MIN_TREND_CYCLES = 3
+_EXTERNAL_SERVER = "external-server"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=20, help="Number of simulated cars.")
+    parser.add_argument("--devices", type=int, default=1, help="Number of devices per car.")
+    parser.add_argument("--duration", type=float, default=4 * _SECONDS_PER_HOUR, help="Duration in seconds.")
+    parser.add_argument(
+        "--cycle-duration",
+        type=float,
+        default=300.0,
+        help="Seconds of traffic in each connect/status/command/disconnect cycle.",
+    )
+    parser.add_argument("--status-rate", type=float, default=20.0, help="Total status rate (statuses/s).")
+    parser.add_argument("--command-rate", type=float, default=2.0, help="Total command rate (commands/s).")
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--warm-up-cycles", type=int, default=1, help="Cycles excluded from the trend evaluation."
+    )
+    parser.add_argument(
+        "--max-rss-slope",
+        type=float,
+        default=10.0,
+        help="Maximum growth of the External Server RSS in MiB per hour.",
+    )
+    parser.add_argument(
+        "--max-latency-slope",
+        type=float,
+        default=5.0,
+        help="Maximum growth of the p99 status and command latency in ms per hour.",
+    )
+    parser.add_argument("--publishers", type=int, default=2, help="Number of MQTT publishing connections.")
+    add_resource_arguments(parser)
+    parser.set_defaults(resource_interval=RESOURCE_SAMPLING_INTERVAL or _DEFAULT_RESOURCE_INTERVAL)
+    parser.add_argument("--output", help="Path of the JSON result file, rewritten after every cycle.")
+
+
+def run(args: argparse.Namespace) -> int:
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    cycles: list[dict] = []
+
+    def on_cycle(cycle: dict) -> None:
+        cycles.append(cycle)
+        _print_cycle(cycle)
+        if args.output:
+            write_json(args.output, "soak", _result(cycles, args))
+
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        gateways = fleet_gateways(comm_layer, COMPANY, car_names(args.cars), fleet_devices(args.devices))
+        asyncio.run(_run(gateways, api_client(), sampler, args, on_cycle))
+    result = _result(cycles, args)
+    if args.output:
+        write_json(args.output, "soak", result)
+    _print(result)
+    return 0 if result["passed"] else 1
+
+
+def trend(times_h: list[float], values: list[float | None]) -> float | None:
+    """Return slope of the least-squares line fitted to the values per hour.
+
+    Return `None` if there are too few values.
+    """
+    points = [(t, v) for t, v in zip(times_h, values) if v is not None]
+    if len(points) < _MIN_TREND_CYCLES:
+        return None
+    times, ys = zip(*points)
+    if len(set(times)) < 2:
+        return None
+    return statistics.linear_regression(times, ys).slope
+
+
+async def _run(
+    gateways: list[SimulatedGateway],
+    api: ApiClientMock,
+    sampler: ResourceSampler | None,
+    args: argparse.Namespace,
+    on_cycle: Callable[[dict], None],
+) -> None:
+    status_probe = StatusLatencyProbe(api, COMPANY, [g.car for g in gateways])
+    command_probe = CommandLatencyProbe(api, COMPANY)
+    for gateway in gateways:
+        gateway.attach()
+        status_probe.attach(gateway)
+        command_probe.attach(gateway)
+    status_probe.start()
+    started = time.monotonic()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(_API_WORKERS) as executor:
+            cycle = 0
+            while time.monotonic() - started < args.duration:
+                status_probe.reset()
+                command_probe.reset()
+                connected = await _connect(gateways, f"soak-{cycle}", args.connect_timeout)
+                if connected:
+                    deadline = time.monotonic() + args.cycle_duration
+                    await asyncio.gather(
+                        drive_statuses(connected, args.status_rate, deadline, send=status_probe.send),
+                        drive_commands(
+                            connected, api, executor, args.command_rate, deadline, post=command_probe.post
+                        ),
+                    )
+                    await _drain(status_probe, command_probe, args.drain_timeout)
+                for gateway in connected:
+                    gateway.disconnect()
+                on_cycle(
+                    _cycle_result(
+                        cycle,
+                        (time.monotonic() - started) / _SECONDS_PER_HOUR,
+                        len(gateways) - len(connected),
+                        status_probe,
+                        command_probe,
+                        sampler,
+                    )
+                )
+                cycle += 1
+    finally:
+        status_probe.stop()
+        for gateway in gateways:
+            gateway.detach()
+
+
+async def _connect(
+    gateways: list[SimulatedGateway], session_id: str, timeout: float
+) -> list[SimulatedGateway]:
+    """Connect all the gateways and return those that finished the connect sequence.
+
+    The server refuses the new session until the previous one ends (after its `timeout`), so the connect
+    messages are posted again until accepted.
+    """
+    results = await asyncio.gather(
+        *(g.connect(timeout, session_id=session_id, retry_connect=True) for g in gateways),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            print(result)
+    return [g for g, r in zip(gateways, results) if not isinstance(r, BaseException)]
+
+
+async def _drain(
+    status_probe: StatusLatencyProbe, command_probe: CommandLatencyProbe, timeout: float
+) -> None:
+    deadline = time.monotonic() + timeout
+    await asyncio.to_thread(status_probe.wait_for_delivery, timeout)
+    while command_probe.in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+
+def _cycle_result(
+    cycle: int,
+    time_h: float,
+    connect_failures: int,
+    status_probe: StatusLatencyProbe,
+    command_probe: CommandLatencyProbe,
+    sampler: ResourceSampler | None,
+) -> dict:
+    statuses = status_probe.result()
+    commands = command_probe.step_result()
+    return {
+        "cycle": cycle,
+        "time_h": time_h,
+        "connect_failures": connect_failures,
+        "statuses_sent": statuses["statuses_sent"],
+        "statuses_lost": statuses["statuses_lost"],
+        "status_latency_p99_ms": statuses["api_latency"]["summary"]["p99"],
+        "commands_posted": commands["commands_posted"],
+        "commands_lost": commands["commands_lost"],
+        "command_latency_p99_ms": commands["latency"]["summary"]["p99"],
+        "external_server_rss_bytes": (
+            None if sampler is None else sampler.latest(_EXTERNAL_SERVER, "rss_bytes")
+        ),
+    }
+
+
+def _result(cycles: list[dict], args: argparse.Namespace) -> dict:
+    evaluated = cycles[args.warm_up_cycles :]
+    times = [c["time_h"] for c in evaluated]
+    rss = [c["external_server_rss_bytes"] for c in evaluated]
+    rss_slope = trend(times, [None if v is None else v / 2**20 for v in rss])
+    latency_slopes = {
+        key: trend(times, [c[key] for c in evaluated])
+        for key in ("status_latency_p99_ms", "command_latency_p99_ms")
+    }
+    failures = []
+    failed_cycles = [c["cycle"] for c in cycles if c["connect_failures"]]
+    if failed_cycles:
+        failures.append(f"Cars failed to connect in cycles {', '.join(map(str, failed_cycles))}.")
+    if rss_slope is not None and rss_slope > args.max_rss_slope:
+        failures.append(f"External Server RSS grows by {rss_slope:.2f} MiB/h (limit {args.max_rss_slope}).")
+    for key, slope in latency_slopes.items():
+        if slope is not None and slope > args.max_latency_slope:
+            failures.append(f"{key} grows by {slope:.2f} ms/h (limit {args.max_latency_slope}).")
+    return {
+        "cars": args.cars,
+        "devices_per_car": args.devices,
+        "status_rate": args.status_rate,
+        "command_rate": args.command_rate,
+        "cycles": cycles,
+        "statuses_lost": sum(c["statuses_lost"] for c in cycles),
+        "commands_lost": sum(c["commands_lost"] for c in cycles),
+        "connect_failures": sum(c["connect_failures"] for c in cycles),
+        "rss_slope_mib_per_h": rss_slope,
+        "status_latency_p99_slope_ms_per_h": latency_slopes["status_latency_p99_ms"],
+        "command_latency_p99_slope_ms_per_h": latency_slopes["command_latency_p99_ms"],
+        "failures": failures,
+        "passed": not failures,
+    }
+
+
+def _print_cycle(cycle: dict) -> None:
+    rss = cycle["external_server_rss_bytes"]
+    print(
+        f"Cycle {cycle['cycle']} ({cycle['time_h']:.2f} h): "
+        f"status p99 {cycle['status_latency_p99_ms']} ms, command p99 {cycle['command_latency_p99_ms']} ms, "
+        f"lost {cycle['statuses_lost']} statuses and {cycle['commands_lost']} commands, "
+        f"RSS {'-' if rss is None else f'{rss / 2**20:.1f} MiB'}"
+    )
+
+
+def _print(result: dict) -> None:
+    print_table(
+        ("trend", "slope per hour"),
+        [
+            ("External Server RSS (MiB)", result["rss_slope_mib_per_h"]),
+            ("status latency p99 (ms)", result["status_latency_p99_slope_ms_per_h"]),
+            ("command latency p99 (ms)", result["command_latency_p99_slope_ms_per_h"]),
+        ],
+    )
+    print(
+        f"Lost {result['statuses_lost']} statuses and {result['commands_lost']} commands, "
+        f"{result['connect_failures']} failed connects."
+    )
+    for failure in result["failures"]:
+        print(f"FAILED: {failure}")
+    print("Soak test passed." if result["passed"] else "Soak test failed.")
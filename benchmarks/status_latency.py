@@ -0,0 +1,252 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import threading
+import time
+
+from tests._utils import database
+from tests._utils.api_client_mock import ApiClientMock, ApiException
+from tests._utils.messages import Device, Message, _ExternalServerMsg
+
+from benchmarks.fleet import (
+    COMPANY,
+    add_resource_arguments,
+    api_client,
+    car_names,
+    fleet_devices,
+    resource_sampler,
+    resource_series,
+    running_stack,
+    write_fleet_config,
+)
+from benchmarks.gateway import SimulatedGateway, fleet_gateways
+from benchmarks.histogram import LatencyHistogram
+from benchmarks.load import drive_statuses
+from benchmarks.report import Metric, print_table, write_json
+
+
+# pause after a failed request, so that failing requests do not spin
+_ERROR_PAUSE = 1.0
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--cars", type=int, default=5, help="Number of simulated cars.")
+    parser.add_argument("--devices", type=int, default=1, help="Number of devices per car.")
+    parser.add_argument("--rate", type=float, default=100.0, help="Total status rate (statuses/s).")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duration of the measurement in seconds.")
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=10.0,
+        help="Time to wait for the last statuses to appear on the API before counting them as lost.",
+    )
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument("--publishers", type=int, default=2, help="Number of MQTT publishing connections.")
+    parser.add_argument(
+        "--verify-database",
+        action="store_true",
+        help="Count and order-check the delivered statuses directly in the HTTP API database.",
+    )
+    add_resource_arguments(parser)
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    result = measure(args)
+    _print(result)
+    if args.output:
+        write_json(args.output, "status_latency", result)
+    return 0
+
+
+def measure(args: argparse.Namespace) -> dict:
+    """Run the scenario and return its result."""
+    config_name = write_fleet_config(args.cars)
+    sampler = resource_sampler(args.resource_interval)
+    with running_stack(config_name, publishers=args.publishers, sampler=sampler) as comm_layer:
+        gateways = fleet_gateways(comm_layer, COMPANY, car_names(args.cars), fleet_devices(args.devices))
+        probe = StatusLatencyProbe(api_client(), COMPANY, [g.car for g in gateways])
+        started = int(time.time() * 1000)
+        asyncio.run(_run(gateways, probe, args))
+        stored = _verify_database(started) if args.verify_database else {}
+    return {
+        "cars": args.cars,
+        "devices_per_car": args.devices,
+        "status_rate": args.rate,
+        "duration_s": args.duration,
+    } | probe.result() | stored | resource_series(sampler)
+
+
+def metrics(result: dict) -> list[Metric]:
+    """Return the metrics compared between runs of the scenario."""
+    return [
+        Metric(f"{path} {p}", result[key]["summary"][p])
+        for path, key in (("status response", "status_response_latency"), ("API", "api_latency"))
+        for p in ("p50", "p99")
+    ] + [Metric("statuses lost", result["statuses_lost"])]
+
+
+class StatusLatencyProbe:
+    """Measure the latency of statuses on their way from the module gateway to the HTTP API.
+
+    Every status sent through the probe carries a sequence number and the `time.monotonic()` time
+    of its sending in its payload. The probe streams the API statuses of each car (see
+    `ApiClientMock.stream_statuses`) in a separate thread and records the time from sending to
+    the status appearing on the API. The time to the status response sent by the External Server
+    is recorded separately.
+    """
+
+    def __init__(self, api: ApiClientMock, company: str, cars: list[str]) -> None:
+        self._api = api
+        self._company = company
+        self._cars = cars
+        self._next_seq = 0
+        self._first_seq = 0
+        self._sent = 0
+        self._pending_responses: dict[tuple[str, int], float] = {}
+        self._delivered: set[int] = set()
+        self._delivered_changed = threading.Condition()
+        self._stopped = threading.Event()
+        self._pollers: list[threading.Thread] = []
+        self.api_latency = LatencyHistogram()
+        self.status_response_latency = LatencyHistogram()
+
+    def start(self) -> None:
+        """Start long-polling statuses of all the cars newer than the current time."""
+        since = int(time.time() * 1000)
+        self._stopped.clear()
+        self._pollers = [
+            threading.Thread(target=self._poll, args=(car, since), daemon=True) for car in self._cars
+        ]
+        for poller in self._pollers:
+            poller.start()
+
+    def stop(self) -> None:
+        """Stop polling. Requests in progress are abandoned to their daemon threads."""
+        self._stopped.set()
+
+    def reset(self) -> None:
+        """Start a new measurement. Statuses sent before are no longer counted."""
+        with self._delivered_changed:
+            self._first_seq = self._next_seq
+            self._sent = 0
+            self._pending_responses.clear()
+            self._delivered.clear()
+            self.api_latency = LatencyHistogram()
+            self.status_response_latency = LatencyHistogram()
+
+    def attach(self, gateway: SimulatedGateway) -> None:
+        """Record status responses received by the gateway."""
+        gateway.on_status_response = lambda msg, received_at, car=gateway.car: self._on_status_response(
+            car, msg, received_at
+        )
+
+    def send(self, gateway: SimulatedGateway, device: Device) -> None:
+        """Send a status of the device stamped with the sequence number and sending time."""
+        seq = self._next_seq
+        self._next_seq += 1
+        sent_at = time.monotonic()
+        counter = gateway.send_status(device, {"seq": seq, "sent": sent_at})
+        self._pending_responses[(gateway.car, counter)] = sent_at
+        self._sent += 1
+
+    def wait_for_delivery(self, timeout: float) -> bool:
+        """Wait until all the sent statuses appear on the API. Return `False` on timeout."""
+        with self._delivered_changed:
+            return self._delivered_changed.wait_for(lambda: len(self._delivered) >= self._sent, timeout)
+
+    def result(self) -> dict:
+        with self._delivered_changed:
+            delivered = len(self._delivered)
+        return {
+            "statuses_sent": self._sent,
+            "statuses_delivered": delivered,
+            "statuses_lost": self._sent - delivered,
+            "status_responses_missing": len(self._pending_responses),
+            "api_latency": self.api_latency.to_dict(),
+            "status_response_latency": self.status_response_latency.to_dict(),
+        }
+
+    def _on_status_response(self, car: str, msg: _ExternalServerMsg, received_at: float) -> None:
+        sent_at = self._pending_responses.pop((car, msg.statusResponse.messageCounter), None)
+        if sent_at is not None:
+            self.status_response_latency.record(received_at - sent_at)
+
+    def _poll(self, car: str, since: int) -> None:
+        while not self._stopped.is_set():
+            try:
+                for statuses in self._api.stream_statuses(self._company, car, since=since):
+                    if self._stopped.is_set():
+                        return
+                    self._record(statuses, time.monotonic())
+                    since = max([since, *(message.timestamp for message in statuses)])
+            except ApiException as e:
+                print(f"Polling statuses of car '{car}' failed: {e}")
+                time.sleep(_ERROR_PAUSE)
+
+    def _record(self, statuses: list[Message], received_at: float) -> None:
+        with self._delivered_changed:
+            for message in statuses:
+                data = message.payload.data.to_dict()
+                seq = data.get("seq")
+                if seq is None or seq < self._first_seq or seq in self._delivered:
+                    continue
+                self._delivered.add(seq)
+                self.api_latency.record(received_at - data["sent"])
+            self._delivered_changed.notify_all()
+
+
+async def _run(gateways: list[SimulatedGateway], probe: StatusLatencyProbe, args: argparse.Namespace) -> None:
+    for gateway in gateways:
+        gateway.attach()
+        probe.attach(gateway)
+    try:
+        await asyncio.gather(*(g.connect(args.connect_timeout) for g in gateways))
+        probe.start()
+        deadline = time.monotonic() + args.duration
+        await drive_statuses(gateways, args.rate, deadline, send=probe.send)
+        if not await asyncio.to_thread(probe.wait_for_delivery, args.drain_timeout):
+            print(f"Not all statuses appeared on the API within {args.drain_timeout} s.")
+    finally:
+        probe.stop()
+        for gateway in gateways:
+            gateway.detach()
+
+
+def _verify_database(since: int) -> dict:
+    """Return the number of the probe's statuses stored by the HTTP API, out of order and duplicated.
+
+    The statuses stored since `since` (in milliseconds) include the CONNECTING statuses of the connect
+    sequences. They are excluded from the counts only because they carry no sequence number.
+    """
+    with database.connect() as connection:
+        devices = list(database.delivered_messages(connection, COMPANY, "STATUS", since=since))
+    return {
+        "database": {
+            "statuses": sum(d.sequenced for d in devices),
+            "out_of_order": sum(d.out_of_order for d in devices),
+            "duplicates": sum(d.duplicates for d in devices),
+        }
+    }
+
+
+def _print(result: dict) -> None:
+    print(
+        f"Sent {result['statuses_sent']} statuses, {result['statuses_delivered']} appeared on the API, "
+        f"{result['statuses_lost']} lost."
+    )
+    columns = ("path", "count", "min", "mean", "p50", "p90", "p99", "p99.9", "max")
+    print_table(
+        columns,
+        [
+            (name, *(result[key]["summary"][c] for c in columns[1:]))
+            for name, key in (("status response", "status_response_latency"), ("HTTP API", "api_latency"))
+        ],
+    )
+    print("Latencies in milliseconds.")
+    if "database" in result:
+        db = result["database"]
+        print(
+            f"Database: {db['statuses']} statuses stored, {db['out_of_order']} out of order, "
+            f"{db['duplicates']} duplicated."
+        )
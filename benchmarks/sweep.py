@@ -0,0 +1,235 @@
+from __future__ import annotations
+import argparse
+import copy
+import itertools
+import random
+import shlex
+import statistics
+from types import ModuleType
+
+from benchmarks import burst, command_drain, command_latency, load, status_latency
+from benchmarks.fleet import load_config, use_config_template, write_config
+from benchmarks.report import Metric, print_table, write_json
+
+
+_SCENARIOS: dict[str, ModuleType] = {
+    "command_latency": command_latency,
+    "command_drain": command_drain,
+    "status_latency": status_latency,
+    "load": load,
+    "burst": burst,
+}
+# rate limits in the config of every External Server module, stored as strings
+MODULE_PARAMETERS = (
+    "max_requests_threshold_count",
+    "max_requests_threshold_period_ms",
+    "delay_after_threshold_reached_ms",
+    "retry_requests_delay_ms",
+)
+# top-level External Server settings in seconds
+SERVER_PARAMETERS = ("timeout", "mqtt_timeout")
+_TEMPLATE = "config.json"
+_VARIANT_CONFIG_NAME = "sweep/variant_{:03d}"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    for name in MODULE_PARAMETERS + SERVER_PARAMETERS:
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            dest=name,
+            type=_int_list,
+            help=f"Comma-separated values of '{name}'. The value of the config is kept if not given.",
+        )
+    parser.add_argument(
+        "--modules",
+        type=lambda value: [v for v in value.split(",") if v],
+        help="Comma-separated ids of the modules whose rate limits are swept, all the modules by default.",
+    )
+    parser.add_argument(
+        "--search",
+        choices=("grid", "random"),
+        default="grid",
+        help="Run every combination of the values or random variants drawn from the ranges of the values.",
+    )
+    parser.add_argument("--samples", type=int, default=10, help="Number of variants of the random search.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random search.")
+    parser.add_argument(
+        "--scenario",
+        choices=list(_SCENARIOS),
+        default="command_latency",
+        help="Scenario run as the load profile against every variant.",
+    )
+    parser.add_argument(
+        "--scenario-args",
+        default="",
+        help="Options passed to the scenario, e.g. --scenario-args '--cars 10 --rates 50,200'.",
+    )
+    parser.add_argument("--repetitions", type=int, default=1, help="Runs of the scenario per variant.")
+    parser.add_argument("--output", help="Path of the JSON result file.")
+
+
+def run(args: argparse.Namespace) -> int:
+    values = {name: getattr(args, name) for name in MODULE_PARAMETERS + SERVER_PARAMETERS if getattr(args, name)}
+    if not values:
+        print("No parameter to sweep, give values of at least one of the parameters.")
+        return 2
+    if args.search == "grid":
+        variants = grid_variants(values)
+    else:
+        variants = random_variants(values, args.samples, random.Random(args.seed))
+    results = sweep(variants, _SCENARIOS[args.scenario], _scenario_namespace(args), args.modules, args.repetitions)
+    surfaces = metric_surfaces(results, list(values))
+    _print(results, surfaces, list(values))
+    if args.output:
+        write_json(
+            args.output,
+            "sweep",
+            {
+                "scenario": args.scenario,
+                "scenario_args": args.scenario_args,
+                "search": args.search,
+                "repetitions": args.repetitions,
+                "variants": results,
+                "surfaces": surfaces,
+            },
+        )
+    return 0
+
+
+def grid_variants(values: dict[str, list[int]]) -> list[dict[str, int]]:
+    """Return every combination of the values of the parameters."""
+    return [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+
+
+def random_variants(values: dict[str, list[int]], samples: int, rng: random.Random) -> list[dict[str, int]]:
+    """Return `samples` variants with every parameter drawn uniformly from the range of its values."""
+    return [{name: rng.randint(min(v), max(v)) for name, v in values.items()} for _ in range(samples)]
+
+
+def variant_config(template: dict, parameters: dict[str, int], modules: list[str] | None = None) -> dict:
+    """Return copy of the External Server config with the `parameters` set.
+
+    The rate limits are set for the `modules` (given by their ids) or for all the modules if `None`.
+    """
+    config = copy.deepcopy(template)
+    for name, value in parameters.items():
+        if name in SERVER_PARAMETERS:
+            config[name] = value
+            continue
+        for module_id, module in config["common_modules"].items():
+            if modules is None or module_id in modules:
+                module["config"][name] = str(value)
+    return config
+
+
+def sweep(
+    variants: list[dict[str, int]],
+    scenario: ModuleType,
+    scenario_args: argparse.Namespace,
+    modules: list[str] | None,
+    repetitions: int,
+) -> list[dict]:
+    """Run the scenario against every variant of the config and return the mean metrics of every variant.
+
+    A failing run is recorded with its error and the sweep continues with the next run.
+    """
+    template = load_config(_TEMPLATE)
+    results = []
+    try:
+        for i, parameters in enumerate(variants):
+            config_name = write_config(variant_config(template, parameters, modules), _VARIANT_CONFIG_NAME.format(i))
+            use_config_template(config_name)
+            samples: dict[str, list[float]] = {}
+            higher_is_better: dict[str, bool] = {}
+            errors = []
+            for r in range(repetitions):
+                print(f"Variant {i + 1}/{len(variants)} {_format_parameters(parameters)}: run {r + 1}/{repetitions}")
+                try:
+                    result = scenario.measure(scenario_args)
+                except Exception as e:
+                    print(f"Run failed: {e!r}")
+                    errors.append(repr(e))
+                    continue
+                for metric in scenario.metrics(result):
+                    if metric.value is not None:
+                        samples.setdefault(metric.name, []).append(metric.value)
+                        higher_is_better[metric.name] = metric.higher_is_better
+            results.append(
+                {
+                    "parameters": parameters,
+                    "config": config_name,
+                    "failed_runs": len(errors),
+                    "errors": errors,
+                    "metrics": {name: statistics.mean(values) for name, values in samples.items()}
+                    | {"failed runs": len(errors)},
+                    "higher_is_better": higher_is_better | {"failed runs": False},
+                }
+            )
+    finally:
+        use_config_template(_TEMPLATE)
+    return results
+
+
+def metric_surfaces(results: list[dict], parameters: list[str]) -> dict[str, dict]:
+    """Return the mean of every metric over the variants sharing the value of each parameter.
+
+    The best variant of every metric is returned alongside by its index.
+    """
+    metrics: dict[str, Metric] = {}
+    for result in results:
+        for name, higher in result["higher_is_better"].items():
+            metrics[name] = Metric(name, None, higher)
+    surfaces = {}
+    for name, metric in metrics.items():
+        measured = [(i, r) for i, r in enumerate(results) if name in r["metrics"]]
+        if not measured:
+            continue
+        best = (max if metric.higher_is_better else min)(measured, key=lambda m: m[1]["metrics"][name])[0]
+        by_parameter = {}
+        for parameter in parameters:
+            by_value: dict[int, list[float]] = {}
+            for _, result in measured:
+                by_value.setdefault(result["parameters"][parameter], []).append(result["metrics"][name])
+            by_parameter[parameter] = {value: statistics.mean(v) for value, v in sorted(by_value.items())}
+        surfaces[name] = {
+            "higher_is_better": metric.higher_is_better,
+            "best_variant": best,
+            "by_parameter": by_parameter,
+        }
+    return surfaces
+
+
+def _scenario_namespace(args: argparse.Namespace) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=args.scenario)
+    _SCENARIOS[args.scenario].add_arguments(parser)
+    namespace = parser.parse_args(shlex.split(args.scenario_args))
+    namespace.output = None
+    return namespace
+
+
+def _format_parameters(parameters: dict[str, int]) -> str:
+    return ", ".join(f"{name}={value}" for name, value in parameters.items())
+
+
+def _print(results: list[dict], surfaces: dict[str, dict], parameters: list[str]) -> None:
+    print_table(
+        ("variant", *parameters, "failed runs"),
+        [(i, *(r["parameters"][p] for p in parameters), r["failed_runs"]) for i, r in enumerate(results)],
+    )
+    print()
+    print_table(
+        ("metric", "best variant", "value", *parameters),
+        [
+            (
+                name,
+                surface["best_variant"],
+                results[surface["best_variant"]]["metrics"][name],
+                *(results[surface["best_variant"]]["parameters"][p] for p in parameters),
+            )
+            for name, surface in surfaces.items()
+        ],
+    )
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
@@ -1,23 +1,48 @@
+import argparse
+import glob
 import os
+import socket
+import subprocess
 import sys
 import unittest
 
+from tests._utils.docker import stack
+
 
 TEST_DIR_NAME = "tests"
 TEST_FILE_NAME_PATTERN = "test_*.py"
+# host ports of the workers are allocated in consecutive blocks below the usual ephemeral port range
+_WORKER_PORT_BASE = 20000
+_PORTS_PER_WORKER = 3
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python3 -m tests")
+    parser.add_argument("paths", nargs="*", help="Test directories or files relative to the tests folder.")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes, each running its own docker compose stack and test broker.",
+    )
+    return parser.parse_args()
 
 
-def _run_tests(show_test_names: bool = True) -> None:
-    possible_paths = [os.path.join(TEST_DIR_NAME, path) for path in sys.argv[1:]]
+def _existing_paths(relative_paths: list[str]) -> list[str]:
+    possible_paths = [os.path.join(TEST_DIR_NAME, path) for path in relative_paths]
     if not possible_paths:
-        paths = [TEST_DIR_NAME]
-    else:
-        paths = []
-        for path in possible_paths:
-            if os.path.exists(path):
-                paths.append(path)
-            else:
-                print(f"Path '{path}' does not exist. Skipping.")
+        return [TEST_DIR_NAME]
+    paths = []
+    for path in possible_paths:
+        if os.path.exists(path):
+            paths.append(path)
+        else:
+            print(f"Path '{path}' does not exist. Skipping.")
+    return paths
+
+
+def _run_tests(paths: list[str], show_test_names: bool = True) -> bool:
     suite = unittest.TestSuite()
     for path in paths:
         if os.path.isfile(path):
@@ -28,8 +53,95 @@ def _run_tests(show_test_names: bool = True) -> None:
             pattern, dir = TEST_FILE_NAME_PATTERN, path
         suite.addTests(unittest.TestLoader().discover(dir, pattern=pattern))
     verbosity = 2 if show_test_names else 1
-    unittest.TextTestRunner(verbosity=verbosity, buffer=True).run(suite)
+    result = unittest.TextTestRunner(verbosity=verbosity, buffer=True).run(suite)
+    return result.wasSuccessful()
+
+
+def _test_modules(paths: list[str]) -> list[str]:
+    """Return paths of all test modules in the `paths` relative to the tests folder."""
+    modules: list[str] = []
+    for path in paths:
+        if os.path.isfile(path):
+            found = [path]
+        else:
+            found = sorted(glob.glob(os.path.join(path, "**", TEST_FILE_NAME_PATTERN), recursive=True))
+        modules.extend(os.path.relpath(m, TEST_DIR_NAME) for m in found if m.endswith(".py"))
+    return list(dict.fromkeys(modules))
+
+
+def _worker_ports(worker: int) -> list[int]:
+    """Return the host ports of the MQTT broker, the HTTP API and the database of the worker.
+
+    Every worker index has its own block of ports, so the workers started in parallel never pick
+    the same port. Raise `RuntimeError` if any of the ports is already in use.
+    """
+    first = _WORKER_PORT_BASE + worker * _PORTS_PER_WORKER
+    ports = list(range(first, first + _PORTS_PER_WORKER))
+    busy = [port for port in ports if not _is_free(port)]
+    if busy:
+        raise RuntimeError(f"Host ports of worker {worker} already in use: {', '.join(map(str, busy))}.")
+    return ports
+
+
+def _is_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # connections of a previous run left in TIME_WAIT do not block the servers
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+def _worker_env(worker: int) -> dict[str, str]:
+    """Return environment of a worker process with its own docker compose project and host ports."""
+    env = os.environ.copy()
+    mqtt_port, http_api_port, postgres_port = _worker_ports(worker)
+    env.update(
+        {
+            "COMPOSE_PROJECT_NAME": f"external-server-test-{worker}",
+            "NETWORK_NAME": f"external-server-test-{worker}",
+            "LOG_DIR": f"./log/worker-{worker}",
+            "MQTT_BROKER_PORT": str(mqtt_port),
+            "HTTP_API_PORT": str(http_api_port),
+            "POSTGRES_PORT": str(postgres_port),
+        }
+    )
+    return env
+
+
+def _run_tests_in_parallel(paths: list[str], jobs: int) -> bool:
+    """Shard the test modules across `jobs` worker processes and run them concurrently."""
+    modules = _test_modules(paths)
+    shards = [modules[i::jobs] for i in range(jobs)]
+    # the environments (and the ports) of all the workers are prepared before any of them starts
+    envs = {worker: _worker_env(worker) for worker, shard in enumerate(shards) if shard}
+    workers: list[tuple[list[str], subprocess.Popen]] = []
+    for worker, env in envs.items():
+        process = subprocess.Popen(
+            [sys.executable, "-m", TEST_DIR_NAME, *shards[worker]],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        workers.append((shards[worker], process))
+    success = True
+    for worker, (shard, process) in enumerate(workers):
+        output, _ = process.communicate()
+        print(f"===== Worker {worker}: {', '.join(shard)} =====")
+        print(output)
+        success = success and process.returncode == 0
+    return success
 
 
 if __name__ == "__main__":
-    _run_tests()
+    args = _parse_args()
+    paths = _existing_paths(args.paths)
+    stack.prepare_images()
+    if args.jobs > 1:
+        success = _run_tests_in_parallel(paths, args.jobs)
+    else:
+        success = _run_tests(paths)
+    sys.exit(0 if success else 1)
@@ -1,4 +1,7 @@
+import collections
 import sys
+import time
+from typing import Iterator
 
 sys.path.append("lib/fleet-protocol/protobuf/compiled/python")
 
@@ -12,6 +15,9 @@ from fleet_http_client_python import (  # type: ignore
 )
 
 
+_REPEATED_POLL_PAUSE = 0.05
+
+
 class ApiClientMock:
 
     def __init__(self, host: str, api_key: str) -> None:
@@ -43,3 +49,41 @@ class ApiClientMock:
         except Exception as e:
             print(f"Error: {e}")
             return []
+
+    def stream_statuses(self, company: str, car: str, since: int = 0) -> Iterator[list[Message]]:
+        """Long-poll statuses of the car and yield the list of new statuses after every request.
+
+        Only the statuses not yielded before are requested, starting at the timestamp (in milliseconds)
+        of the newest status received so far (the high-water mark). The statuses of every response are
+        sorted by their timestamps. The `since` query parameter is inclusive, so the statuses with
+        the high-water timestamp are returned again and are skipped. The high-water mark is never moved
+        past the newest timestamp received, so that statuses stored later with the same timestamp are
+        not missed. When a request returns no new status, the next one is sent after a short pause.
+
+        The yielded list is empty if the request ended without new statuses (e.g., by timeout of
+        the long-poll), so that the consumer can stop. `ApiException` raised by the API is not caught.
+        """
+        high_water = since
+        # number of yielded statuses of each content with the high-water timestamp
+        yielded_at_high_water: collections.Counter[str] = collections.Counter()
+        while True:
+            response = self._message_api.list_statuses(
+                company_name=company, car_name=car, since=high_water, wait=True
+            )
+            statuses = sorted(response, key=lambda message: message.timestamp)
+            new_statuses = []
+            returned_at_high_water: collections.Counter[str] = collections.Counter()
+            for message in statuses:
+                key = message.to_json()
+                if message.timestamp > high_water:
+                    high_water = message.timestamp
+                    yielded_at_high_water.clear()
+                    returned_at_high_water.clear()
+                returned_at_high_water[key] += 1
+                if returned_at_high_water[key] > yielded_at_high_water[key]:
+                    yielded_at_high_water[key] += 1
+                    new_statuses.append(message)
+            if statuses and not new_statuses:
+                # the long-poll returns the statuses with the high-water timestamp at once
+                time.sleep(_REPEATED_POLL_PAUSE)
+            yield new_statuses
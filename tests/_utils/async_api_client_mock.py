@@ -0,0 +1,97 @@
+from __future__ import annotations
+import sys
+import urllib.parse
+from types import TracebackType
+
+import httpx
+
+sys.path.append("lib/fleet-protocol/protobuf/compiled/python")
+
+
+from fleet_http_client_python import Message  # type: ignore
+
+
+_DEFAULT_MAX_CONNECTIONS = 10
+# long-polling requests are held by the API for up to its request timeout
+_DEFAULT_TIMEOUT = 60.0
+
+
+class AsyncApiClientMock:
+    """asyncio variant of the `ApiClientMock` sharing a bounded pool of keep-alive connections.
+
+    Requests of all the cars are sent over at most `max_connections` connections. Requests exceeding
+    the limit wait for a free connection instead of failing. With HTTP/1.1, each long-polling request
+    (`get_statuses` with `wait=True`) occupies its connection until it returns, so the pool must be
+    large enough for the concurrent long-polls. With `http2=True` (requires the `h2` package and
+    an HTTP API accepting HTTP/2), requests are multiplexed as streams over the connections.
+
+    Use as an async context manager or call `aclose` when done.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        api_key: str,
+        max_connections: int = _DEFAULT_MAX_CONNECTIONS,
+        timeout: float = _DEFAULT_TIMEOUT,
+        http2: bool = False,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=host.rstrip("/"),
+            params={"api_key": api_key},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, pool=None),
+            http2=http2,
+        )
+
+    async def __aenter__(self) -> AsyncApiClientMock:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def post_commands(self, company: str, car: str, *commands: Message) -> None:
+        """Post list of commands to the API.
+
+        Raise `httpx.HTTPStatusError` if the API rejects the commands.
+        """
+        response = await self._client.post(_path("command", company, car), json=_to_json(commands))
+        response.raise_for_status()
+
+    async def post_statuses(self, company: str, car: str, *statuses: Message) -> None:
+        """Post list of statuses to the API.
+
+        Raise `httpx.HTTPStatusError` if the API rejects the statuses.
+        """
+        response = await self._client.post(_path("status", company, car), json=_to_json(statuses))
+        response.raise_for_status()
+
+    async def get_statuses(
+        self, company: str, car: str, since: int = 0, wait: bool = False
+    ) -> list[Message]:
+        """Return list of statuses from the API inclusively newer than `since` timestamp (in milliseconds).
+
+        Raise `httpx.HTTPStatusError` if the API rejects the request and `httpx.HTTPError` if it fails,
+        so that a failed request is not mistaken for a car without statuses.
+        """
+        response = await self._client.get(
+            _path("status", company, car), params={"since": since, "wait": wait}
+        )
+        response.raise_for_status()
+        return [Message.from_dict(item) for item in response.json()]
+
+
+def _path(endpoint: str, company: str, car: str) -> str:
+    return f"/{endpoint}/{urllib.parse.quote(company, safe='')}/{urllib.parse.quote(car, safe='')}"
+
+
+def _to_json(messages: tuple[Message, ...]) -> list[dict]:
+    return [message.to_dict() for message in messages]
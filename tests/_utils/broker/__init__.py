@@ -1 +1,2 @@
 from .mqtt_test_broker import MQTTBrokerTest
+from .publisher import wait_for_puback
@@ -1,5 +1,12 @@
-import mqtt_test_broker  # type: ignore
+import time
+
+from tests._utils.broker import MQTTBrokerTest
 
 
 if __name__ == "__main__":
-    broker = mqtt_test_broker.MQTTBrokerTest(start=True)
+    broker = MQTTBrokerTest(start=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,419 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import struct
+import threading
+from typing import Callable
+
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+_MQTT_V5 = 5
+_SUPPORTED_PROTOCOL_LEVELS = (3, 4, _MQTT_V5)
+_CONNACK_UNACCEPTABLE_PROTOCOL = 0x01
+_CONNECT_TIMEOUT = 10.0
+
+
+SubscribeCallback = Callable[[str, str], None]
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class EmbeddedBroker:
+    """In-process MQTT 3.1.1 and 5 broker running on an asyncio event loop.
+
+    The broker supports QoS 0, 1 and 2, retained messages, will messages, wildcard subscriptions
+    and session takeover. Sessions are never persisted - every client starts with a clean session.
+
+    The broker runs either in a background thread (`start` and `stop`) or in the current event loop (`serve`).
+    The `on_subscribe` callback is called with the client ID and the topic filter for each subscription.
+    """
+
+    def __init__(
+        self, host: str = "0.0.0.0", port: int = 1883, on_subscribe: SubscribeCallback | None = None
+    ) -> None:
+        self._host = host
+        self._port = port
+        self._on_subscribe = on_subscribe
+        self._clients: dict[str, _Client] = {}
+        self._retained: dict[str, tuple[bytes, int]] = {}
+        self._routes: dict[str, list[tuple[_Client, int]]] = {}
+        self._handlers: set[asyncio.Task] = set()
+        self._client_ids = itertools.count(1)
+        self._server: asyncio.AbstractServer | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, timeout: float = 5.0) -> None:
+        """Start the broker in a background thread and return as soon as it accepts connections."""
+        if self.is_running:
+            return
+        loop = asyncio.new_event_loop()
+        listening = threading.Event()
+        errors: list[BaseException] = []
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self._listen())
+            except OSError as e:
+                errors.append(e)
+                listening.set()
+                loop.close()
+                return
+            listening.set()
+            loop.run_forever()
+            loop.run_until_complete(self._close())
+            loop.close()
+
+        self._loop = loop
+        self._thread = threading.Thread(target=run, name=f"mqtt-broker-{self._port}", daemon=True)
+        self._thread.start()
+        if not listening.wait(timeout):
+            raise TimeoutError(f"Embedded broker did not start within {timeout} s.")
+        if errors:
+            self._thread.join()
+            self._thread, self._loop = None, None
+            raise errors[0]
+
+    def stop(self) -> None:
+        """Close all the client connections and stop the broker thread."""
+        if self._thread is None or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread, self._loop = None, None
+
+    async def serve(self) -> None:
+        """Run the broker in the current event loop until cancelled."""
+        await self._listen()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self._close()
+
+    async def _listen(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self._host, self._port, reuse_address=True
+        )
+
+    async def _close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for client in list(self._clients.values()):
+            client.close()
+        for task in list(self._handlers):
+            task.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        self._clients.clear()
+        self._routes.clear()
+        self._retained.clear()
+        self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._handlers.add(task)
+        client: _Client | None = None
+        try:
+            packet_type, _, body = await asyncio.wait_for(_read_packet(reader), _CONNECT_TIMEOUT)
+            if packet_type != CONNECT:
+                raise ProtocolError("First packet must be CONNECT.")
+            client = self._connect(_Reader(body), writer)
+            if client is None:
+                return
+            timeout = client.keepalive * 1.5 if client.keepalive else None
+            while True:
+                packet_type, flags, body = await asyncio.wait_for(_read_packet(reader), timeout)
+                if packet_type == DISCONNECT:
+                    client.will = None
+                    break
+                self._handle_packet(client, packet_type, flags, _Reader(body))
+                if writer.transport.get_write_buffer_size() > _Client.HIGH_WATER_MARK:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ProtocolError):
+            pass
+        except asyncio.CancelledError:
+            client = None
+        finally:
+            if client is not None:
+                self._disconnect(client)
+            writer.close()
+            self._handlers.discard(task)
+
+    def _connect(self, r: _Reader, writer: asyncio.StreamWriter) -> _Client | None:
+        r.string()  # protocol name
+        level = r.u8()
+        if level not in _SUPPORTED_PROTOCOL_LEVELS:
+            writer.write(bytes([CONNACK << 4, 2, 0, _CONNACK_UNACCEPTABLE_PROTOCOL]))
+            return None
+        flags = r.u8()
+        keepalive = r.u16()
+        if level == _MQTT_V5:
+            r.properties()
+        client_id = r.string() or f"embedded-broker-client-{next(self._client_ids)}"
+        client = _Client(client_id, writer, level, keepalive)
+        if flags & 0x04:
+            if level == _MQTT_V5:
+                r.properties()
+            will_topic = r.string()
+            will_payload = r.binary()
+            client.will = (will_topic, will_payload, (flags >> 3) & 0x03, bool(flags & 0x20))
+        previous = self._clients.get(client_id)
+        if previous is not None:
+            # session takeover, the previous connection is closed without publishing its will
+            previous.will = None
+            self._disconnect(previous)
+            previous.close()
+        self._clients[client_id] = client
+        if level == _MQTT_V5:
+            client.write(CONNACK << 4, bytes([0, 0, 0]))
+        else:
+            client.write(CONNACK << 4, bytes([0, 0]))
+        return client
+
+    def _disconnect(self, client: _Client) -> None:
+        if self._clients.get(client.client_id) is not client:
+            return
+        del self._clients[client.client_id]
+        if client.subscriptions:
+            self._routes.clear()
+        if client.will is not None:
+            topic, payload, qos, retain = client.will
+            client.will = None
+            self._publish(topic, payload, qos, retain)
+
+    def _handle_packet(self, client: _Client, packet_type: int, flags: int, r: _Reader) -> None:
+        if packet_type == PUBLISH:
+            self._handle_publish(client, flags, r)
+        elif packet_type == PUBREL:
+            packet_id = r.u16()
+            client.awaiting_release.discard(packet_id)
+            client.write(PUBCOMP << 4, struct.pack("!H", packet_id))
+        elif packet_type == PUBREC:
+            client.write(PUBREL << 4 | 0x02, struct.pack("!H", r.u16()))
+        elif packet_type in (PUBACK, PUBCOMP):
+            pass
+        elif packet_type == SUBSCRIBE:
+            self._handle_subscribe(client, r)
+        elif packet_type == UNSUBSCRIBE:
+            self._handle_unsubscribe(client, r)
+        elif packet_type == PINGREQ:
+            client.write(PINGRESP << 4, b"")
+        else:
+            raise ProtocolError(f"Unexpected packet type {packet_type}.")
+
+    def _handle_publish(self, client: _Client, flags: int, r: _Reader) -> None:
+        qos, retain = (flags >> 1) & 0x03, bool(flags & 0x01)
+        topic = r.string()
+        packet_id = r.u16() if qos else 0
+        if client.version == _MQTT_V5:
+            r.properties()
+        payload = r.rest()
+        if qos == 1:
+            client.write(PUBACK << 4, struct.pack("!H", packet_id))
+        elif qos == 2:
+            client.write(PUBREC << 4, struct.pack("!H", packet_id))
+            if packet_id in client.awaiting_release:
+                return
+            client.awaiting_release.add(packet_id)
+        self._publish(topic, payload, qos, retain)
+
+    def _publish(self, topic: str, payload: bytes, qos: int, retain: bool) -> None:
+        if retain:
+            if payload:
+                self._retained[topic] = (payload, qos)
+            else:
+                self._retained.pop(topic, None)
+        for subscriber, granted_qos in self._subscribers(topic):
+            subscriber.send_publish(topic, payload, min(qos, granted_qos), retain=False)
+
+    def _subscribers(self, topic: str) -> list[tuple[_Client, int]]:
+        routes = self._routes.get(topic)
+        if routes is None:
+            routes = []
+            for client in self._clients.values():
+                granted = [q for f, q in client.subscriptions.items() if topic_matches(f, topic)]
+                if granted:
+                    routes.append((client, max(granted)))
+            self._routes[topic] = routes
+        return routes
+
+    def _handle_subscribe(self, client: _Client, r: _Reader) -> None:
+        packet_id = r.u16()
+        if client.version == _MQTT_V5:
+            r.properties()
+        topic_filters: list[tuple[str, int]] = []
+        while not r.at_end():
+            topic_filters.append((r.string(), r.u8() & 0x03))
+        if not topic_filters:
+            raise ProtocolError("SUBSCRIBE must contain at least one topic filter.")
+        for topic_filter, qos in topic_filters:
+            client.subscriptions[topic_filter] = qos
+        self._routes.clear()
+        properties = b"\x00" if client.version == _MQTT_V5 else b""
+        return_codes = bytes(min(qos, 2) for _, qos in topic_filters)
+        client.write(SUBACK << 4, struct.pack("!H", packet_id) + properties + return_codes)
+        for topic_filter, qos in topic_filters:
+            for topic, (payload, retained_qos) in self._retained.items():
+                if topic_matches(topic_filter, topic):
+                    client.send_publish(topic, payload, min(qos, retained_qos), retain=True)
+            if self._on_subscribe is not None:
+                self._on_subscribe(client.client_id, topic_filter)
+
+    def _handle_unsubscribe(self, client: _Client, r: _Reader) -> None:
+        packet_id = r.u16()
+        if client.version == _MQTT_V5:
+            r.properties()
+        topic_filters: list[str] = []
+        while not r.at_end():
+            topic_filters.append(r.string())
+        for topic_filter in topic_filters:
+            client.subscriptions.pop(topic_filter, None)
+        self._routes.clear()
+        if client.version == _MQTT_V5:
+            client.write(UNSUBACK << 4, struct.pack("!H", packet_id) + b"\x00" + bytes(len(topic_filters)))
+        else:
+            client.write(UNSUBACK << 4, struct.pack("!H", packet_id))
+
+
+class _Client:
+
+    HIGH_WATER_MARK = 1 << 20
+
+    def __init__(self, client_id: str, writer: asyncio.StreamWriter, version: int, keepalive: int) -> None:
+        self.client_id = client_id
+        self.version = version
+        self.keepalive = keepalive
+        self.subscriptions: dict[str, int] = {}
+        self.awaiting_release: set[int] = set()
+        self.will: tuple[str, bytes, int, bool] | None = None
+        self._writer = writer
+        self._packet_ids = itertools.cycle(range(1, 0x10000))
+
+    def write(self, first_byte: int, body: bytes) -> None:
+        if not self._writer.is_closing():
+            self._writer.write(bytes([first_byte]) + _encode_length(len(body)) + body)
+
+    def send_publish(self, topic: str, payload: bytes, qos: int, retain: bool) -> None:
+        topic_bytes = topic.encode()
+        header = struct.pack("!H", len(topic_bytes)) + topic_bytes
+        if qos:
+            header += struct.pack("!H", next(self._packet_ids))
+        if self.version == _MQTT_V5:
+            header += b"\x00"
+        self.write(PUBLISH << 4 | qos << 1 | int(retain), header + payload)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+class _Reader:
+    """Cursor over the variable header and payload of a single MQTT packet."""
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._pos = 0
+
+    def at_end(self) -> bool:
+        return self._pos >= len(self._data)
+
+    def u8(self) -> int:
+        return self._take(1)[0]
+
+    def u16(self) -> int:
+        return struct.unpack("!H", self._take(2))[0]
+
+    def binary(self) -> bytes:
+        return self._take(self.u16())
+
+    def string(self) -> str:
+        try:
+            return self.binary().decode()
+        except UnicodeDecodeError as e:
+            raise ProtocolError("Malformed UTF-8 string.") from e
+
+    def properties(self) -> None:
+        """Skip MQTT 5 properties - the broker ignores all of them."""
+        length, multiplier = 0, 1
+        for _ in range(4):
+            byte = self.u8()
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        self._take(length)
+
+    def rest(self) -> bytes:
+        rest = self._data[self._pos :]
+        self._pos = len(self._data)
+        return rest
+
+    def _take(self, n: int) -> bytes:
+        if self._pos + n > len(self._data):
+            raise ProtocolError("Packet is shorter than expected.")
+        chunk = self._data[self._pos : self._pos + n]
+        self._pos += n
+        return chunk
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    first_byte = (await reader.readexactly(1))[0]
+    length, multiplier = 0, 1
+    for _ in range(4):
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    else:
+        raise ProtocolError("Malformed remaining length.")
+    body = await reader.readexactly(length) if length else b""
+    return first_byte >> 4, first_byte & 0x0F, body
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Return `True` if the `topic` matches the MQTT `topic_filter`."""
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _print_subscription(client_id: str, topic_filter: str) -> None:
+    print(f"Subscribes({[topic_filter]!r}) from client {client_id}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedded MQTT broker for the integration tests.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = EmbeddedBroker(args.host, args.port, on_subscribe=_print_subscription)
+    try:
+        asyncio.run(broker.serve())
+    except KeyboardInterrupt:
+        pass
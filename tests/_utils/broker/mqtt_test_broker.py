@@ -1,25 +1,60 @@
 from __future__ import annotations
+import re
 import subprocess
+import sys
+import threading
 import time
 
-from paho.mqtt.client import MQTTMessage as _MQTTMessage
-import paho.mqtt.subscribe as subscribe  # type: ignore
-import paho.mqtt.publish as publish  # type: ignore
+from paho.mqtt.client import MQTTMessage as _MQTTMessage, MQTTMessageInfo as _MQTTMessageInfo
+
+from tests._utils.broker.embedded import EmbeddedBroker
+from tests._utils.broker.publisher import PublisherPool
+from tests._utils.broker.subscriber import BufferedSubscriber, MessageListener
+from tests._utils.environment import MQTT_BROKER_BACKEND, MQTT_BROKER_PORT
+from tests._utils.readiness import wait_for_broker
+
+
+_QUOTED = re.compile(r"'([^']*)'")
+
+# In-process asyncio broker
+EMBEDDED = "embedded"
+# The same asyncio broker running in a separate Python process
+EMBEDDED_SUBPROCESS = "embedded-subprocess"
+# Eclipse Paho interoperability test broker running in a separate Python process
+PAHO = "paho"
+BACKENDS = (EMBEDDED, EMBEDDED_SUBPROCESS, PAHO)
 
 
 class MQTTBrokerTest:
 
     _running_broker_processes: list[subprocess.Popen] = []
+    _running_brokers: list[MQTTBrokerTest] = []
     _DEFAULT_HOST = "127.0.0.1"
-    _DEFAULT_PORT = 1883
+    _DEFAULT_PORT = MQTT_BROKER_PORT
+    _DEFAULT_BACKEND = MQTT_BROKER_BACKEND
 
-    def __init__(self, start: bool = False, port: int = _DEFAULT_PORT, kill_others: bool = True):
+    def __init__(
+        self,
+        start: bool = False,
+        port: int = _DEFAULT_PORT,
+        kill_others: bool = True,
+        publishers: int = 1,
+        backend: str = _DEFAULT_BACKEND,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown broker backend '{backend}'. Choose one of {', '.join(BACKENDS)}.")
         if kill_others:  # pragma: no cover
             MQTTBrokerTest.kill_all_test_brokers()
+        self._backend = backend
         self._process: None | subprocess.Popen = None
+        self._embedded: None | EmbeddedBroker = None
         self._port = port
         self._host = self._DEFAULT_HOST
         self._script_path = "lib/mqtt-testing/interoperability/startbroker.py"
+        self._subscriptions: list[tuple[float, str]] = []
+        self._subscribed = threading.Condition()
+        self._subscriber = BufferedSubscriber(self._host, self._port)
+        self._publishers = PublisherPool(self._host, self._port, size=publishers)
         if start:
             self.start()
 
@@ -27,6 +62,10 @@ class MQTTBrokerTest:
     def running_processes(cls) -> list[subprocess.Popen]:
         return cls._running_broker_processes
 
+    @classmethod
+    def running_brokers(cls) -> list[MQTTBrokerTest]:
+        return cls._running_brokers
+
     @classmethod
     def kill_all_test_brokers(cls):  # pragma: no cover
         for process in cls._running_broker_processes:
@@ -39,48 +78,90 @@ class MQTTBrokerTest:
 
     @property
     def is_running(self) -> bool:
-        return self._process is not None
+        return self._process is not None or self._embedded is not None
 
-    def collect_published(self, topic: str, n: int = 1) -> list[_MQTTMessage]:
+    def collect_published(
+        self, topic: str, n: int = 1, timeout: float | None = None, since: float | None = None
+    ) -> list[_MQTTMessage]:
         """Return messages from the broker on the given topic.
 
-        `n` is the number of messages to wait for and return.
+        `n` is the number of messages to wait for and return. Only messages received at or after
+        the `since` time (as returned by `time.monotonic`) are returned. If `since` is not given,
+        the time of the call is used. If `timeout` is given, at most `timeout` seconds are spent waiting
+        and only the messages received until then are returned.
         """
-        print(f"Test broker: Waiting for {n} messages on topic {topic}")
-        result = subscribe.simple(topics=[topic], hostname=self._host, port=self._port, msg_count=n)
+        if since is None:
+            since = time.monotonic()
+        if timeout != 0:
+            print(f"Test broker: Waiting for {n} messages on topic {topic}")
         if n == 0:  # pragma: no cover
             return []
-        if n == 1:
-            return [result]
-        else:
-            return result
+        return self._subscriber.collect(topic, n, timeout=timeout, since=since)
 
-    def publish(self, topic: str, *payload: bytes) -> None:
-        if not payload:  # pragma: no cover
-            return
-        payloads: list[bytes] = []
-        for p in payload:
-            payloads.append(p)
-        if len(payloads) == 1:
-            publish.single(topic, payload=payload[0], hostname=self._host, port=self._port)
-        else:
-            publish.multiple(msgs=[(topic, p) for p in payloads], hostname=self._host, port=self._port)  # type: ignore
-            print(f"Test broker: Published messages to topic {topic}.")
+    def add_listener(self, topic: str, listener: MessageListener) -> None:
+        """Call the `listener` for every message published on the `topic` (from a background thread)."""
+        self._subscriber.add_listener(topic, listener)
+
+    def remove_listener(self, topic: str, listener: MessageListener) -> None:
+        self._subscriber.remove_listener(topic, listener)
+
+    def dropped_messages(self, topic: str | None = None) -> int:
+        """Return the number of messages on the `topic` (any by default) dropped from the full buffer."""
+        return self._subscriber.dropped(topic)
+
+    def publish(self, topic: str, *payload: bytes, qos: int = 0) -> list[_MQTTMessageInfo]:
+        """Queue the payloads for publishing over a persistent connection and return immediately.
+
+        The returned message infos can be passed to `wait_for_puback` to wait for the delivery to the broker.
+        """
+        return [self._publishers.publish(topic, p, qos=qos) for p in payload]
+
+    def wait_for_subscription(self, topic_filter: str, since: float = 0.0, timeout: float = 15.0) -> None:
+        """Wait until some client subscribes to a topic filter matching the `topic_filter`.
 
-    def start(self, sleep: float = 1):
+        Only subscriptions made after the `since` time (as returned by `time.monotonic`) are considered.
+        Raise `TimeoutError` if there is no such subscription within `timeout` seconds.
+        """
+        with self._subscribed:
+            found = self._subscribed.wait_for(
+                lambda: any(
+                    t >= since and _filters_overlap(f, topic_filter) for t, f in self._subscriptions
+                ),
+                timeout=timeout,
+            )
+        if not found:
+            raise TimeoutError(f"No subscription to '{topic_filter}' within {timeout} s.")
+
+    def start(self, timeout: float = 10.0):
         if self.is_running:
             print("Test broker is already running.")
-        broker_script = self._script_path
-        self._process = subprocess.Popen(["python3", broker_script, f"--port={self._port}"])
-        print(f"Started test broker on host {self._host} and port {self._port}")
-        assert isinstance(self._process, subprocess.Popen)
-        self._running_broker_processes.append(self._process)
-        time.sleep(sleep)
+            return
+        if self._backend == EMBEDDED:
+            self._embedded = EmbeddedBroker(
+                port=self._port, on_subscribe=lambda _, topic_filter: self._record_subscription(topic_filter)
+            )
+            self._embedded.start(timeout=timeout)
+        else:
+            self._start_process()
+        print(f"Started test broker ({self._backend}) on host {self._host} and port {self._port}")
+        self._running_brokers.append(self)
+        wait_for_broker(self._host, self._port, timeout=timeout)
+        self._subscriber.start()
+        self._publishers.start()
 
     def stop(self):
-        """Stop the broker process to stop all communication and free up the port."""
+        """Stop the broker to stop all communication and free up the port."""
         if not self.is_running:
             print("Test broker is already stopped.")
+            return
+        self._publishers.stop()
+        self._subscriber.stop()
+        self._subscriber.clear()
+        if self in self._running_brokers:
+            self._running_brokers.remove(self)
+        if self._embedded:
+            self._embedded.stop()
+            self._embedded = None
         elif self._process:
             self._process.terminate()
             self._process.wait()
@@ -90,3 +171,43 @@ class MQTTBrokerTest:
             self._process = None
             MQTTBrokerTest.kill_all_test_brokers()
             time.sleep(0.1)
+
+    def _start_process(self) -> None:
+        if self._backend == PAHO:
+            command = ["python3", self._script_path, f"--port={self._port}"]
+        else:
+            command = [sys.executable, "-m", "tests._utils.broker.embedded", f"--port={self._port}"]
+        self._process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        assert isinstance(self._process, subprocess.Popen)
+        self._running_broker_processes.append(self._process)
+        threading.Thread(target=self._read_log, args=(self._process,), daemon=True).start()
+
+    def _record_subscription(self, topic_filter: str) -> None:
+        with self._subscribed:
+            self._subscriptions.append((time.monotonic(), topic_filter))
+            self._subscribed.notify_all()
+
+    def _read_log(self, process: subprocess.Popen) -> None:
+        """Record the topic filters from the SUBSCRIBE packets logged by the broker process."""
+        assert process.stdout is not None
+        for line in process.stdout:
+            if "Subscribes(" not in line:
+                continue
+            for topic_filter in _QUOTED.findall(line):
+                self._record_subscription(topic_filter)
+
+
+def _filters_overlap(filter_a: str, filter_b: str) -> bool:
+    """Return `True` if some topic matches both MQTT topic filters."""
+    levels_a, levels_b = filter_a.split("/"), filter_b.split("/")
+    for a, b in zip(levels_a, levels_b):
+        if a == "#" or b == "#":
+            return True
+        if a != b and "+" not in (a, b):
+            return False
+    return len(levels_a) == len(levels_b)
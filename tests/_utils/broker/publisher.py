@@ -0,0 +1,70 @@
+from __future__ import annotations
+import threading
+import uuid
+import zlib
+
+import paho.mqtt.client as mqtt  # type: ignore
+
+
+class PublisherPool:
+    """Pool of persistent MQTT clients publishing messages without reconnecting.
+
+    Messages on the same topic are always published by the same client, so their order is preserved.
+    """
+
+    _MAX_INFLIGHT_MESSAGES = 1000
+
+    def __init__(self, host: str, port: int, size: int = 1) -> None:
+        if size < 1:
+            raise ValueError("Publisher pool must contain at least one client.")
+        self._host = host
+        self._port = port
+        self._size = size
+        self._clients: list[mqtt.Client] = []
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._clients)
+
+    def start(self, timeout: float = 5.0) -> None:
+        """Connect all the clients and wait until the broker accepts their connections."""
+        if self.is_running:
+            return
+        for _ in range(self._size):
+            connected = threading.Event()
+            client = mqtt.Client(
+                mqtt.CallbackAPIVersion.VERSION2,
+                client_id=f"test-publisher-{uuid.uuid4().hex[:8]}",
+            )
+            client.max_inflight_messages_set(self._MAX_INFLIGHT_MESSAGES)
+            client.max_queued_messages_set(0)
+            client.on_connect = lambda c, userdata, flags, rc, properties, e=connected: e.set()
+            client.connect(self._host, self._port)
+            client.loop_start()
+            self._clients.append(client)
+            if not connected.wait(timeout):
+                self.stop()
+                raise TimeoutError(f"Publisher not connected to {self._host}:{self._port} within {timeout} s.")
+
+    def stop(self) -> None:
+        for client in self._clients:
+            client.disconnect()
+            client.loop_stop()
+        self._clients.clear()
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0) -> mqtt.MQTTMessageInfo:
+        """Queue the message for publishing and return immediately."""
+        if not self._clients:
+            raise RuntimeError("Publisher pool is not started.")
+        client = self._clients[zlib.crc32(topic.encode()) % len(self._clients)]
+        return client.publish(topic, payload, qos=qos)
+
+
+def wait_for_puback(info: mqtt.MQTTMessageInfo, timeout: float = 5.0) -> bool:
+    """Wait until the message is handed over to the broker.
+
+    For QoS 0, this is when the message is written to the socket, for QoS 1 when the PUBACK is received.
+    Return `False` if this does not happen within `timeout` seconds.
+    """
+    info.wait_for_publish(timeout)
+    return info.is_published()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import bisect
+import threading
+import time
+import uuid
+from typing import Callable
+
+import paho.mqtt.client as mqtt  # type: ignore
+from paho.mqtt.client import MQTTMessage as _MQTTMessage
+
+from tests._utils.environment import MQTT_BUFFERED_MESSAGES_PER_TOPIC
+
+
+MessageListener = Callable[[_MQTTMessage], None]
+
+
+class BufferedSubscriber:
+    """Long-lived MQTT client buffering all messages published on the subscribed topic filter.
+
+    Every received message is stored in a queue of its topic together with the time of its reception
+    (as returned by `time.monotonic`), so no message is lost between the subscription and a call to `collect`.
+    When a queue exceeds `max_buffered_per_topic` messages, its older half is dropped with a warning
+    and counted (see `dropped`).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        topic_filter: str = "+/+/external_server",
+        max_buffered_per_topic: int = MQTT_BUFFERED_MESSAGES_PER_TOPIC,
+    ) -> None:
+        if max_buffered_per_topic < 2:
+            raise ValueError("At least two messages per topic must be buffered.")
+        self._host = host
+        self._port = port
+        self._topic_filter = topic_filter
+        self._max_buffered_per_topic = max_buffered_per_topic
+        self._client: mqtt.Client | None = None
+        self._timestamps: dict[str, list[float]] = {}
+        self._messages: dict[str, list[_MQTTMessage]] = {}
+        self._listeners: dict[str, list[MessageListener]] = {}
+        self._dropped: dict[str, int] = {}
+        self._received = threading.Condition()
+        self._subscribed = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._client is not None
+
+    def start(self, timeout: float = 5.0) -> None:
+        """Connect to the broker and wait until the subscription is acknowledged."""
+        if self.is_running:
+            return
+        self._subscribed.clear()
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2, client_id=f"test-subscriber-{uuid.uuid4().hex[:8]}"
+        )
+        client.on_connect = self._on_connect
+        client.on_subscribe = self._on_subscribe
+        client.on_message = self._on_message
+        client.connect(self._host, self._port)
+        client.loop_start()
+        self._client = client
+        if not self._subscribed.wait(timeout):
+            self.stop()
+            raise TimeoutError(f"Subscription to '{self._topic_filter}' not acknowledged within {timeout} s.")
+
+    def stop(self) -> None:
+        if self._client is None:
+            return
+        self._client.disconnect()
+        self._client.loop_stop()
+        self._client = None
+
+    def add_listener(self, topic: str, listener: MessageListener) -> None:
+        """Call the `listener` from the client's network thread for every message received on the `topic`."""
+        with self._received:
+            self._listeners.setdefault(topic, []).append(listener)
+
+    def remove_listener(self, topic: str, listener: MessageListener) -> None:
+        with self._received:
+            if listener in self._listeners.get(topic, []):
+                self._listeners[topic].remove(listener)
+
+    def dropped(self, topic: str | None = None) -> int:
+        """Return the number of messages dropped from the full buffer of the `topic` (of any by default)."""
+        with self._received:
+            return self._dropped.get(topic, 0) if topic is not None else sum(self._dropped.values())
+
+    def clear(self) -> None:
+        """Drop all buffered messages and reset the counts of the dropped ones."""
+        with self._received:
+            self._timestamps.clear()
+            self._messages.clear()
+            self._dropped.clear()
+
+    def collect(
+        self, topic: str, n: int = 1, timeout: float | None = None, since: float = 0.0
+    ) -> list[_MQTTMessage]:
+        """Return the first `n` messages on the `topic` received at or after the `since` time.
+
+        Wait for at most `timeout` seconds (or indefinitely if `timeout` is `None`) for the messages
+        to arrive. If not all of them arrive in time, return only those received.
+        """
+        with self._received:
+            self._received.wait_for(lambda: len(self._since(topic, since)) >= n, timeout=timeout)
+            return self._since(topic, since)[:n]
+
+    def _since(self, topic: str, since: float) -> list[_MQTTMessage]:
+        timestamps = self._timestamps.get(topic, [])
+        return self._messages.get(topic, [])[bisect.bisect_left(timestamps, since) :]
+
+    def _on_connect(self, client: mqtt.Client, userdata, flags, reason_code, properties) -> None:
+        client.subscribe(self._topic_filter, qos=1)
+
+    def _on_subscribe(self, client: mqtt.Client, userdata, mid, reason_codes, properties) -> None:
+        self._subscribed.set()
+
+    def _on_message(self, client: mqtt.Client, userdata, message: _MQTTMessage) -> None:
+        with self._received:
+            timestamps = self._timestamps.setdefault(message.topic, [])
+            messages = self._messages.setdefault(message.topic, [])
+            timestamps.append(time.monotonic())
+            messages.append(message)
+            if len(messages) > self._max_buffered_per_topic:
+                dropped = len(messages) // 2
+                del timestamps[:dropped]
+                del messages[:dropped]
+                self._dropped[message.topic] = self._dropped.get(message.topic, 0) + dropped
+                print(
+                    f"Test broker subscriber: more than {self._max_buffered_per_topic} messages buffered "
+                    f"on topic {message.topic}, dropped the oldest {dropped}."
+                )
+            self._received.notify_all()
+            listeners = list(self._listeners.get(message.topic, ()))
+        for listener in listeners:
+            listener(message)
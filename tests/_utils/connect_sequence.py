@@ -0,0 +1,256 @@
+from __future__ import annotations
+import threading
+import time
+from typing import Callable, Iterable
+
+from paho.mqtt.client import MQTTMessage as _MQTTMessage
+
+from tests._utils.external_client import ExternalClientMock
+from tests._utils.messages import (
+    CmdResponseType,
+    Device,
+    _ExternalServerMsg,
+    command_response_bytes,
+    connect_msg,
+    status_template,
+)
+
+
+DEFAULT_TIMEOUT = 10.0
+_DEFAULT_PAYLOAD = {"state": "connecting"}
+_CONNECT_RETRY_PAUSE = 0.2
+_CONNECT_RESPONSE_TIMEOUT = 1.0
+
+
+class ConnectSequenceDriver:
+    """Connect sequence of a single car driven by the messages of the External Server.
+
+    After the connect message is posted, the driver reacts to the server's messages instead of sleeping:
+    the CONNECTING status of every device is sent once the server accepts the connect message
+    by a `ConnectResponse` and every command of the sequence is acknowledged by an OK command response.
+    The sequence is finished when the commands of all the devices are acknowledged.
+
+    The messages are handled on the communication layer's thread and nothing blocks there, so the
+    sequences of many cars run concurrently (see `connect_all`). The driver stops listening once
+    the sequence ends, later commands are left to the test.
+    """
+
+    def __init__(
+        self,
+        client: ExternalClientMock,
+        devices: list[Device],
+        session_id: str = "id",
+        payload: bytes | dict | list[bytes | dict] = _DEFAULT_PAYLOAD,
+        retry_connect: bool = False,
+        unanswered_connect_timeout: float = _CONNECT_RESPONSE_TIMEOUT,
+    ) -> None:
+        """The `payload` of the CONNECTING statuses is either common to all the devices or given per device.
+
+        If `retry_connect` is set, the connect message refused by the server (e.g. because the previous
+        session has not ended yet) or not answered within `unanswered_connect_timeout` seconds is posted
+        again instead of failing the sequence. Once the server accepts a connect message, its later
+        connect responses are ignored.
+        """
+        self._client = client
+        self._devices = devices
+        self._session_id = session_id
+        self._payloads = payload if isinstance(payload, list) else [payload] * len(devices)
+        self._retry_connect = retry_connect
+        self._unanswered_connect_timeout = unanswered_connect_timeout
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        # number of connect messages posted, whether the last one has been answered and any accepted
+        self._connect_attempts = 0
+        self._connect_answered = False
+        self._connect_accepted = False
+        self._reposts: list[threading.Timer] = []
+        self._acknowledged = 0
+        self._error: str | None = None
+        self._started: float | None = None
+        self._ended: float | None = None
+        # called from the communication layer's thread when the sequence ends, successfully or not
+        self.on_finished: Callable[[ConnectSequenceDriver], None] | None = None
+
+    @property
+    def car(self) -> str:
+        return self._client.car
+
+    @property
+    def session_id(self) -> str:
+        return self._session_id
+
+    @property
+    def next_counter(self) -> int:
+        """Message counter of the first status after the connect sequence."""
+        return len(self._devices)
+
+    @property
+    def is_connected(self) -> bool:
+        return self._finished.is_set() and self._error is None
+
+    @property
+    def connected_at(self) -> float | None:
+        """The `time.monotonic()` time of finishing the sequence, `None` if the car is not connected."""
+        return self._ended if self.is_connected else None
+
+    @property
+    def duration(self) -> float | None:
+        """Time from posting the connect message to acknowledging the last command in seconds."""
+        if self._started is None or self._ended is None or self._error is not None:
+            return None
+        return self._ended - self._started
+
+    def start(self) -> None:
+        """Post the connect message and start reacting to the External Server's messages, without waiting."""
+        self._finished.clear()
+        self._connect_accepted = False
+        self._acknowledged = 0
+        self._error = None
+        self._ended = None
+        self._client.add_listener(self._on_mqtt_message)
+        self._started = time.monotonic()
+        self._post_connect()
+
+    def wait(self, timeout: float = DEFAULT_TIMEOUT) -> float:
+        """Wait until the sequence started by `start` ends and return its duration in seconds.
+
+        Raise `TimeoutError` if the sequence is not finished within `timeout` seconds
+        and `RuntimeError` if the server refuses the connect message.
+        """
+        if not self._finished.wait(timeout) and self.stop():
+            raise TimeoutError(f"Connect sequence of car '{self.car}' not finished in {timeout} s.")
+        if self._error is not None:
+            raise RuntimeError(self._error)
+        return self.duration  # type: ignore
+
+    def run(self, timeout: float = DEFAULT_TIMEOUT) -> float:
+        """Run the whole connect sequence and return its duration in seconds."""
+        self.start()
+        return self.wait(timeout)
+
+    def _post_connect(self) -> None:
+        with self._lock:
+            if self._finished.is_set() or self._connect_accepted:
+                return
+            self._connect_attempts += 1
+            self._connect_answered = False
+            attempt = self._connect_attempts
+        connect = connect_msg(self._session_id, self._client.company, self.car, self._devices)
+        self._client.post(connect, sleep=0.0)
+        if self._retry_connect:
+            self._repost_later(self._unanswered_connect_timeout, attempt, unanswered_only=True)
+
+    def _repost_later(self, delay: float, attempt: int, unanswered_only: bool = False) -> None:
+        """Post the connect message again after `delay` unless a newer one is posted or one is accepted."""
+        with self._lock:
+            self._reposts = [timer for timer in self._reposts if timer.is_alive()]
+            self._reposts.append(_call_later(delay, self._repost, attempt, unanswered_only))
+
+    def _repost(self, attempt: int, unanswered_only: bool) -> None:
+        with self._lock:
+            repost = attempt == self._connect_attempts and not self._connect_accepted
+            if unanswered_only:
+                repost = repost and not self._connect_answered
+        if repost:
+            self._post_connect()
+
+    def _cancel_reposts(self) -> None:
+        with self._lock:
+            reposts, self._reposts = self._reposts, []
+        for timer in reposts:
+            timer.cancel()
+
+    def _on_mqtt_message(self, message: _MQTTMessage) -> None:
+        if self._finished.is_set():  # the message was dispatched before the listener was removed
+            return
+        msg = _ExternalServerMsg.FromString(message.payload)
+        if msg.HasField("connectResponse"):
+            self._on_connect_response(msg.connectResponse.type)
+        elif msg.HasField("command"):
+            self._on_command(msg.command.messageCounter)
+
+    def _on_connect_response(self, response_type: int) -> None:
+        with self._lock:
+            # responses to the connect messages posted again are ignored once the sequence is accepted
+            if self._connect_accepted:
+                return
+            self._connect_answered = True
+            self._connect_accepted = response_type == CmdResponseType.OK.value
+            attempt = self._connect_attempts
+        if not self._connect_accepted:
+            if self._retry_connect:
+                self._repost_later(_CONNECT_RETRY_PAUSE, attempt)
+            else:
+                self._finish(
+                    error=f"Server refused the connect message of car '{self.car}' ({response_type})."
+                )
+            return
+        self._cancel_reposts()
+        self._client.post_serialized(
+            status_template(self._session_id, "CONNECTING", device).serialize(counter, payload)
+            for counter, (device, payload) in enumerate(zip(self._devices, self._payloads))
+        )
+
+    def _on_command(self, counter: int) -> None:
+        self._client.post_serialized((command_response_bytes(self._session_id, CmdResponseType.OK, counter),))
+        with self._lock:
+            self._acknowledged += 1
+            finished = self._acknowledged >= len(self._devices)
+        if finished:
+            self._finish()
+
+    def _finish(self, error: str | None = None) -> None:
+        with self._lock:
+            if self._finished.is_set():
+                return
+            self._ended = time.monotonic()
+            self._error = error
+            self._finished.set()
+        self._cancel_reposts()
+        self._client.remove_listener(self._on_mqtt_message)
+        if self.on_finished is not None:
+            self.on_finished(self)
+
+    def stop(self) -> bool:
+        """Stop reacting to the server's messages. Return `False` if the sequence has already finished."""
+        with self._lock:
+            if self._finished.is_set():
+                return False
+            self._error = f"Connect sequence of car '{self.car}' stopped."
+            self._finished.set()
+        self._cancel_reposts()
+        self._client.remove_listener(self._on_mqtt_message)
+        return True
+
+
+def _call_later(delay: float, function: Callable, *args) -> threading.Timer:
+    """Call the `function` after `delay` seconds from a daemon thread, not blocking the communication layer.
+
+    Return the timer, so that the call can be cancelled.
+    """
+    timer = threading.Timer(delay, function, args)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def connect_all(drivers: Iterable[ConnectSequenceDriver], timeout: float = DEFAULT_TIMEOUT) -> float:
+    """Run the connect sequences of all the cars concurrently and return the time until all are connected.
+
+    The time is measured from posting the first connect message to finishing the last sequence.
+    Raise `TimeoutError` naming the cars not connected within `timeout` seconds.
+    """
+    drivers = list(drivers)
+    started = time.monotonic()
+    for driver in drivers:
+        driver.start()
+    deadline = started + timeout
+    not_connected = []
+    for driver in drivers:
+        try:
+            driver.wait(max(deadline - time.monotonic(), 0.0))
+        except (TimeoutError, RuntimeError):
+            not_connected.append(driver.car)
+    if not_connected:
+        raise TimeoutError(f"Cars not connected within {timeout} s: {', '.join(not_connected)}.")
+    return max(driver.connected_at for driver in drivers) - started  # type: ignore
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import dataclasses
+import hashlib
+from typing import Iterable, Iterator, Literal
+
+import psycopg
+
+from tests._utils.environment import POSTGRES_PORT
+
+
+# credentials of the `postgresql-database` service from `docker-compose.yaml`
+_DATABASE = "protocol_api"
+_USER = "postgres"
+_PASSWORD = "1234"
+# messages table of the Fleet Protocol HTTP API
+_MESSAGES_TABLE = "messages"
+_DEVICE_COLUMNS = ("car_name", "module_id", "device_type", "device_role", "device_name")
+_REQUIRED_COLUMNS = (*_DEVICE_COLUMNS, "company_name", "message_type", "timestamp", "payload_data")
+_FETCH_SIZE = 1000
+
+
+MessageType = Literal["STATUS", "COMMAND"]
+
+
+# Aggregates the messages of every device in a single pass. The sequence number is read from
+# the payload data, every message with a lower sequence number than the previous message
+# of the device (ordered by the timestamp) is counted as out of order.
+_DELIVERED_MESSAGES_SQL = f"""
+SELECT
+    car_name, module_id, device_type, device_role, device_name,
+    count(*),
+    count(seq),
+    min("timestamp"),
+    max("timestamp"),
+    count(*) FILTER (WHERE seq < previous_seq),
+    count(seq) - count(DISTINCT seq),
+    md5(string_agg(seq::text, ',' ORDER BY "timestamp", seq))
+FROM (
+    SELECT
+        *,
+        lag(seq) OVER (PARTITION BY {", ".join(_DEVICE_COLUMNS)} ORDER BY "timestamp", seq) AS previous_seq
+    FROM (
+        SELECT
+            {", ".join(_DEVICE_COLUMNS)},
+            "timestamp",
+            CASE WHEN payload_data::jsonb ->> %(key)s ~ '^-?[0-9]+$'
+                THEN (payload_data::jsonb ->> %(key)s)::bigint
+            END AS seq
+        FROM {_MESSAGES_TABLE}
+        WHERE company_name = %(company)s
+            AND message_type = %(message_type)s
+            AND "timestamp" >= %(since)s
+            AND (%(cars)s::text[] IS NULL OR car_name = ANY(%(cars)s::text[]))
+    ) AS messages
+) AS sequenced
+GROUP BY {", ".join(_DEVICE_COLUMNS)}
+ORDER BY {", ".join(_DEVICE_COLUMNS)}
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class DeliveredMessages:
+    """Summary of the messages of a single device stored by the HTTP API.
+
+    Messages carrying a sequence number in their payload data are checked for order and duplicates.
+    The checksum is the MD5 of their sequence numbers joined by commas in the order of the timestamps
+    (see `sequence_checksum`), `None` if there are no such messages.
+    """
+
+    car: str
+    module_id: int
+    device_type: int
+    device_role: str
+    device_name: str
+    count: int
+    sequenced: int
+    first_timestamp: int
+    last_timestamp: int
+    out_of_order: int
+    duplicates: int
+    checksum: str | None
+
+
+def connect(host: str = "localhost", port: int = POSTGRES_PORT) -> psycopg.Connection:
+    """Return a read-only connection to the `protocol_api` database of the docker compose stack."""
+    connection = psycopg.connect(
+        host=host, port=port, dbname=_DATABASE, user=_USER, password=_PASSWORD, autocommit=True
+    )
+    # applies to the transactions of `delivered_messages`
+    connection.read_only = True
+    return connection
+
+
+def delivered_messages(
+    connection: psycopg.Connection,
+    company: str,
+    message_type: MessageType = "STATUS",
+    sequence_key: str = "seq",
+    cars: Iterable[str] | None = None,
+    since: int = 0,
+) -> Iterator[DeliveredMessages]:
+    """Yield the summary of the messages of every device of the company, ordered by the car and device.
+
+    Only messages with timestamps (in milliseconds) not older than `since` and of the given `cars`
+    (all the cars by default) are included. The sequence number is read from the `sequence_key`
+    of the payload data. All the devices are summarized by a single query and the rows are fetched
+    through a server-side cursor.
+
+    Raise `RuntimeError` if the database schema does not contain the expected columns.
+    """
+    _check_schema(connection)
+    parameters = {
+        "company": company,
+        "message_type": message_type,
+        "key": sequence_key,
+        "since": since,
+        "cars": None if cars is None else list(cars),
+    }
+    with connection.transaction():
+        with connection.cursor(name="delivered_messages") as cursor:
+            cursor.itersize = _FETCH_SIZE
+            cursor.execute(_DELIVERED_MESSAGES_SQL, parameters)
+            for row in cursor:
+                yield DeliveredMessages(*row)
+
+
+def sequence_checksum(sequence: Iterable[int]) -> str:
+    """Return the checksum of the sequence numbers in the form of `DeliveredMessages.checksum`."""
+    return hashlib.md5(",".join(str(seq) for seq in sequence).encode()).hexdigest()
+
+
+def _check_schema(connection: psycopg.Connection) -> None:
+    rows = connection.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = %s", (_MESSAGES_TABLE,)
+    ).fetchall()
+    missing = set(_REQUIRED_COLUMNS) - {row[0] for row in rows}
+    if missing:
+        raise RuntimeError(
+            f"Table '{_MESSAGES_TABLE}' of the HTTP API database is missing columns: {', '.join(sorted(missing))}."
+        )
@@ -1,17 +1,275 @@
+from __future__ import annotations
+import atexit
+import glob
+import hashlib
+import os
 import subprocess
 import time
 import json
+import unittest
+from typing import Callable
+
+from tests._utils.broker import MQTTBrokerTest
+from tests._utils import postgres_snapshot
+from tests._utils.environment import (
+    API_HOST,
+    MQTT_BROKER_PORT,
+    POSTGRES_SNAPSHOT,
+    POSTGRES_TMPFS,
+    RESOURCE_SAMPLING_INTERVAL,
+    STACK_VARIABLES,
+)
+from tests._utils.readiness import wait_for_http_api
+from tests._utils.resources import ResourceSampler, write_series
 
 
 env = json.load(open("./config/tests/config.json"))
+env.update({name: os.environ[name] for name in STACK_VARIABLES if name in os.environ})
+env["COMPOSE_FILE"] = os.pathsep.join(postgres_snapshot.compose_files(POSTGRES_SNAPSHOT, POSTGRES_TMPFS))
+
+
+_EXTERNAL_SERVER_CONFIG_DIR = "./config/external-server"
+_GENERATED_CONFIG_DIR = "generated"
+_HTTP_API_READY_TIMEOUT = 30.0
+# files affecting the stack, besides the docker compose files
+_FINGERPRINTED_FILES = ("config/external-server/*.json", "config/http-api/config.json")
+_EXTERNAL_SERVER_READY_TIMEOUT = 15.0
+
+
+# Empties every table of the `protocol_api` database except for the seeded API keys.
+_TRUNCATE_TABLES_SQL = """
+DO $$
+DECLARE r record;
+BEGIN
+    FOR r IN SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename <> 'api_keys'
+    LOOP
+        EXECUTE 'TRUNCATE TABLE ' || quote_ident(r.tablename) || ' RESTART IDENTITY CASCADE';
+    END LOOP;
+END $$;
+"""
+
+
+def requires_full_restart(test_method: Callable) -> Callable:
+    """Mark the test method as requiring the whole docker compose stack to be restarted before it runs."""
+    test_method.requires_full_restart = True  # type: ignore
+    return test_method
+
+
+class DockerComposeStack:
+    """Docker compose stack shared by all the tests run in a single session.
+
+    The stack is brought up once per External Server configuration. Between the tests, only its state
+    is reset - the tables of the `protocol_api` database are truncated and the External Server container
+    is restarted.
+    """
+
+    def __init__(self) -> None:
+        self._config_name: str | None = None
+        self._prepared_fingerprint: str | None = None
+        # the images of the stack by the compose files and variables they were listed for
+        self._images: tuple[str, list[str]] | None = None
+
+    @property
+    def config_name(self) -> str | None:
+        return self._config_name
+
+    @property
+    def is_up(self) -> bool:
+        return self._config_name is not None
+
+    def up(self, config_name: str = "config.json", full_restart: bool = False) -> None:
+        """Make the stack run with the External Server configured by `config_name` and with a clean state."""
+        if full_restart or self._config_name != config_name:
+            self._restart(config_name)
+        elif not self.reset():
+            print("Docker compose stack could not be reset. Restarting the whole stack.")
+            self._restart(config_name)
+
+    def reset(self) -> bool:
+        """Clear the database and restart the External Server. Return `True` if successful.
+
+        The copy of the config with the broker's port is generated again, as the config file may have
+        been rewritten under the same name since the start (e.g. by the benchmarks).
+        """
+        if self._config_name is None:
+            return False
+        if _external_server_config(self._config_name) != env["CONFIG_NAME"]:
+            return False
+        steps = (
+            ("stop", "-t", "0", "external-server"),
+            (
+                "exec",
+                "-T",
+                "postgresql-database",
+                "psql",
+                "-U",
+                "postgres",
+                "-d",
+                "protocol_api",
+                "-c",
+                _TRUNCATE_TABLES_SQL,
+            ),
+        )
+        for step in steps:
+            if _compose(*step).returncode != 0:
+                return False
+        started = time.monotonic()
+        if _compose("start", "external-server").returncode != 0:
+            return False
+        _wait_for_external_server(self._config_name, since=started)
+        return True
+
+    def down(self) -> None:
+        _compose("down", "-t", "0")
+        self._config_name = None
+
+    def prepare_images(self) -> None:
+        """Pull the images of the stack missing locally and check that all of them are available.
+
+        Raise `RuntimeError` if some of the images cannot be pulled. The fingerprint of the images
+        and the config files is stored, so the stack is started without any pull or build until
+        the fingerprint changes (e.g. when another External Server image is selected or an image
+        is tagged anew).
+        """
+        images = self._stack_images()
+        for image in images:
+            if _image_id(image) is None:
+                print(f"Pulling image '{image}'.")
+                subprocess.run(["docker", "pull", image], env=env)
+        missing = [image for image in images if _image_id(image) is None]
+        if missing:
+            raise RuntimeError(f"Images of the docker compose stack are not available: {', '.join(missing)}.")
+        self._prepared_fingerprint = _fingerprint(images)
+
+    def _restart(self, config_name: str) -> None:
+        env["CONFIG_NAME"] = _external_server_config(config_name)
+        _compose("down", "-t", "0")
+        if POSTGRES_SNAPSHOT and "POSTGRES_SNAPSHOT_IMAGE" not in env:
+            env["POSTGRES_SNAPSHOT_IMAGE"] = postgres_snapshot.snapshot_image(env)
+        prepared = self._prepared_fingerprint
+        if prepared is None or _fingerprint(self._stack_images()) != prepared:
+            self.prepare_images()
+        started = time.monotonic()
+        result = _compose("up", "-d", "--no-build", "--pull", "never", capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Docker compose stack could not be started: {result.stderr.strip()}")
+        self._config_name = config_name
+        wait_for_http_api(API_HOST, timeout=_HTTP_API_READY_TIMEOUT)
+        _wait_for_external_server(config_name, since=started)
+
+    def _stack_images(self) -> list[str]:
+        """Return the images of the stack, listed again only after the compose files or variables change."""
+        key = _compose_key()
+        if self._images is None or self._images[0] != key:
+            self._images = (key, _stack_images())
+        return self._images[1]
+
+
+stack = DockerComposeStack()
 
 
-def docker_compose_up(config_name: str = "config.json") -> None:
-    env["CONFIG_NAME"] = config_name
-    subprocess.run(["docker", "compose", "down", "-t", "0"], env=env)
-    subprocess.run(["docker", "compose", "up", "--build", "-d"], env=env)
-    time.sleep(1.5)
+@atexit.register
+def _stop_stack() -> None:
+    if stack.is_up:
+        stack.down()
+
+
+def docker_compose_up(config_name: str = "config.json", test: unittest.TestCase | None = None) -> None:
+    """Bring up the docker compose stack with the External Server configured by `config_name`.
+
+    The stack is reused between the tests and only its state is reset, unless the `test`
+    is marked by `requires_full_restart`. If `RESOURCE_SAMPLING_INTERVAL` is set, resource usage
+    of the containers is sampled during the `test` and stored in `<LOG_DIR>/resources/<test id>.json`.
+    """
+    full_restart = test is not None and _requires_full_restart(test)
+    stack.up(config_name, full_restart=full_restart)
+    if test is not None and RESOURCE_SAMPLING_INTERVAL > 0:
+        sampler = ResourceSampler(env, interval=RESOURCE_SAMPLING_INTERVAL)
+        sampler.start()
+        test.addCleanup(_store_resource_series, sampler, test.id())
 
 
 def docker_compose_down() -> None:
-    subprocess.run(["docker", "compose", "down", "-t", "0"], env=env)
+    stack.down()
+
+
+def _compose(*args: str, capture_output: bool = False) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker", "compose", *args], env=env, capture_output=capture_output, text=True)
+
+
+def _stack_images() -> list[str]:
+    """Return the images of all the services of the docker compose stack."""
+    result = subprocess.run(
+        ["docker", "compose", "config", "--images"], env=env, capture_output=True, text=True, check=True
+    )
+    return sorted(set(result.stdout.split()))
+
+
+def _image_id(image: str) -> str | None:
+    result = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Id}}", image], env=env, capture_output=True, text=True
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _fingerprint(images: list[str]) -> str:
+    """Return a fingerprint of the images (by their ids), the docker compose files and the config files."""
+    digest = hashlib.sha256()
+    for image in images:
+        digest.update(f"{image}={_image_id(image)}\n".encode())
+    paths = env["COMPOSE_FILE"].split(os.pathsep)
+    paths += sorted(path for pattern in _FINGERPRINTED_FILES for path in glob.glob(pattern))
+    for path in paths:
+        digest.update(path.encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _compose_key() -> str:
+    """Return a digest of the docker compose files and of the variables they are interpolated with."""
+    digest = hashlib.sha256(json.dumps(sorted(env.items())).encode())
+    for path in env["COMPOSE_FILE"].split(os.pathsep):
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _external_server_config(config_name: str) -> str:
+    """Return path of the External Server config file relative to the config directory.
+
+    If the test broker does not run on the port from the config file, a copy of the config with
+    the broker's port is generated for the current docker compose project.
+    """
+    config = json.load(open(f"{_EXTERNAL_SERVER_CONFIG_DIR}/{config_name}"))
+    if config["mqtt_port"] == MQTT_BROKER_PORT:
+        return config_name
+    config["mqtt_port"] = MQTT_BROKER_PORT
+    project = env.get("COMPOSE_PROJECT_NAME", "default")
+    generated_name = f"{_GENERATED_CONFIG_DIR}/{project}/{config_name}"
+    os.makedirs(os.path.dirname(f"{_EXTERNAL_SERVER_CONFIG_DIR}/{generated_name}"), exist_ok=True)
+    with open(f"{_EXTERNAL_SERVER_CONFIG_DIR}/{generated_name}", "w") as f:
+        json.dump(config, f, indent=2)
+    return generated_name
+
+
+def _wait_for_external_server(config_name: str, since: float) -> None:
+    """Wait until the External Server subscribes to the module gateway topics of its company on a running broker."""
+    brokers = MQTTBrokerTest.running_brokers()
+    if not brokers:
+        print("No test broker is running. Readiness of the External Server is not checked.")
+        return
+    company = json.load(open(f"{_EXTERNAL_SERVER_CONFIG_DIR}/{config_name}"))["company_name"]
+    brokers[-1].wait_for_subscription(
+        f"{company}/+/module_gateway", since=since, timeout=_EXTERNAL_SERVER_READY_TIMEOUT
+    )
+
+
+def _store_resource_series(sampler: ResourceSampler, test_id: str) -> None:
+    sampler.stop()
+    write_series(os.path.join(env.get("LOG_DIR", "./log"), "resources", f"{test_id}.json"), sampler.series())
+
+
+def _requires_full_restart(test: unittest.TestCase) -> bool:
+    test_method = getattr(test, test._testMethodName, None)
+    return getattr(test_method, "requires_full_restart", False)
@@ -0,0 +1,27 @@
+import os
+
+
+# Host ports of the test stack, overridden for each worker when the tests run in parallel
+MQTT_BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", 1883))
+HTTP_API_PORT = int(os.environ.get("HTTP_API_PORT", 8080))
+POSTGRES_PORT = int(os.environ.get("POSTGRES_PORT", 5432))
+
+# Backend of the test MQTT broker, see `tests/_utils/broker/mqtt_test_broker.py`
+MQTT_BROKER_BACKEND = os.environ.get("MQTT_BROKER_BACKEND", "embedded")
+
+# Maximum number of messages buffered by the test broker's subscriber per topic, the older half
+# is dropped when exceeded
+MQTT_BUFFERED_MESSAGES_PER_TOPIC = int(os.environ.get("MQTT_BUFFERED_MESSAGES_PER_TOPIC", 100_000))
+
+# Interval (in seconds) of sampling resource usage of the stack's containers, 0 disables the sampling
+RESOURCE_SAMPLING_INTERVAL = float(os.environ.get("RESOURCE_SAMPLING_INTERVAL", 0))
+
+# Start the database from a cached image with the `protocol_api` database already initialized
+POSTGRES_SNAPSHOT = os.environ.get("POSTGRES_SNAPSHOT", "0") not in ("", "0")
+# Keep the database data directory in tmpfs with fsync disabled
+POSTGRES_TMPFS = os.environ.get("POSTGRES_TMPFS", "0") not in ("", "0")
+
+API_HOST = f"http://localhost:{HTTP_API_PORT}/v2/protocol"
+
+# Variables passed to docker compose to isolate the stacks of the parallel workers
+STACK_VARIABLES = ("COMPOSE_PROJECT_NAME", "NETWORK_NAME", "LOG_DIR", "HTTP_API_PORT", "POSTGRES_PORT")
@@ -1,21 +1,47 @@
 import time
 import sys
 import abc
+from typing import Callable, Iterable
 
 sys.path.append("./lib/fleet-protocol/protobuf/compiled/python/ExternalProtocol_pb2.pyi")
 
 from ExternalProtocol_pb2 import ExternalClient as _ExternalClientMsg  # type: ignore
-from .broker import MQTTBrokerTest
-from paho.mqtt.client import MQTTMessage as _MQTTMessage
+from .broker import MQTTBrokerTest, wait_for_puback
+from paho.mqtt.client import MQTTMessage as _MQTTMessage, MQTTMessageInfo as _MQTTMessageInfo
 
 
 class CommunicationLayer(abc.ABC):
     @abc.abstractmethod
-    def post(self, company: str, car_name: str, data: bytes) -> None:
+    def post(self, company: str, car_name: str, data: bytes, qos: int = 0) -> _MQTTMessageInfo:
         pass
 
     @abc.abstractmethod
-    def collect(self, company: str, car_name: str, n: int) -> list[_MQTTMessage]:
+    def post_many(
+        self, company: str, car_name: str, data: Iterable[bytes], qos: int = 0
+    ) -> list[_MQTTMessageInfo]:
+        pass
+
+    @abc.abstractmethod
+    def collect(
+        self,
+        company: str,
+        car_name: str,
+        n: int,
+        timeout: float | None = None,
+        since: float | None = None,
+    ) -> list[_MQTTMessage]:
+        pass
+
+    @abc.abstractmethod
+    def add_listener(
+        self, company: str, car_name: str, listener: Callable[[_MQTTMessage], None]
+    ) -> None:
+        pass
+
+    @abc.abstractmethod
+    def remove_listener(
+        self, company: str, car_name: str, listener: Callable[[_MQTTMessage], None]
+    ) -> None:
         pass
 
     @abc.abstractmethod
@@ -29,17 +55,39 @@ class CommunicationLayer(abc.ABC):
 
 class _CommunicationLayerImpl(CommunicationLayer):
 
-    def __init__(self) -> None:
-        self._broker = MQTTBrokerTest()
+    def __init__(self, publishers: int = 1) -> None:
+        self._broker = MQTTBrokerTest(publishers=publishers)
 
-    def post(self, company: str, car_name: str, data: bytes) -> None:
+    def post(self, company: str, car_name: str, data: bytes, qos: int = 0) -> _MQTTMessageInfo:
         topic = f"{company}/{car_name}/module_gateway"
-        self._broker.publish(topic, data)
-        print(f"Published message to {topic}")
+        return self._broker.publish(topic, data, qos=qos)[0]
 
-    def collect(self, company: str, car_name: str, n: int) -> list[_MQTTMessage]:
+    def post_many(
+        self, company: str, car_name: str, data: Iterable[bytes], qos: int = 0
+    ) -> list[_MQTTMessageInfo]:
+        topic = f"{company}/{car_name}/module_gateway"
+        return self._broker.publish(topic, *data, qos=qos)
+
+    def collect(
+        self,
+        company: str,
+        car_name: str,
+        n: int,
+        timeout: float | None = None,
+        since: float | None = None,
+    ) -> list[_MQTTMessage]:
         topic = f"{company}/{car_name}/external_server"
-        return self._broker.collect_published(topic, n)
+        return self._broker.collect_published(topic, n, timeout=timeout, since=since)
+
+    def add_listener(
+        self, company: str, car_name: str, listener: Callable[[_MQTTMessage], None]
+    ) -> None:
+        self._broker.add_listener(f"{company}/{car_name}/external_server", listener)
+
+    def remove_listener(
+        self, company: str, car_name: str, listener: Callable[[_MQTTMessage], None]
+    ) -> None:
+        self._broker.remove_listener(f"{company}/{car_name}/external_server", listener)
 
     def start(self) -> None:
         self._broker.start()
@@ -48,21 +96,79 @@ class _CommunicationLayerImpl(CommunicationLayer):
         self._broker.stop()
 
 
-def communication_layer() -> CommunicationLayer:
-    return _CommunicationLayerImpl()
+def communication_layer(publishers: int = 1) -> CommunicationLayer:
+    """Return communication layer publishing over `publishers` persistent connections."""
+    return _CommunicationLayerImpl(publishers=publishers)
 
 
 class ExternalClientMock:
 
-    def __init__(self, communication_layer: CommunicationLayer, company: str, car: str) -> None:
+    def __init__(
+        self,
+        communication_layer: CommunicationLayer,
+        company: str,
+        car: str,
+        post_delay: float = 0.0,
+    ) -> None:
         self._comm_layer = communication_layer
         self._company = company
         self._car = car
+        self._post_delay = post_delay
 
-    def post(self, msg: _ExternalClientMsg, sleep: float = 0.1) -> None:
-        data = msg.SerializeToString()
-        self._comm_layer.post(self._company, self._car, data)
-        time.sleep(max(sleep, 0.0))
+    def post(
+        self, msg: _ExternalClientMsg, sleep: float | None = None, qos: int = 0
+    ) -> _MQTTMessageInfo:
+        """Publish the message without waiting for its delivery.
 
-    def get(self, n: int) -> list[_MQTTMessage]:
-        return self._comm_layer.collect(self._company, self._car, n)
+        The client sleeps for `sleep` seconds after publishing (the `post_delay` given to the constructor
+        by default). To wait for the delivery to the broker, pass the returned info to `wait_for_puback`.
+        """
+        data = msg.SerializeToString()
+        info = self._comm_layer.post(self._company, self._car, data, qos=qos)
+        delay = self._post_delay if sleep is None else sleep
+        if delay > 0.0:
+            time.sleep(delay)
+        return info
+
+    def post_serialized(self, data: Iterable[bytes], qos: int = 0) -> list[_MQTTMessageInfo]:
+        """Publish the already serialized messages back-to-back, without waiting or sleeping.
+
+        Use e.g. with the messages of a `StatusBatch`.
+        """
+        return self._comm_layer.post_many(self._company, self._car, data, qos=qos)
+
+    def wait_for_puback(self, info: _MQTTMessageInfo, timeout: float = 5.0) -> bool:
+        """Wait until the posted message is delivered to the broker. Return `False` on timeout."""
+        return wait_for_puback(info, timeout)
+
+    def get(
+        self, n: int, timeout: float | None = None, since: float | None = None
+    ) -> list[_MQTTMessage]:
+        """Return `n` messages sent by the External Server to the car.
+
+        Only messages received at or after the `since` time (as returned by `time.monotonic`,
+        the time of the call by default) are returned.
+        """
+        return self._comm_layer.collect(self._company, self._car, n, timeout=timeout, since=since)
+
+    def received(self, since: float) -> list[_MQTTMessage]:
+        """Return all the messages sent by the External Server to the car since the `since` time, without waiting."""
+        return self._comm_layer.collect(self._company, self._car, sys.maxsize, timeout=0, since=since)
+
+    def add_listener(self, listener: Callable[[_MQTTMessage], None]) -> None:
+        """Call the `listener` for every message sent by the External Server to the car.
+
+        The `listener` is called from the communication layer's thread.
+        """
+        self._comm_layer.add_listener(self._company, self._car, listener)
+
+    def remove_listener(self, listener: Callable[[_MQTTMessage], None]) -> None:
+        self._comm_layer.remove_listener(self._company, self._car, listener)
+
+    @property
+    def company(self) -> str:
+        return self._company
+
+    @property
+    def car(self) -> str:
+        return self._car
@@ -1,5 +1,6 @@
-from typing import Optional, Any, Literal
+from typing import Iterator, Optional, Any, Literal
 import enum
+import functools
 import time
 import json
 
@@ -123,3 +124,191 @@ def status(
         errorMessage=error_bytes,
     )
     return _ExternalClientMsg(status=status)
+
+
+# Protobuf wire types
+_VARINT = 0
+_LENGTH_DELIMITED = 2
+
+
+_ONE_BYTE_VARINTS = [bytes((i,)) for i in range(0x80)]
+
+
+def _varint(value: int) -> bytes:
+    if value < 0x80:
+        return _ONE_BYTE_VARINTS[value]
+    if value < 0x4000:
+        return bytes((value & 0x7F | 0x80, value >> 7))
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _tag(message: Any, field: str, wire_type: int) -> bytes:
+    return _varint(message.DESCRIPTOR.fields_by_name[field].number << 3 | wire_type)
+
+
+_STATUS_TAG = _tag(_ExternalClientMsg, "status", _LENGTH_DELIMITED)
+_COMMAND_RESPONSE_TAG = _tag(_ExternalClientMsg, "commandResponse", _LENGTH_DELIMITED)
+_STATUS_COUNTER_TAG = _tag(_Status, "messageCounter", _VARINT)
+_DEVICE_STATUS_TAG = _tag(_Status, "deviceStatus", _LENGTH_DELIMITED)
+_STATUS_DATA_TAG = _tag(DeviceStatus, "statusData", _LENGTH_DELIMITED)
+_COMMAND_RESPONSE_COUNTER_TAG = _tag(_CommandResponse, "messageCounter", _VARINT)
+
+
+class StatusTemplate:
+    """Serialized parts of status messages of a device in a session and a state.
+
+    The fields common to all the statuses are serialized once, only the message counter and the payload
+    are encoded for each message. When created, the template is checked to reproduce the protobuf
+    serialization. If it does not (e.g., the protobuf implementation orders the fields differently),
+    messages are serialized by protobuf instead.
+    """
+
+    def __init__(self, session_id: str, state: DeviceStateStr, device: Device) -> None:
+        self._session_id = session_id
+        self._state = state
+        self._device = device
+        self._prefix = _Status(sessionId=session_id, deviceState=device_status_str[state]).SerializeToString()
+        self._device_field = DeviceStatus(device=device).SerializeToString()
+        self._exact = all(
+            self._fill(counter, payload) == status(session_id, state, device, counter, payload).SerializeToString()
+            for counter, payload in ((0, b""), (300, b'{"check": 1}'))
+        )
+
+    def serialize(self, counter: int, payload: bytes | dict) -> bytes:
+        """Return the serialized status, the same as `status(...).SerializeToString()`."""
+        if not self._exact:
+            return status(self._session_id, self._state, self._device, counter, payload).SerializeToString()
+        return self._fill(counter, payload)
+
+    def _fill(self, counter: int, payload: bytes | dict) -> bytes:
+        data = json.dumps(payload).encode() if isinstance(payload, dict) else payload
+        counter_field = _STATUS_COUNTER_TAG + _varint(counter) if counter else b""
+        data_field = _STATUS_DATA_TAG + _varint(len(data)) if data else b""
+        device_status_length = len(self._device_field) + len(data_field) + len(data)
+        device_status_length_field = _varint(device_status_length)
+        body_length = (
+            len(self._prefix)
+            + len(counter_field)
+            + len(_DEVICE_STATUS_TAG)
+            + len(device_status_length_field)
+            + device_status_length
+        )
+        return b"".join(
+            (
+                _STATUS_TAG,
+                _varint(body_length),
+                self._prefix,
+                counter_field,
+                _DEVICE_STATUS_TAG,
+                device_status_length_field,
+                self._device_field,
+                data_field,
+                data,
+            )
+        )
+
+
+def status_template(session_id: str, state: DeviceStateStr, device: Device) -> StatusTemplate:
+    """Return the cached template of statuses of the device in the session and the state."""
+    return _status_template(session_id, state, device.SerializeToString())
+
+
+def status_bytes(
+    session_id: str, state: DeviceStateStr, device: Device, counter: int, payload: bytes | dict
+) -> bytes:
+    """Return the serialized status message, the same as `status(...).SerializeToString()`.
+
+    Only the message counter and the payload are encoded, the rest is taken from a cached `StatusTemplate`.
+    For the lowest overhead, keep the template returned by `status_template` and call its `serialize` method.
+    """
+    return status_template(session_id, state, device).serialize(counter, payload)
+
+
+def command_response_bytes(session_id: str, type: _CommandResponse.Type, counter: int) -> bytes:
+    """Return the serialized command response, the same as `command_response(...).SerializeToString()`.
+
+    The serialized fields common to all responses in the session are cached, only the message counter
+    is encoded on each call.
+    """
+    prefix = _command_response_template(session_id, type.value)
+    if prefix is None:
+        return command_response(session_id, type, counter).SerializeToString()
+    return _fill_command_response_template(prefix, counter)
+
+
+@functools.lru_cache(maxsize=4096)
+def _status_template(session_id: str, state: DeviceStateStr, device: bytes) -> StatusTemplate:
+    return StatusTemplate(session_id, state, Device.FromString(device))
+
+
+@functools.lru_cache(maxsize=4096)
+def _command_response_template(session_id: str, type: int) -> bytes | None:
+    """Return serialized session and type fields of a command response, `None` if not reproducing protobuf."""
+    prefix = _CommandResponse(sessionId=session_id, type=type).SerializeToString()
+    for counter in (0, 300):
+        expected = _ExternalClientMsg(
+            commandResponse=_CommandResponse(sessionId=session_id, type=type, messageCounter=counter)
+        ).SerializeToString()
+        if _fill_command_response_template(prefix, counter) != expected:
+            return None
+    return prefix
+
+
+def _fill_command_response_template(prefix: bytes, counter: int) -> bytes:
+    body = prefix + _COMMAND_RESPONSE_COUNTER_TAG + _varint(counter) if counter else prefix
+    return _COMMAND_RESPONSE_TAG + _varint(len(body)) + body
+
+
+class StatusBatch:
+    """Serialized status messages of the devices with consecutive message counters.
+
+    The messages are built and serialized in advance (the devices take turns), so they can be published
+    back-to-back without constructing any protobuf objects. The batch can be published repeatedly.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        devices: list[Device],
+        count: int,
+        payload: bytes | dict,
+        state: DeviceStateStr = "RUNNING",
+        first_counter: int = 0,
+    ) -> None:
+        if not devices:
+            raise ValueError("Status batch requires at least one device.")
+        payload_bytes = json.dumps(payload).encode() if isinstance(payload, dict) else payload
+        self._first_counter = first_counter
+        templates = [status_template(session_id, state, device) for device in devices]
+        self._messages = [
+            templates[i % len(templates)].serialize(first_counter + i, payload_bytes) for i in range(count)
+        ]
+
+    @property
+    def first_counter(self) -> int:
+        return self._first_counter
+
+    @property
+    def next_counter(self) -> int:
+        """Message counter following the last message of the batch."""
+        return self._first_counter + len(self._messages)
+
+    @property
+    def messages(self) -> list[bytes]:
+        return self._messages
+
+    @property
+    def size(self) -> int:
+        """Total size of the serialized messages in bytes."""
+        return sum(len(m) for m in self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._messages)
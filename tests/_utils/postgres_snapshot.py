@@ -0,0 +1,112 @@
+from __future__ import annotations
+import contextlib
+import fcntl
+import hashlib
+import os
+import subprocess
+import tempfile
+from typing import Iterator
+
+from tests._utils.environment import API_HOST
+from tests._utils.readiness import wait_for_http_api
+
+
+SNAPSHOT_REPOSITORY = "external-server-integration-tests/postgres-snapshot"
+COMPOSE_FILE = "docker-compose.yaml"
+_BUILD_COMPOSE_FILE = "docker-compose.postgres-snapshot-build.yaml"
+_SNAPSHOT_COMPOSE_FILE = "docker-compose.postgres-snapshot.yaml"
+_TMPFS_COMPOSE_FILE = "docker-compose.postgres-tmpfs.yaml"
+_SNAPSHOT_TMPFS_COMPOSE_FILE = "docker-compose.postgres-snapshot-tmpfs.yaml"
+# files determining the content of the initialized database
+_FINGERPRINTED_FILES = (
+    "db/insert_test_api_key.sh",
+    "config/http-api/config.json",
+    COMPOSE_FILE,
+    _BUILD_COMPOSE_FILE,
+)
+_FINGERPRINTED_IMAGES = ("FLEET_PROTOCOL_HTTP_API_IMAGE",)
+_POSTGRES_IMAGE = "postgres:16"
+_HTTP_API_READY_TIMEOUT = 60.0
+
+
+def compose_files(snapshot: bool, tmpfs: bool) -> list[str]:
+    """Return the docker compose files of the stack with the database started from the snapshot and/or in tmpfs."""
+    files = [COMPOSE_FILE]
+    if snapshot:
+        files.append(_SNAPSHOT_COMPOSE_FILE)
+    if tmpfs:
+        files.append(_TMPFS_COMPOSE_FILE)
+    if snapshot and tmpfs:
+        files.append(_SNAPSHOT_TMPFS_COMPOSE_FILE)
+    return files
+
+
+def snapshot_image(env: dict[str, str]) -> str:
+    """Return the tag of the Postgres image with the initialized `protocol_api` database.
+
+    The image is built only if it is not cached yet. The tag contains a fingerprint of the HTTP API
+    and Postgres images and of the files used to initialize the database, so the snapshot is rebuilt
+    whenever any of them changes. The docker compose stack of `env` must be down, as the image
+    is built by running the database and the HTTP API of the stack.
+    """
+    tag = f"{SNAPSHOT_REPOSITORY}:{_fingerprint(env)}"
+    with _build_lock():
+        if not _image_exists(tag):
+            print(f"Building Postgres snapshot image '{tag}'.")
+            _build(tag, env)
+    return tag
+
+
+def _build(tag: str, env: dict[str, str]) -> None:
+    """Let the HTTP API create its tables in a fresh database and commit the database container as the image."""
+    build_env = env | {"COMPOSE_FILE": os.pathsep.join((COMPOSE_FILE, _BUILD_COMPOSE_FILE))}
+    try:
+        _compose(build_env, "up", "-d", "http-api")
+        wait_for_http_api(API_HOST, timeout=_HTTP_API_READY_TIMEOUT)
+        _compose(build_env, "stop", "http-api")
+        # a clean shutdown leaves a consistent data directory
+        _compose(build_env, "stop", "postgresql-database")
+        container = _compose(build_env, "ps", "-aq", "postgresql-database").stdout.split()[0]
+        _docker("commit", container, tag)
+    finally:
+        _compose(build_env, "down", "-t", "0")
+
+
+def _fingerprint(env: dict[str, str]) -> str:
+    digest = hashlib.sha256()
+    for path in _FINGERPRINTED_FILES:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    for image in (*(env.get(name, "") for name in _FINGERPRINTED_IMAGES), _POSTGRES_IMAGE):
+        digest.update(image.encode())
+        digest.update(_image_id(image).encode())
+    return digest.hexdigest()[:16]
+
+
+def _image_id(image: str) -> str:
+    if not _image_exists(image):
+        _docker("pull", image)
+    return _docker("image", "inspect", "--format", "{{.Id}}", image).stdout.strip()
+
+
+def _image_exists(image: str) -> bool:
+    return _docker("image", "inspect", image, check=False).returncode == 0
+
+
+@contextlib.contextmanager
+def _build_lock() -> Iterator[None]:
+    """Keep the parallel test workers from building the same snapshot at once."""
+    with open(os.path.join(tempfile.gettempdir(), "postgres-snapshot.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _compose(env: dict[str, str], *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker", "compose", *args], env=env, capture_output=True, text=True, check=True)
+
+
+def _docker(*args: str, check: bool = True) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker", *args], capture_output=True, text=True, check=check)
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import socket
+import time
+import urllib.error
+import urllib.request
+
+
+# MQTT 3.1.1 CONNECT packet with clean session, keep alive of 60 s and client ID 'readiness-probe'
+_MQTT_CONNECT = bytes([0x10, 0x1B, 0x00, 0x04]) + b"MQTT" + bytes([0x04, 0x02, 0x00, 0x3C, 0x00, 0x0F])
+_MQTT_CONNECT += b"readiness-probe"
+_MQTT_CONNACK_ACCEPTED = bytes([0x20, 0x02, 0x00, 0x00])
+_MQTT_DISCONNECT = bytes([0xE0, 0x00])
+
+
+def wait_for_broker(host: str, port: int, timeout: float = 10.0, poll: float = 0.05) -> None:
+    """Wait until the MQTT broker accepts a connection (CONNECT and CONNACK handshake).
+
+    Raise `TimeoutError` if the broker is not ready within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not _mqtt_handshake(host, port, poll):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"MQTT broker on {host}:{port} is not ready after {timeout} s.")
+        time.sleep(poll)
+
+
+def wait_for_http_api(url: str, timeout: float = 30.0, poll: float = 0.1) -> None:
+    """Wait until the HTTP API responds with status 200 on the `url`.
+
+    Raise `TimeoutError` if the API is not ready within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not _responds_ok(url, poll):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"HTTP API on {url} is not ready after {timeout} s.")
+        time.sleep(poll)
+
+
+def _mqtt_handshake(host: str, port: int, socket_timeout: float) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=max(socket_timeout, 0.5)) as sock:
+            sock.sendall(_MQTT_CONNECT)
+            connack = b""
+            while len(connack) < len(_MQTT_CONNACK_ACCEPTED):
+                chunk = sock.recv(len(_MQTT_CONNACK_ACCEPTED) - len(connack))
+                if not chunk:
+                    return False
+                connack += chunk
+            sock.sendall(_MQTT_DISCONNECT)
+            return connack == _MQTT_CONNACK_ACCEPTED
+    except OSError:
+        return False
+
+
+def _responds_ok(url: str, request_timeout: float) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=max(request_timeout, 1.0)) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
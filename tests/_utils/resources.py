@@ -0,0 +1,231 @@
+from __future__ import annotations
+import http.client
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Any
+
+
+SERVICES = ("external-server", "http-api", "postgresql-database")
+_DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
+_COMMAND_TIMEOUT = 5.0
+
+
+class ResourceSampler:
+    """Periodically sample resource usage of the docker compose services.
+
+    CPU time, resident memory and network traffic of each service's container are read from the
+    Docker Engine stats API, the number of open file descriptors of the container's main process
+    is counted in `/proc/1/fd`. Containers are looked up by the docker compose project in `env`
+    and again whenever they disappear, so the sampler survives restarts of the stack.
+    """
+
+    def __init__(
+        self, env: dict[str, str], services: tuple[str, ...] = SERVICES, interval: float = 1.0
+    ) -> None:
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive.")
+        self._env = env
+        self._services = services
+        self._interval = interval
+        self._containers: dict[str, str] = {}
+        self._cpu_started: dict[str, int] = {}
+        self._previous_cpu: dict[str, tuple[int, int]] = {}
+        self._series: dict[str, dict[str, list]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def latest(self, service: str, key: str) -> Any:
+        """Return the last sampled value of the `key` (e.g. `rss_bytes`) of the service, `None` if there is none."""
+        with self._lock:
+            values = self._series.get(service, {}).get(key, [])
+            return values[-1] if values else None
+
+    def peak(self, service: str, key: str, since: float = 0.0, until: float | None = None) -> Any:
+        """Return the highest sampled value of the `key` of the service between the `since` and `until` times.
+
+        The times are `time.monotonic()` values, `None` is returned if there is no such sample.
+        """
+        with self._lock:
+            series = self._series.get(service, {})
+            samples = zip(series.get("time_s", []), series.get(key, []))
+            values = [
+                value
+                for time_s, value in samples
+                if value is not None
+                and self._started + time_s >= since
+                and (until is None or self._started + time_s <= until)
+            ]
+        return max(values, default=None)
+
+    def series(self) -> dict[str, Any]:
+        """Return the time series of every service and their summary.
+
+        Times are in seconds since the start of the sampler. CPU is given both as the cumulative CPU
+        time in seconds since the first sample of the service's current container (it starts again
+        from zero after the container is replaced or restarted) and as utilization in percent of
+        a single CPU.
+        """
+        with self._lock:
+            series = {service: {k: list(v) for k, v in s.items()} for service, s in self._series.items()}
+        return {"interval_s": self._interval, "services": series, "summary": _summary(series)}
+
+    def _run(self) -> None:
+        while True:
+            for service in self._services:
+                self._sample(service)
+            if self._stopped.wait(self._interval):
+                return
+
+    def _sample(self, service: str) -> None:
+        container = self._container(service)
+        if container is None:
+            return
+        stats = _docker_api_get(f"/containers/{container}/stats?stream=false&one-shot=true")
+        if stats is None or not stats.get("cpu_stats"):
+            self._forget(service)
+            return
+        sample = {"time_s": time.monotonic() - self._started} | self._cpu(service, stats["cpu_stats"])
+        sample |= _memory(stats.get("memory_stats", {})) | _network(stats.get("networks", {}))
+        sample["open_fds"] = _open_fds(container)
+        with self._lock:
+            series = self._series.setdefault(service, {})
+            for key, value in sample.items():
+                series.setdefault(key, []).append(value)
+
+    def _container(self, service: str) -> str | None:
+        if service not in self._containers:
+            result = _run(["docker", "compose", "ps", "-q", service], self._env)
+            if result is None or not result.strip():
+                return None
+            self._containers[service] = result.split()[0]
+        return self._containers[service]
+
+    def _forget(self, service: str) -> None:
+        """Drop the container of the service, the next sample looks it up and starts its CPU time anew."""
+        self._containers.pop(service, None)
+        self._cpu_started.pop(service, None)
+        self._previous_cpu.pop(service, None)
+
+    def _cpu(self, service: str, cpu_stats: dict) -> dict[str, float | None]:
+        usage = cpu_stats["cpu_usage"]["total_usage"]
+        system = cpu_stats.get("system_cpu_usage", 0)
+        previous = self._previous_cpu.get(service)
+        if previous is not None and usage < previous[0]:
+            # the container was restarted between the samples, its CPU time counts from zero again
+            self._cpu_started.pop(service, None)
+            previous = None
+        self._cpu_started.setdefault(service, usage)
+        self._previous_cpu[service] = (usage, system)
+        percent = None
+        if previous is not None and system > previous[1]:
+            cpus = cpu_stats.get("online_cpus") or 1
+            percent = (usage - previous[0]) / (system - previous[1]) * cpus * 100.0
+        return {"cpu_seconds": (usage - self._cpu_started[service]) / 1e9, "cpu_percent": percent}
+
+
+def write_series(path: str, series: dict[str, Any]) -> None:
+    """Store the resource time series as JSON."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(series, f, indent=2)
+
+
+def _memory(memory_stats: dict) -> dict[str, int | None]:
+    stats = memory_stats.get("stats", {})
+    # `anon` on cgroup v2, `rss` on cgroup v1
+    rss = stats.get("anon", stats.get("rss"))
+    return {"rss_bytes": rss, "memory_usage_bytes": memory_stats.get("usage")}
+
+
+def _network(networks: dict) -> dict[str, int]:
+    return {
+        "net_rx_bytes": sum(n.get("rx_bytes", 0) for n in networks.values()),
+        "net_tx_bytes": sum(n.get("tx_bytes", 0) for n in networks.values()),
+    }
+
+
+def _open_fds(container: str) -> int | None:
+    output = _run(["docker", "exec", container, "ls", "/proc/1/fd"])
+    return None if output is None else len(output.split())
+
+
+def _summary(series: dict[str, dict[str, list]]) -> dict[str, dict[str, float | int | None]]:
+    summary = {}
+    for service, s in series.items():
+        cpu = [v for v in s.get("cpu_percent", []) if v is not None]
+        rss = [v for v in s.get("rss_bytes", []) if v is not None]
+        fds = [v for v in s.get("open_fds", []) if v is not None]
+        summary[service] = {
+            "cpu_seconds": s["cpu_seconds"][-1] if s.get("cpu_seconds") else None,
+            "mean_cpu_percent": sum(cpu) / len(cpu) if cpu else None,
+            "peak_cpu_percent": max(cpu, default=None),
+            "peak_rss_bytes": max(rss, default=None),
+            "peak_open_fds": max(fds, default=None),
+        }
+    return summary
+
+
+def _run(command: list[str], env: dict[str, str] | None = None) -> str | None:
+    try:
+        result = subprocess.run(
+            command, env=env, capture_output=True, text=True, timeout=_COMMAND_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost", timeout=_COMMAND_TIMEOUT)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def _docker_api_get(path: str) -> dict | None:
+    docker_host = os.environ.get("DOCKER_HOST", f"unix://{_DEFAULT_DOCKER_SOCKET}")
+    if not docker_host.startswith("unix://"):
+        return None
+    connection = _UnixHTTPConnection(docker_host.removeprefix("unix://"))
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        if response.status != 200:
+            return None
+        return json.loads(response.read())
+    except (OSError, http.client.HTTPException, json.JSONDecodeError):
+        return None
+    finally:
+        connection.close()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+import os
+import re
+import time
+from typing import Callable, TypeVar
+
+from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.external_client import ExternalClientMock
+from tests._utils.messages import CmdResponseType, Message, _ExternalClientMsg, _ExternalServerMsg
+
+
+T = TypeVar("T")
+
+DEFAULT_TIMEOUT = 5.0
+_POLL = 0.05
+_CONNECT_RETRY_PAUSE = 0.2
+_SERVER_LOG_DIR = "external-server"
+# line of the External Server log reporting a timeout ending a session or a connect sequence
+SESSION_TIMEOUT_EVENT = r"(?i)\btime(d)?[ _-]?out"
+
+
+def wait_until(
+    predicate: Callable[[], T], timeout: float = DEFAULT_TIMEOUT, poll: float = _POLL, description: str = ""
+) -> T:
+    """Call the `predicate` every `poll` seconds until it returns a truthy value and return the value.
+
+    Raise `TimeoutError` if the value is not truthy within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not (value := predicate()):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{description or 'Condition'} not met within {timeout} s.")
+        time.sleep(poll)
+    return value
+
+
+def wait_for_server_messages(
+    ext_client: ExternalClientMock,
+    match: Callable[[_ExternalServerMsg], bool],
+    since: float,
+    count: int = 1,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> list[_ExternalServerMsg]:
+    """Return the first `count` messages sent by the External Server to the car since the `since` time matching `match`.
+
+    The messages are taken from the test broker's buffer, `since` is a `time.monotonic()` value.
+    Raise `TimeoutError` if there are not enough such messages within `timeout` seconds.
+    """
+
+    def find() -> list[_ExternalServerMsg] | None:
+        messages = [_ExternalServerMsg.FromString(m.payload) for m in ext_client.received(since)]
+        matching = [msg for msg in messages if match(msg)]
+        return matching[:count] if len(matching) >= count else None
+
+    return wait_until(find, timeout, description=f"{count} messages from the External Server to '{ext_client.car}'")
+
+
+def is_command(msg: _ExternalServerMsg) -> bool:
+    return msg.HasField("command")
+
+
+def is_status_response(counter: int) -> Callable[[_ExternalServerMsg], bool]:
+    """Return a `match` of the status response to the status with the message `counter`."""
+    return lambda msg: msg.HasField("statusResponse") and msg.statusResponse.messageCounter == counter
+
+
+def wait_for_accepted_connect(
+    ext_client: ExternalClientMock,
+    connect: _ExternalClientMsg,
+    timeout: float = DEFAULT_TIMEOUT,
+    attempt_timeout: float = 1.0,
+) -> None:
+    """Post the connect message until the External Server accepts it by a `ConnectResponse` with the OK type.
+
+    Use e.g. after the server is expected to end the previous session, instead of sleeping for a fixed time.
+    Every attempt waits for the server's response for at most `attempt_timeout` seconds.
+    Raise `TimeoutError` if the connect message is not accepted within `timeout` seconds.
+    """
+
+    def attempt() -> bool:
+        since = time.monotonic()
+        ext_client.post(connect, sleep=0.0)
+        try:
+            (response,) = wait_for_server_messages(
+                ext_client, lambda msg: msg.HasField("connectResponse"), since, timeout=attempt_timeout
+            )
+        except TimeoutError:
+            return False
+        return response.connectResponse.type == CmdResponseType.OK.value
+
+    wait_until(attempt, timeout, poll=_CONNECT_RETRY_PAUSE, description=f"Accepted connect of '{ext_client.car}'")
+
+
+def wait_for_statuses(
+    api: ApiClientMock,
+    company: str,
+    car: str,
+    until: Callable[[list[Message]], bool],
+    since: int = 0,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> list[Message]:
+    """Poll the statuses of the car on the API newer than `since` (in milliseconds) until `until(statuses)` holds.
+
+    Return the statuses. As with `ExternalClientMock.get`, the statuses available after `timeout` seconds
+    are returned even if the condition does not hold, so that the test's assertions report the difference.
+    """
+    deadline = time.monotonic() + timeout
+    while not until(statuses := api.get_statuses(company, car, since=since)):
+        if time.monotonic() > deadline:
+            break
+        time.sleep(_POLL)
+    return statuses
+
+
+class ServerLog:
+    """Log files of the External Server written to `<LOG_DIR>/external-server`.
+
+    The position of the log is the size of every file in the directory. Events are searched for only
+    in the lines written after a given position, so create the `ServerLog` (or call `position`)
+    before the action causing the event.
+    """
+
+    def __init__(self, log_dir: str | None = None) -> None:
+        self._dir = os.path.join(log_dir or os.environ.get("LOG_DIR", "./log"), _SERVER_LOG_DIR)
+        self._start = self.position()
+
+    def position(self) -> dict[str, int]:
+        positions = {}
+        for name in self._files():
+            try:
+                positions[name] = os.path.getsize(os.path.join(self._dir, name))
+            except OSError:
+                continue
+        return positions
+
+    def lines_since(self, position: dict[str, int] | None = None) -> list[str]:
+        """Return the lines written to any of the log files after the `position` (the creation by default)."""
+        position = self._start if position is None else position
+        lines: list[str] = []
+        for name in self._files():
+            try:
+                path = os.path.join(self._dir, name)
+                offset = position.get(name, 0)
+                # the file was rotated or truncated since
+                if os.path.getsize(path) < offset:
+                    offset = 0
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    lines.extend(f.read().decode(errors="replace").splitlines())
+            except OSError:
+                continue
+        return lines
+
+    def _files(self) -> list[str]:
+        try:
+            return sorted(name for name in os.listdir(self._dir) if os.path.isfile(os.path.join(self._dir, name)))
+        except OSError:
+            return []
+
+
+def wait_for_server_event(
+    pattern: str, log: ServerLog, position: dict[str, int] | None = None, timeout: float = DEFAULT_TIMEOUT
+) -> str:
+    """Return the first line of the External Server log matching the regular expression `pattern`.
+
+    Only the lines written after the `position` of the `log` (its creation by default) are searched.
+    As the log format depends on the External Server implementation, use the events only where
+    the messages of the server do not tell the same. Raise `TimeoutError` if there is no such line
+    within `timeout` seconds.
+    """
+    regex = re.compile(pattern)
+    return wait_until(
+        lambda: next((line for line in log.lines_since(position) if regex.search(line)), None),
+        timeout,
+        description=f"External Server log event '{pattern}'",
+    )
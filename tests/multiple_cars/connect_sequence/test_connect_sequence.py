@@ -3,7 +3,9 @@ import time
 
 from tests._utils.api_client_mock import ApiClientMock
 from tests._utils.external_client import ExternalClientMock, communication_layer
-from tests._utils.docker import docker_compose_up, docker_compose_down
+from tests._utils.environment import API_HOST
+from tests._utils.docker import docker_compose_up
+from tests._utils.wait import wait_for_server_messages, wait_for_statuses
 from tests._utils.messages import (
     CmdResponseType,
     DeviceState,
@@ -15,7 +17,6 @@ from tests._utils.messages import (
 )
 
 
-API_HOST = "http://localhost:8080/v2/protocol"
 comm_layer = communication_layer()
 test_device = device_obj(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
 test_device_id = device_id(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
@@ -25,10 +26,10 @@ class Test_Connection_Sequence(unittest.TestCase):
 
     def setUp(self) -> None:
         comm_layer.start()
-        self.ec_a = ExternalClientMock(comm_layer, "company_x", "car_a")
-        self.ec_b = ExternalClientMock(comm_layer, "company_x", "car_b")
+        self.ec_a = ExternalClientMock(comm_layer, "company_x", "car_a", post_delay=0.1)
+        self.ec_b = ExternalClientMock(comm_layer, "company_x", "car_b", post_delay=0.1)
         self.api = ApiClientMock(API_HOST, "TestAPIKey")
-        docker_compose_up("config_2_cars.json")
+        docker_compose_up("config_2_cars.json", test=self)
 
     def test_sending_connect_message_statuses_and_commands_makes_successful_connect_sequence(
         self,
@@ -43,9 +44,7 @@ class Test_Connection_Sequence(unittest.TestCase):
         self.ec_b.post(status("id", "CONNECTING", test_device, 0, payload_2), sleep=0.1)
         self.ec_b.post(command_response("id", CmdResponseType.OK, 0))
 
-        time.sleep(1)
-
-        s_a = self.api.get_statuses("company_x", "car_a")[0]
+        s_a = wait_for_statuses(self.api, "company_x", "car_a", lambda s: len(s) >= 1)[0]
         self.assertEqual(s_a.device_id.module_id, test_device.module)
         self.assertEqual(s_a.device_id.type, test_device.deviceType)
         self.assertEqual(s_a.device_id.role, test_device.deviceRole)
@@ -54,7 +53,7 @@ class Test_Connection_Sequence(unittest.TestCase):
         self.assertEqual(s_a.payload.encoding, "JSON")
         self.assertEqual(s_a.payload.data.to_dict(), payload_1)
 
-        s_b = self.api.get_statuses("company_x", "car_b")[0]
+        s_b = wait_for_statuses(self.api, "company_x", "car_b", lambda s: len(s) >= 1)[0]
         self.assertEqual(s_b.device_id.module_id, test_device.module)
         self.assertEqual(s_b.device_id.type, test_device.deviceType)
         self.assertEqual(s_b.device_id.role, test_device.deviceRole)
@@ -72,22 +71,24 @@ class Test_Connection_Sequence(unittest.TestCase):
         self.ec_a.post(status("id", "CONNECTING", test_device, 0, payload_0), sleep=0.1)
         self.ec_a.post(command_response("id", CmdResponseType.OK, 0))
 
-        time.sleep(0.5)
+        wait_for_statuses(self.api, "company_x", "car_a", lambda s: len(s) >= 1)
 
         self.ec_a.post(status("id", "RUNNING", test_device, 0, payload_1), sleep=0.1)
-        self.ec_b.post(status("id", "RUNNING", test_device, 0, payload_2), sleep=0.1)
-
-        time.sleep(1)
+        since = time.monotonic()
+        self.ec_b.post(status("id", "RUNNING", test_device, 0, payload_2), sleep=0.0)
 
         # status for car_1 has been succesfully sent
-        statuses = self.api.get_statuses("company_x", "car_a")
+        statuses = wait_for_statuses(self.api, "company_x", "car_a", lambda s: len(s) >= 2)
         self.assertEqual(len(statuses), 2)
+        # the server handles the messages of a car in order, so once it answers a connect message
+        # posted after the status of car_b, the status has been handled
+        self.ec_b.post(connect_msg("id", "company_x", "car_b", [test_device]), sleep=0.0)
+        wait_for_server_messages(self.ec_b, lambda msg: msg.HasField("connectResponse"), since)
         # no status for car_2 - connect sequence failed
         statuses = self.api.get_statuses("company_x", "car_b")
         self.assertEqual(len(statuses), 0)
 
     def tearDown(self):
-        docker_compose_down()
         comm_layer.stop()
 
 
@@ -1,10 +1,11 @@
 import unittest
-import time
 import json
 
 from tests._utils.api_client_mock import ApiClientMock
 from tests._utils.external_client import ExternalClientMock, communication_layer
-from tests._utils.docker import docker_compose_up, docker_compose_down
+from tests._utils.environment import API_HOST
+from tests._utils.docker import docker_compose_up, requires_full_restart
+from tests._utils.wait import wait_for_statuses
 from tests._utils.messages import (
     CmdResponseType,
     api_command,
@@ -17,7 +18,6 @@ from tests._utils.messages import (
 )
 
 
-API_HOST = "http://localhost:8080/v2/protocol"
 comm_layer = communication_layer()
 test_device = device_obj(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
 test_device_id = device_id(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
@@ -27,9 +27,9 @@ class Test_Connection_Sequence(unittest.TestCase):
 
     def setUp(self) -> None:
         comm_layer.start()
-        self.ec = ExternalClientMock(comm_layer, "company_x", "car_a")
+        self.ec = ExternalClientMock(comm_layer, "company_x", "car_a", post_delay=0.1)
         self.api = ApiClientMock(API_HOST, "TestAPIKey")
-        docker_compose_up()
+        docker_compose_up(test=self)
 
     def test_sending_connect_message_statuses_and_commands_makes_successful_connect_sequence(
         self,
@@ -40,8 +40,8 @@ class Test_Connection_Sequence(unittest.TestCase):
             status("id", "CONNECTING", test_device, 0, json.dumps(payload).encode()),
             sleep=0.1,
         )
-        self.ec.post(command_response("id", CmdResponseType.OK, 0), sleep=0.5)
-        statuses = self.api.get_statuses("company_x", "car_a")
+        self.ec.post(command_response("id", CmdResponseType.OK, 0))
+        statuses = wait_for_statuses(self.api, "company_x", "car_a", lambda s: len(s) >= 1)
         self.assertEqual(len(statuses), 1)
         s = statuses[0]
         self.assertEqual(s.device_id.module_id, test_device.module)
@@ -56,7 +56,6 @@ class Test_Connection_Sequence(unittest.TestCase):
             status("id", "CONNECTING", test_device, 0, json.dumps(payload).encode()),
             sleep=0.1,
         )
-        time.sleep(0.5)
         statuses = self.api.get_statuses("company_x", "car_a", wait=True)
         self.assertEqual(len(statuses), 0)
 
@@ -80,6 +79,8 @@ class Test_Connection_Sequence(unittest.TestCase):
         self.assertEqual(s.device_id.name, test_device.deviceName)
         self.assertEqual(s.payload.data.to_dict(), payload)
 
+    # messages are posted to the API before the car connects, the HTTP API must start from scratch
+    @requires_full_restart
     def test_sending_getting_multiple_commands_does_not_interrupt_the_connect_sequence(
         self,
     ):
@@ -102,12 +103,11 @@ class Test_Connection_Sequence(unittest.TestCase):
             status("id", "CONNECTING", test_device, 0, json.dumps(status_payload).encode()),
             sleep=0.1,
         )
-        self.ec.post(command_response("id", CmdResponseType.OK, 0), sleep=0.5)
-        statuses = self.api.get_statuses("company_x", "car_a")
+        self.ec.post(command_response("id", CmdResponseType.OK, 0))
+        statuses = wait_for_statuses(self.api, "company_x", "car_a", lambda s: len(s) >= 2)
         self.assertEqual(len(statuses), 2)
 
     def tearDown(self):
-        docker_compose_down()
         comm_layer.stop()
 
 
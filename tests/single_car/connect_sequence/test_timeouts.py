@@ -1,12 +1,18 @@
 import unittest
-import time
 import json
 
 from tests._utils.api_client_mock import ApiClientMock
 from tests._utils.external_client import ExternalClientMock, communication_layer
-from tests._utils.docker import docker_compose_up, docker_compose_down
+from tests._utils.environment import API_HOST
+from tests._utils.docker import docker_compose_up
+from tests._utils.wait import (
+    SESSION_TIMEOUT_EVENT,
+    ServerLog,
+    wait_for_accepted_connect,
+    wait_for_server_event,
+    wait_for_statuses,
+)
 from tests._utils.messages import (
-    Device,
     command_response,
     connect_msg,
     device_obj,
@@ -16,69 +22,78 @@ from tests._utils.messages import (
 )
 
 
-API_HOST = "http://localhost:8080/v2/protocol"
 _comm_layer = communication_layer()
 test_device = device_obj(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
 test_device_id = device_id(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
+# time after the server's timeout within which the reset sequence must log the timeout and accept
+# a new connect message
+_RESET_MARGIN = 1.0
 
 
 class Test_Message_Timeout(unittest.TestCase):
 
     def setUp(self) -> None:
         _comm_layer.start()
-        self.ec = ExternalClientMock(_comm_layer, "company_x", "car_a")
+        self.ec = ExternalClientMock(_comm_layer, "company_x", "car_a", post_delay=0.1)
         self.api_client = ApiClientMock(API_HOST, "TestAPIKey")
-        docker_compose_up()
+        docker_compose_up(test=self)
         self.msg_timeout = json.load(open("config/external-server/config.json"))["timeout"]
+        self.server_log = ServerLog()
 
     def test_not_receiving_connect_message_resets_connection_sequence(self):
-        time.sleep(self.msg_timeout + 0.2)
-        self.ec.post(connect_msg("id", "company_x", "car_a", [test_device]))
+        self._wait_for_timeout()
+        wait_for_accepted_connect(
+            self.ec, connect_msg("id", "company_x", "car_a", [test_device]), timeout=_RESET_MARGIN
+        )
         payload_1 = {"content": "An arbitrary string ...", "timestamp": 111}
         self.ec.post(status("id", "CONNECTING", test_device, 0, payload_1))
         self.ec.post(command_response("id", CmdResponseType.OK, 0))
         payload_2 = {"content": "An arbitrary string XXX", "timestamp": 222}
         self.ec.post(status("id", "RUNNING", test_device, 1, payload_2))
-        s = self.api_client.get_statuses("company_x", "car_a")
+        s = wait_for_statuses(self.api_client, "company_x", "car_a", lambda s: _last_data(s) == payload_2)
         self.assertEqual(s[-1].payload.data.to_dict(), payload_2)
 
     def test_not_receiving_connecting_status_resets_connection_sequence(self):
         self.ec.post(connect_msg("id", "company_x", "car_a", [test_device]))
-        time.sleep(self.msg_timeout + 1)
-        self.ec.post(connect_msg("other_id", "company_x", "car_a", [test_device]))
+        self._wait_for_timeout()
+        wait_for_accepted_connect(
+            self.ec, connect_msg("other_id", "company_x", "car_a", [test_device]), timeout=_RESET_MARGIN
+        )
         payload_1 = {"content": "An arbitrary string ...", "timestamp": 111}
         self.ec.post(status("other_id", "CONNECTING", test_device, 0, payload_1))
         self.ec.post(command_response("other_id", CmdResponseType.OK, 0))
         payload_2 = {"content": "An arbitrary string XXX", "timestamp": 222}
         self.ec.post(status("other_id", "RUNNING", test_device, 1, payload_2))
-        s = self.api_client.get_statuses("company_x", "car_a", wait=True)
+        s = wait_for_statuses(self.api_client, "company_x", "car_a", lambda s: _last_data(s) == payload_2)
         self.assertEqual(s[-1].payload.data.to_dict(), payload_2)
 
     def test_not_receiving_first_command_response_resets_connection_sequence(self):
         self.ec.post(connect_msg("id", "company_x", "car_a", [test_device]))
         payload_1 = {"content": "An arbitrary string ...", "timestamp": 111}
         self.ec.post(status("id", "CONNECTING", test_device, 0, payload_1))
-        time.sleep(self.msg_timeout + 1)
-        self.ec.post(connect_msg("other_id", "company_x", "car_a", [test_device]))
+        self._wait_for_timeout()
+        wait_for_accepted_connect(
+            self.ec, connect_msg("other_id", "company_x", "car_a", [test_device]), timeout=_RESET_MARGIN
+        )
         payload_2 = {"content": "An arbitrary string XXX", "timestamp": 222}
         self.ec.post(status("other_id", "CONNECTING", test_device, 0, payload_2))
         self.ec.post(command_response("other_id", CmdResponseType.OK, 0))
         payload_3 = {"content": "An arbitrary string XXX", "timestamp": 333}
         self.ec.post(status("other_id", "RUNNING", test_device, 1, payload_3))
-        s = self.api_client.get_statuses("company_x", "car_a")
+        s = wait_for_statuses(self.api_client, "company_x", "car_a", lambda s: _last_data(s) == payload_3)
         self.assertEqual(s[-1].payload.data.to_dict(), payload_3)
 
     def tearDown(self):
-        docker_compose_down()
         _comm_layer.stop()
 
-    def _run_connect_seq(
-        self, session_id: str, test_device: Device, ext_client: ExternalClientMock
-    ) -> None:
-        ext_client.post(connect_msg(session_id, "company_x", "car_a", [test_device]))
-        payload = {"content": "An arbitrary string ...", "timestamp": 111}
-        ext_client.post(status(session_id, "CONNECTING", test_device, 0, payload))
-        ext_client.post(command_response(session_id, CmdResponseType.OK, 0))
+    def _wait_for_timeout(self) -> None:
+        wait_for_server_event(
+            SESSION_TIMEOUT_EVENT, self.server_log, timeout=self.msg_timeout + _RESET_MARGIN
+        )
+
+
+def _last_data(statuses: list) -> dict | None:
+    return statuses[-1].payload.data.to_dict() if statuses else None
 
 
 if __name__ == "__main__":  # pragma: no cover
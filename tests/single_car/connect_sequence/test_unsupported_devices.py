@@ -2,7 +2,8 @@ import unittest
 
 from tests._utils.api_client_mock import ApiClientMock
 from tests._utils.external_client import ExternalClientMock, communication_layer
-from tests._utils.docker import docker_compose_up, docker_compose_down
+from tests._utils.environment import API_HOST
+from tests._utils.docker import docker_compose_up
 from tests._utils.messages import (
     CmdResponseType,
     command_response,
@@ -13,7 +14,6 @@ from tests._utils.messages import (
 )
 
 
-API_HOST = "http://localhost:8080/v2/protocol"
 _comm_layer = communication_layer()
 test_device = device_obj(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
 test_device_id = device_id(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
@@ -30,9 +30,9 @@ class Test_Unsupported_Device(unittest.TestCase):
 
     def setUp(self) -> None:
         _comm_layer.start()
-        self.ec = ExternalClientMock(_comm_layer, "company_x", "car_a")
+        self.ec = ExternalClientMock(_comm_layer, "company_x", "car_a", post_delay=0.1)
         self.api_client = ApiClientMock(API_HOST, "TestAPIKey")
-        docker_compose_up()
+        docker_compose_up(test=self)
 
     def test_only_supported_devices_pass_connect_seq_with_statuses_sent_to_api(self):
         payload = {"content": "An arbitrary string ...", "timestamp": 111}
@@ -47,7 +47,6 @@ class Test_Unsupported_Device(unittest.TestCase):
         self.assertEqual(s[0].device_id.name, "Test_Device_1")
 
     def tearDown(self):
-        docker_compose_down()
         _comm_layer.stop()
 
 
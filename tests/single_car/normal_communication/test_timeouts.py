@@ -6,35 +6,39 @@ import json
 sys.path.append("lib/fleet-protocol/protobuf/compiled/python")
 
 from tests._utils.api_client_mock import ApiClientMock
+from tests._utils.connect_sequence import ConnectSequenceDriver
 from tests._utils.external_client import ExternalClientMock, communication_layer
-from tests._utils.docker import docker_compose_up, docker_compose_down
-from tests._utils.messages import (
-    api_command,
-    command_response,
-    connect_msg,
-    device_obj,
-    CmdResponseType,
-    Device,
-    device_id,
-    status,
+from tests._utils.environment import API_HOST
+from tests._utils.docker import docker_compose_up
+from tests._utils.wait import (
+    SESSION_TIMEOUT_EVENT,
+    ServerLog,
+    wait_for_server_event,
+    wait_for_statuses,
 )
+from tests._utils.messages import api_command, device_obj, device_id, status
 
 
 test_device = device_obj(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
 test_device_id = device_id(module_id=3, device_type=1, role="test_device_1", name="Test_Device_1")
-API_HOST = "http://localhost:8080/v2/protocol"
 _comm_layer = communication_layer()
+_CONNECTING_PAYLOAD = {"content": "An arbitrary string ...", "timestamp": 000}
+# time after the server's timeout within which the timeout must be logged and a new session accepted
+_RESET_MARGIN = 1.0
+# time to finish the connect sequence once the connect message is accepted
+_CONNECT_SEQUENCE_TIME = 0.5
 
 
 class Test_Message_Timeout(unittest.TestCase):
 
     def setUp(self) -> None:
         _comm_layer.start()
-        self.ec = ExternalClientMock(_comm_layer, "company_x", "car_a")
+        self.ec = ExternalClientMock(_comm_layer, "company_x", "car_a", post_delay=0.1)
         self.api_client = ApiClientMock(API_HOST, "TestAPIKey")
-        docker_compose_up()
-        self._run_connect_sequence(session_id="id", test_device=test_device, ext_client=self.ec)
+        docker_compose_up(test=self)
+        ConnectSequenceDriver(self.ec, [test_device], "id", _CONNECTING_PAYLOAD).run()
         self.msg_timeout = json.load(open("config/external-server/config.json"))["timeout"]
+        self.server_log = ServerLog()
 
     def test_not_receiving_skipped_status_until_timeout_allows_for_new_connect_sequence_with_new_session_id(
         self,
@@ -42,16 +46,17 @@ class Test_Message_Timeout(unittest.TestCase):
         payload = {"content": "An arbitrary string ...", "timestamp": 111}
         self.ec.post(status("id", "RUNNING", test_device, 1, payload))
         self.ec.post(status("id", "RUNNING", test_device, 3, payload))
-        time.sleep(self.msg_timeout)
+        self._wait_for_timeout()
         # timeout is reached, new connection sequence below is accepted
-        time.sleep(1)
-        self._run_connect_sequence(session_id="new_id", test_device=test_device, ext_client=self.ec)
+        # the server may still be finishing the previous session
+        ConnectSequenceDriver(self.ec, [test_device], "new_id", _CONNECTING_PAYLOAD, retry_connect=True).run(
+            _RESET_MARGIN + _CONNECT_SEQUENCE_TIME
+        )
         timestamp = int(time.time() * 1000)
         payload = {"content": "Another arbitrary string ...", "timestamp": 222}
         # status is published with new session id and forwared to the API
         self.ec.post(status("new_id", "RUNNING", test_device, 1, payload))
-        time.sleep(0.5)
-        s = self.api_client.get_statuses("company_x", "car_a", since=timestamp)
+        s = wait_for_statuses(self.api_client, "company_x", "car_a", lambda s: len(s) >= 1, since=timestamp)
         self.assertEqual(len(s), 1)
 
     def test_not_receiving_cmd_response_allows_for_new_connect_seq_with_new_session_id(
@@ -59,30 +64,28 @@ class Test_Message_Timeout(unittest.TestCase):
     ):
         payload = {"content": "An arbitrary string ...", "timestamp": 111}
         self.api_client.post_commands("company_x", "car_a", api_command(test_device_id, payload))
+        # the status in the middle of the timeout does not stop the server from waiting for the response
         time.sleep(self.msg_timeout / 2)
         self.ec.post(status("id", "RUNNING", test_device, 1, payload))
-        time.sleep(self.msg_timeout / 2)
+        self._wait_for_timeout()
         # timeout is reached, new connection sequence below is accepted
-        time.sleep(1)
-        self._run_connect_sequence(session_id="new_id", test_device=test_device, ext_client=self.ec)
+        # the server may still be finishing the previous session
+        ConnectSequenceDriver(self.ec, [test_device], "new_id", _CONNECTING_PAYLOAD, retry_connect=True).run(
+            _RESET_MARGIN + _CONNECT_SEQUENCE_TIME
+        )
         timestamp = int(time.time() * 1000)
         # status is published with new session id and forwared to the API
         self.ec.post(status("new_id", "RUNNING", test_device, 1, payload))
-        time.sleep(0.5)
-        s = self.api_client.get_statuses("company_x", "car_a", since=timestamp)
+        s = wait_for_statuses(self.api_client, "company_x", "car_a", lambda s: len(s) >= 1, since=timestamp)
         self.assertEqual(len(s), 1)
 
     def tearDown(self):
-        docker_compose_down()
         _comm_layer.stop()
 
-    def _run_connect_sequence(
-        self, session_id: str, test_device: Device, ext_client: ExternalClientMock
-    ) -> None:
-        ext_client.post(connect_msg(session_id, "company_x", "car_a", [test_device]))
-        payload = {"content": "An arbitrary string ...", "timestamp": 000}
-        ext_client.post(status(session_id, "CONNECTING", test_device, 0, payload))
-        ext_client.post(command_response(session_id, CmdResponseType.OK, 0), sleep=0.5)
+    def _wait_for_timeout(self) -> None:
+        wait_for_server_event(
+            SESSION_TIMEOUT_EVENT, self.server_log, timeout=self.msg_timeout + _RESET_MARGIN
+        )
 
 
 if __name__ == "__main__":  # pragma: no cover